@@ -1,22 +1,22 @@
 from contexts.context import Context
 from contexts.bbs_topic import BBSTopic as BBSTopic
+from contexts.bbs_search import BBSSearch as BBSSearch
 from utils.bbs_db import BBSDB as BBSDB
 from utils.message import Message as Message
-from meshtastic import mesh_pb2
 from datetime import datetime
 from utils.bbs_utils import Topic, Post
+from utils.topic_index import topic_index
 import subprocess
 import time
 
 '''
 List topics from the BBS database
-'''
 
-TOPIC_COL_UUID = 0
-TOPIC_COL_TITLE = 1
-TOPIC_COL_LAST_MODIFIED = 2
+Topics are listed newest first, one page at a time. The pages come ready made from the shared topic index (utils/topic_index.py), so
+each session only keeps track of which page it is on.
+'''
 
-BBS_COMMANDS = "[C]reate [N]ext [P]rev [Q]uit [#]"
+BBS_COMMANDS = "[C]reate [N]ext [P]rev [S]earch [Q]uit [#]"
 
 class BBSMain(Context):
     def __init__(self, session: "UserSession", command: str, description: str):
@@ -26,18 +26,34 @@ class BBSMain(Context):
         self.message.body = ""
         self.bbs_db = BBSDB()
         self.next_func = None       # Next function that should be called when the user replies
-        self.topics = list()
-        self.pages = list()
+        self.page = None            # The TopicPage being shown, or None if there are no topics
         self.page_num = 0
-        self.max_message_size = mesh_pb2.Constants.DATA_PAYLOAD_LEN - len(BBS_COMMANDS) - 10 - 20
+        self.page_count = 0
+        self.topic_count = 0
 
     '''
     Called when context switches to this object
     '''
     def start(self) -> None:
-        self.generate_topics_list()
         self.list_topics()
 
+    '''
+    Remember which page of topics the user was on, and whether they were naming a new topic
+    '''
+    def get_state(self) -> dict:
+        return {"page_num": self.page_num, "creating_topic": self.next_func == self.create_topic,
+                "searching": self.next_func == self.search}
+
+    def restore_state(self, state: dict) -> None:
+        self.page_num = state["page_num"]
+        self.generate_topics_page()
+        if state["creating_topic"]:
+            self.message.footer = None
+            self.next_func = self.create_topic
+        elif state.get("searching"):
+            self.message.footer = None
+            self.next_func = self.search
+
     '''
     Handle user input
     '''
@@ -68,6 +84,10 @@ class BBSMain(Context):
         elif cmd.lower() == "p":
             self.prev_page()
 
+        # User wants to search the BBS
+        elif cmd.lower() == "s":
+            self.request_search_query()
+
         # User wants to choose a topic
         elif cmd.isdigit():
             self.choose_topic(int(cmd))
@@ -86,6 +106,30 @@ class BBSMain(Context):
         self.session.send_message(self.message)
         self.next_func = self.create_topic
 
+    '''
+    Ask user what to search for
+    '''
+    def request_search_query(self) -> None:
+        self.message.body = "Enter words to search for:"
+        self.message.footer = None
+        self.session.send_message(self.message)
+        self.next_func = self.search
+
+    '''
+    Show the search results
+    '''
+    def search(self, packet: dict) -> None:
+        query = self.get_text_input(packet)
+        self.next_func = None
+        self.message.footer = BBS_COMMANDS
+        if not query:
+            self.send_error("Nothing to search for!")
+            return
+
+        search_context = BBSSearch(self.session, "", "Search")
+        search_context.query = query
+        self.session.change_context(search_context)
+
     '''
     Create the topic in the DB
     '''
@@ -104,54 +148,28 @@ class BBSMain(Context):
         self.list_topics()
 
     '''
-    Update a list of topics based on whatever is in the DB
+    Get the current page of topics from the topic index. Each page fits in one packet along with the header and the footer, so listing
+    topics never needs the pager.
     '''
-    def generate_topics_list(self) -> None:
-        topics = self.bbs_db.list_topics()
-        self.topics = list()
+    def generate_topics_page(self) -> None:
+        # Leave room for the widest topic counter there could be
+        widest = "9" * len(str(max(topic_index.get_count(), 1)))
+        frame = self.message.copy()
+        frame.footer = f"{BBS_COMMANDS}\n{self.build_page_counter(widest, widest, widest)}"
+        version, pages = topic_index.get_pages(self.session.packer, self.session.packer.body_budget(frame))
 
-        for i in range(0, len(topics)):
-            index = i + 1
-            uuid = topics[i][TOPIC_COL_UUID]
-            title = topics[i][TOPIC_COL_TITLE]
-            last_modified_unixtime = topics[i][TOPIC_COL_LAST_MODIFIED]
-            last_modified = datetime.fromtimestamp(int(last_modified_unixtime)).strftime("%m-%d-%y %I:%M")
-            topic = Topic(uuid, title, last_modified)
-            
-            self.topics += [topic]
+        self.page_count = len(pages)
+        self.page_num = max(0, min(self.page_num, self.page_count - 1))
+        self.page = pages[self.page_num] if pages else None
+        self.topic_count = pages[-1].first_index + len(pages[-1].topics) if pages else 0
 
     '''
-    Convert the list of topics to a single string for sending to the user
-    '''
-    def generate_topics_pages(self) -> None:
-        self.pages = list()
-
-        text = ""
-        counter = 1
-        for topic in self.topics:
-            topic_string = topic.get_string(counter)
-            if len(text + topic_string) > self.max_message_size:
-                text = text.strip()
-                self.pages += [text]
-                text = ""
-
-            text += f"{topic_string}\n"
-            counter += 1
-
-        if (len(self.topics) > 0):
-            # If the last line ends with newline then we haven't yet accounted for the final page
-            if text[-1] == "\n":
-                text = text.strip()
-                self.pages += [text]
-
-    '''
-    Generate a list of topics, convert to string, and send message to user with the list
+    Fetch the current page of topics and send it to the user
     '''
     def list_topics(self) -> None:
-        self.generate_topics_list()
-        self.generate_topics_pages()
-        if (len(self.pages) > 0):
-            self.message.body = self.pages[self.page_num]
+        self.generate_topics_page()
+        if self.page:
+            self.message.body = self.page.text
         else:
             self.message.body = "<Crickets chirping>"
         page_counter = self.build_page_counter()
@@ -160,19 +178,25 @@ class BBSMain(Context):
         self.next_func = None
 
     '''
-    Generate page counter
+    Generate the counter showing which topics are on the page
     '''
-    def build_page_counter(self) -> None:
-        current_page = self.page_num + 1
-        total_pages = len(self.pages)
-        text = f"Page {current_page}/{total_pages}"
+    def build_page_counter(self, first_topic=None, last_topic=None, total_topics=None) -> str:
+        first_index = self.page.first_index if self.page else 0
+        page_size = len(self.page.topics) if self.page else 0
+        if first_topic == None:
+            first_topic = first_index + min(page_size, 1)       # Topics 0-0/0 if there aren't any
+        if last_topic == None:
+            last_topic = first_index + page_size
+        if total_topics == None:
+            total_topics = self.topic_count
+        text = f"Topics {first_topic}-{last_topic}/{total_topics}"
         return text
 
     '''
     Switch to next page
     '''
     def next_page(self) -> None:
-        if self.page_num < (len(self.pages) - 1):
+        if self.page_num < (self.page_count - 1):
             self.page_num += 1
             self.list_topics()
         else:
@@ -192,12 +216,16 @@ class BBSMain(Context):
     Choose a topic
     '''
     def choose_topic(self, choice: int) -> None:
-        topic_num = choice - 1
-        if topic_num < 0 or topic_num >= len(self.topics):
-            self.send_error("Invalid page number!")
-            return
+        topic_num = choice - 1 - (self.page.first_index if self.page else 0)
+        if self.page and topic_num >= 0 and topic_num < len(self.page.topics):
+            topic = self.page.topics[topic_num]
+        else:
+            # The topic isn't on this page, so look it up by its position
+            topic = topic_index.get_topic(choice - 1)
+            if topic == None:
+                self.send_error("Invalid page number!")
+                return
 
-        topic = self.topics[topic_num]
         topic_context = BBSTopic(self.session, "", f"BBS - {topic.title[0:15]}...")
         topic_context.topic = topic
         self.session.change_context(topic_context)
@@ -37,6 +37,16 @@ class BBSPost(Context):
     def set_topic(self, topic: Topic) -> None:
         self.topic = topic
 
+    '''
+    Remember the topic and the reply written so far
+    '''
+    def get_state(self) -> dict:
+        return {"topic": [self.topic.uuid, self.topic.title, self.topic.last_modified], "post": self.post}
+
+    def restore_state(self, state: dict) -> None:
+        self.topic = Topic(*state["topic"])
+        self.post = state["post"]
+
     '''
     Processes packets from the user
     '''
@@ -0,0 +1,169 @@
+from contexts.context import Context
+from contexts.bbs_topic import BBSTopic as BBSTopic
+from utils.bbs_db import BBSDB as BBSDB
+from utils.bbs_utils import Topic
+
+'''
+Context which shows the results of a search of the BBS
+
+The best matches come first. Each result is one line, either a topic title or a snippet of a post, and the results are split into
+pages which fit in one packet. Choosing a result opens its topic at that post.
+'''
+
+SEARCH_COMMANDS = "[N]ext [P]rev [B]ack [#]"
+SEARCH_RESULTS = 50         # Most results shown for a search
+
+class BBSSearch(Context):
+    def __init__(self, session: "UserSession", command: str, description: str):
+        super().__init__(session, command, description)
+        self.message.header = "Search results"
+        self.message.footer = SEARCH_COMMANDS
+        self.bbs_db = BBSDB()
+        self.query = ""
+        self.results = list()       # (topic_id, title, post seq, text) tuples from BBSDB.search()
+        self.pages = list()         # [index of first result, page text] for each page
+        self.page_num = 0
+
+    '''
+    Called when context switches to this object
+    '''
+    def start(self) -> None:
+        self.run_search()
+        self.show_page()
+
+    '''
+    Remember what the user searched for and which page of results they were on
+    '''
+    def get_state(self) -> dict:
+        return {"query": self.query, "page_num": self.page_num}
+
+    def restore_state(self, state: dict) -> None:
+        self.query = state["query"]
+        self.run_search()
+        self.page_num = max(0, min(state["page_num"], len(self.pages) - 1))
+
+    '''
+    Drop the results once the user leaves the search
+    '''
+    def release(self) -> None:
+        self.results = list()
+        self.pages = list()
+
+    '''
+    Processes packets from the user
+    '''
+    def receive_handler(self, packet: dict) -> None:
+        # Get user input
+        cmd = self.get_text_input(packet)
+        if not cmd:
+            return
+
+        # User wants to go back, so revert context
+        if cmd.lower() == "b":
+            self.session.revert_context()
+            return
+
+        # User wants to see next page of results
+        elif cmd.lower() == "n":
+            self.next_page()
+
+        # User wants to see previous page of results
+        elif cmd.lower() == "p":
+            self.prev_page()
+
+        # User wants to open a result
+        elif cmd.isdigit():
+            self.choose_result(int(cmd))
+
+        else:
+            self.send_error("Invalid option!")
+
+    '''
+    Search the BBS and split the results into pages
+    '''
+    def run_search(self) -> None:
+        self.results = self.bbs_db.search(self.query, SEARCH_RESULTS)
+        lines = list()
+        for index, (topic_id, title, seq, text) in enumerate(self.results):
+            if seq == None:
+                lines.append(f"[{index + 1}] {title}")
+            else:
+                lines.append(f"[{index + 1}] {title}: {' '.join(text.split())}")
+
+        # Leave room for the widest result counter there could be
+        widest = "9" * len(str(max(len(lines), 1)))
+        frame = self.message.copy()
+        frame.footer = f"{SEARCH_COMMANDS}\n{self.build_result_counter(widest, widest, widest)}"
+        budget = self.session.packer.body_budget(frame)
+
+        self.pages = list()
+        start = 0
+        while start < len(lines):
+            page = self.session.packer.fill_page(lines, budget, start)
+            self.pages.append([start, "\n".join(page)])
+            start += len(page)
+        self.page_num = 0
+
+    '''
+    Send the current page of results
+    '''
+    def show_page(self) -> None:
+        if self.pages:
+            self.message.body = self.pages[self.page_num][1]
+        else:
+            self.message.body = f"Nothing found for {self.query}"
+        self.message.footer = f"{SEARCH_COMMANDS}\n{self.build_result_counter()}"
+        self.session.send_message(self.message)
+
+    '''
+    Generate the counter showing which results are on the page
+    '''
+    def build_result_counter(self, first_result=None, last_result=None, total_results=None) -> str:
+        if first_result == None:
+            first_result = self.pages[self.page_num][0] + 1 if self.pages else 0
+        if last_result == None:
+            last_result = self.pages[self.page_num + 1][0] if self.page_num + 1 < len(self.pages) else len(self.results)
+        if total_results == None:
+            total_results = len(self.results)
+        text = f"Results {first_result}-{last_result}/{total_results}"
+        return text
+
+    '''
+    Switch to next page
+    '''
+    def next_page(self) -> None:
+        if self.page_num < (len(self.pages) - 1):
+            self.page_num += 1
+            self.show_page()
+        else:
+            self.send_error("No pages left!")
+
+    '''
+    Switch to previous page
+    '''
+    def prev_page(self) -> None:
+        if self.page_num > 0:
+            self.page_num -= 1
+            self.show_page()
+        else:
+            self.send_error("No pages left!")
+
+    '''
+    Open the topic of a result, at the post which matched
+    '''
+    def choose_result(self, choice: int) -> None:
+        if choice <= 0 or choice > len(self.results):
+            self.send_error("Invalid result number!")
+            return
+
+        topic_id, title, seq, text = self.results[choice - 1]
+        row = self.bbs_db.get_topic(topic_id)
+        if row == None:
+            self.send_error("Topic not found!")
+            return
+
+        topic = Topic.from_row(row)
+        topic_context = BBSTopic(self.session, "", f"BBS - {topic.title[0:15]}...")
+        topic_context.topic = topic
+        topic_context.start_seq = seq
+        self.session.change_context(topic_context)
@@ -1,10 +1,14 @@
 from contexts.context import Context
 from contexts.bbs_post import BBSPost as BBSPost
-from utils.bbs_utils import Topic, Post
+from utils.bbs_utils import Topic, Post, PostHeader
 from utils.bbs_db import BBSDB as BBSDB
 
 '''
 Context which handles viewing posts inside a BBS topic
+
+Posts are numbered newest first from the newest post there was when the topic was opened, so replies posted while someone is reading
+don't move the posts they are reading. Only a small window of post headers around the current post is kept, and only the content of
+the post being shown is loaded, so reading a topic takes the same memory however many posts it has.
 '''
 
 TOPIC_COMMANDS = "[M]ore [R]eply [N]ext [P]rev [B]ack [#]"
@@ -18,17 +22,25 @@ class BBSTopic(Context):
         self.bbs_db = BBSDB()
         self.post_num = 0
         self.num_posts = 0
-        self.posts = list()
+        self.latest_seq = 0         # seq of the newest post when the topic was opened. Post number n (from 0) is seq latest_seq - n.
+        self.window = list()        # PostHeaders around the current post, newest first
+        self.post = None            # The post being shown, with its content
+        self.start_seq = None       # seq of the post to open the topic at, or None for the newest post
 
     '''
-    Called when context switches to this object
+    Called when context switches to this object. Posts are numbered when the topic is first opened, and keep their numbers when the
+    context is started again (after leaving the pager, for example).
     '''
     def start(self) -> None:
-        self.num_posts = self.bbs_db.get_post_count(self.topic.uuid)
+        if self.latest_seq == 0 or self.start_seq != None:
+            self.latest_seq = self.bbs_db.get_latest_seq(self.topic.uuid)
+            self.num_posts = self.latest_seq
+        if self.start_seq != None:
+            self.post_num = self.latest_seq - self.start_seq
+            self.start_seq = None
         if self.num_posts != 0:
-            self.posts = self.bbs_db.get_all_posts(self.topic.uuid)
-            current_post = self.posts[self.post_num]
-            self.send_message(current_post.get_string(), one_page=True)
+            self.post_num = max(0, min(self.post_num, self.num_posts - 1))
+            self.show_post(one_page=True)
 
         # There are no posts, so we'll just make a blank one
         else:
@@ -37,6 +49,26 @@ class BBSTopic(Context):
     def set_topic(self, topic: Topic) -> None:
         self.topic = topic
 
+    '''
+    Remember the topic and which post the user was reading
+    '''
+    def get_state(self) -> dict:
+        return {"topic": [self.topic.uuid, self.topic.title, self.topic.last_modified], "post_num": self.post_num,
+                "latest_seq": self.latest_seq}
+
+    def restore_state(self, state: dict) -> None:
+        self.topic = Topic(*state["topic"])
+        self.latest_seq = state.get("latest_seq") or self.bbs_db.get_latest_seq(self.topic.uuid)
+        self.num_posts = self.latest_seq
+        self.post_num = max(0, min(state["post_num"], self.num_posts - 1))
+
+    '''
+    Drop the cached posts once the user leaves the topic
+    '''
+    def release(self) -> None:
+        self.window = list()
+        self.post = None
+
     '''
     Processes packets from the user
     '''
@@ -91,8 +123,7 @@ class BBSTopic(Context):
             return
 
         self.post_num += 1
-        post = self.posts[self.post_num]
-        self.send_message(post.get_string(), one_page=True)
+        self.show_post(one_page=True)
 
     '''
     User wants to see the previous post
@@ -103,15 +134,14 @@ class BBSTopic(Context):
             return
 
         self.post_num -= 1
-        post = self.posts[self.post_num]
-        self.send_message(post.get_string(), one_page=True)
+        self.show_post(one_page=True)
 
     '''
     Build the post counter string
     '''
     def build_post_counter(self) -> None:
         post_num = self.post_num + 1
-        total_posts = len(self.posts)
+        total_posts = self.num_posts
         text = f"Post {post_num}/{total_posts}"
         return text
 
@@ -131,8 +161,45 @@ class BBSTopic(Context):
     User wants to see the entirety of a long message
     '''
     def more(self) -> None:
-        post = self.posts[self.post_num]
-        self.send_message(post.get_string(), one_page=False)
+        self.show_post(one_page=False)
+
+    '''
+    Show the current post, loading it if it isn't the one already loaded
+    '''
+    def show_post(self, one_page: bool) -> None:
+        post = self.load_current_post()
+        if post == None:
+            self.send_error("Unable to load post!")
+            return
+        self.send_message(post.get_string(), one_page=one_page)
+
+    '''
+    Returns the current post with its content, or None if it can't be found. Fetches a new window of headers if the current post
+    isn't in the window.
+    '''
+    def load_current_post(self) -> Post:
+        seq = self.latest_seq - self.post_num
+        header = self.find_header(seq)
+        if header == None:
+            self.window = self.bbs_db.get_post_window(self.topic.uuid, seq)
+            header = self.find_header(seq)
+            if header == None:
+                return None
+
+        if self.post == None or self.post.id != header.id:
+            self.post = self.bbs_db.load_post(self.topic.uuid, header)
+        return self.post
+
+    '''
+    Returns the header in the window with the given seq, or None
+    '''
+    def find_header(self, seq: int) -> PostHeader:
+        if not self.window:
+            return None
+        index = self.window[0].seq - seq        # The window is newest first, with no gaps
+        if index < 0 or index >= len(self.window) or self.window[index].seq != seq:
+            return None
+        return self.window[index]
 
     '''
     User wants to view specific post
@@ -143,5 +210,4 @@ class BBSTopic(Context):
             return
 
         self.post_num = post_num - 1
-        post = self.posts[self.post_num]
-        self.send_message(post.get_string(), one_page=True)
+        self.show_post(one_page=True)
@@ -0,0 +1,28 @@
+from contexts.context import Context
+
+'''
+Turns burst mode on or off for the logged in user. In burst mode, long messages are sent all at once, one page after another, instead
+of one page each time the user asks for the next. The user can then ask for any pages that didn't arrive. See MessagePager.
+'''
+
+class CmdBurst(Context):
+    def __init__(self, session: "UserSession", command: str, description: str):
+        super().__init__(session, command, description)
+        self.message.header = "Burst mode"
+
+    '''
+    Invoked when session context switches to this object. Toggles the setting and goes back to the menu.
+    '''
+    def start(self) -> None:
+        if not self.session.authenticated:
+            self.send_error("You must be logged in to change settings.")
+            self.session.revert_context()
+            return
+
+        self.session.set_burst(not self.session.burst)
+        if self.session.burst:
+            self.message.body = "Burst mode is on. Long messages will be sent all at once. Reply with page numbers to get missing pages again."
+        else:
+            self.message.body = "Burst mode is off."
+        self.session.send_message(self.message)
+        self.session.revert_context()
@@ -35,6 +35,12 @@ class CmdGuestbookRead(Context):
         elif self.state == STATE_READING:
             self.session.revert_context()
 
+    def get_state(self) -> dict:
+        return {"state": self.state}
+
+    def restore_state(self, state: dict) -> None:
+        self.state = state["state"]
+
     '''
     Invoked when a packet is received from the user.
     '''
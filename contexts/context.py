@@ -48,4 +48,42 @@ class Context():
     def send_error(self, error: str) -> None:
         error_message = Message(header="Error!")
         error_message.body = error
-        self.session.send_message(error_message)
\ No newline at end of file
+        self.session.send_message(error_message)
+
+    '''
+    get_key() identifies contexts which can be reused. If the session changes to a context with the same key as one already on its
+    context stack, the session goes back to that one instead of adding another copy (see UserSession.change_context()). By default
+    contexts are never reused.
+    '''
+    def get_key(self) -> tuple:
+        return None
+
+    '''
+    release() is called when the context is removed from the session's context stack and will never be used again. Override it to
+    free anything large the context is holding onto, or to cancel its timers.
+    '''
+    def release(self) -> None:
+        return
+
+    '''
+    get_state() returns whatever this context needs to pick up where it left off when a hibernated session is resumed, as a dict which
+    can be stored as JSON. By default a context has no state of its own. Return None if the context can't be resumed at all (live
+    games, etc). The user will then be returned to the context before it.
+    '''
+    def get_state(self) -> dict:
+        return {}
+
+    '''
+    restore_state() is called with the dict returned by get_state() when a session is resumed. It must not send anything to the user.
+    '''
+    def restore_state(self, state: dict) -> None:
+        return
+
+    '''
+    from_state() creates a context for a resumed session. Override it if the context's constructor takes different arguments.
+    '''
+    @classmethod
+    def from_state(cls, session: "UserSession", command: str, description: str, state: dict) -> "Context":
+        context = cls(session, command, description)
+        context.restore_state(state)
+        return context
\ No newline at end of file
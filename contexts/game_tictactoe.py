@@ -39,6 +39,17 @@ class GameTicTacToe(Context):
 
         return board_string
 
+    '''
+    Remember the board so the game can be resumed
+    '''
+    def get_state(self) -> dict:
+        return {"board": self.board, "free_spaces": self.free_spaces, "state": self.state}
+
+    def restore_state(self, state: dict) -> None:
+        self.board = state["board"]
+        self.free_spaces = state["free_spaces"]
+        self.state = state["state"]
+
     '''
     Invoked when the context changes to this game object
     '''
@@ -186,6 +186,12 @@ class GameTicTacToeMultiPlayer(Context):
             username = self.game.session1.username
             self.send_player_message(self.game.session2, f"{username}'s turn!")
 
+    '''
+    A game against another player can't be resumed
+    '''
+    def get_state(self) -> dict:
+        return None
+
     def receive_handler(self, packet: dict) -> None: 
         waiting_session = None
         if self.game.state == STATE_PLAYER_1_TURN:
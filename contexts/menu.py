@@ -1,7 +1,6 @@
 from contexts.context import Context
 from utils.message import Message
-from utils.config import config
-import importlib
+from utils.menu_graph import menu_graph
 
 '''
 This Menu context builds a menu based on a [[menus]] entry in config.toml. It handles user input when selecting a menu option and then
@@ -17,54 +16,61 @@ class Menu(Context):
         self.command = menu_config["command"]
         self.message = Message()
         self.message.header = self.name
-        self._menu_option_list = list()     # Holds all the options for this menu
-        
+        self.menu = None            # This menu's CompiledMenu. See utils/menu_graph.py.
+
     '''
     start() is invoked when the session context switches to this menu
     '''
     def start(self) -> None:
-        self._menu_option_list = list()
+        self.load_options()
+        self.message.body = self.get_menu_text()
+        self.session.send_message(self.message)
 
-        self.name = self.menu_config["name"]
-        self.description = self.menu_config["description"]
-        self.command = self.menu_config["command"]
-        self.message.header = self.name
+    '''
+    load_options() looks up this menu in the compiled menu graph. The options themselves are only created when the user selects one.
+    '''
+    def load_options(self) -> None:
+        if self.menu:
+            return
+        self.menu = menu_graph.get(self.name)
+        if not self.menu:
+            raise ValueError(f"Menu {self.name} is not in config.toml")
 
-        # Loop through all menu options defined in config.toml for this menu
-        for option in self.menu_config["options"]:
-            # If a special role is defined for this option, ensure the user has access to the role before adding it to their menu.
-            if "role" in option:
-                if option["role"].lower() != self.session.role.lower():
-                    continue
+    '''
+    Going to a menu that is already on the context stack goes back to it
+    '''
+    def get_key(self) -> tuple:
+        return Menu.key_for(self.name)
 
-            # If the option is a command, then load that Context object file based on the module and class name specified in the config
-            if option["type"] == "command":
-                option_module = importlib.import_module(f"contexts.{option['module']}")
-                option_class = getattr(option_module, option['class'])
-                bbs_option = option_class(self.session, option["command"], option["description"])
-                self._menu_option_list.append(bbs_option)
+    '''
+    Returns the key of the menu with the given name, so callers can look for it on the context stack before building it
+    '''
+    @staticmethod
+    def key_for(name: str) -> tuple:
+        return ("menu", name)
 
-            # If the option is a menu, then always load the Menu context object but initialize it according to the options in config.toml
-            elif option["type"] == "menu":
-                for menu in config["menus"]:
-                    if menu["name"] == option["name"]:
-                        new_menu = Menu(self.session, menu)
-                        self._menu_option_list.append(new_menu)
+    '''
+    A menu is resumed by name, so it picks up any changes made to config.toml in the meantime.
+    '''
+    def get_state(self) -> dict:
+        return {"name": self.name}
 
-        self.message.body = self.get_menu_text()
-        self.session.send_message(self.message)
+    @classmethod
+    def from_state(cls, session: "UserSession", command: str, description: str, state: dict) -> "Menu":
+        compiled_menu = menu_graph.get(state["name"])
+        if not compiled_menu:
+            raise ValueError(f"Menu {state['name']} is no longer in config.toml")
+        menu = cls(session, compiled_menu.config)
+        menu.load_options()
+        return menu
 
     '''
     get_menu_text() will return this object's menu as a text object. Generally, so you can send it to the user in a message.
+    The text is rendered once per role and cached in the menu graph.
     '''
     def get_menu_text(self) -> str:
-        menu_text = ""
-        for option in self._menu_option_list:
-            menu_text += option.description
-            if option != self._menu_option_list[-1]:
-                menu_text += "\n"
-            
-        return menu_text
+        self.load_options()
+        return self.menu.get_text(self.session.role)
 
     '''
     Invoked every time a packet comes in for this context.
@@ -74,9 +80,13 @@ class Menu(Context):
         if not command:
             return
 
-        # Loop through all options in the menu list and see if the user chose one of them.
-        option = next((item for item in self._menu_option_list if item.command.lower() == command.lower()), None)
+        # See if the user chose one of the options they can see, and only then create its context
+        self.load_options()
+        option = self.menu.find_option(self.session.role, command)
         if option:
-            self.session.change_context(option)
+            # A submenu which is already on the stack is gone back to, without building it again
+            key = option.get_key()
+            if key == None or not self.session.return_to_context(key):
+                self.session.change_context(option.create(self.session))
         else:
             self.send_error("Invalid option!")
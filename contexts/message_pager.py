@@ -1,23 +1,34 @@
 from contexts.context import Context
+from utils.metrics import metrics
 from meshtastic import mesh_pb2
-import copy
 
 '''
 If a message is too long to fit in a single Meshtastic message packet, this context will handle pagination. It splits the packet
 into multiple pages and allows the user to page through them or jump to a specific page, or cancel entirely.
+
+Pages are packed by utils/packet_packer.py so each one fills a packet, measured in bytes, and breaks between words. The number of
+packets this saves compared with the old fixed-size splitter is counted in the pager.packets_saved metric.
+
+If the user has burst mode turned on (see CmdBurst), every page is sent straight away instead of one page each time the user asks for
+the next. The radio's send scheduler paces the pages like any other packets. Each page is numbered, so the user can reply with the
+numbers of any pages that didn't arrive (for example "3 5") to get just those pages again. This saves a round trip over the mesh for
+every page.
 '''
 
+FOOTER_TEXT = "[N]ext [C]ancel Page[#] "
+BURST_FOOTER_TEXT = "[C]ancel Resend[#] "
 SPACE_FOR_PAGE_COUNTER = 9
+LEGACY_MAX_MESSAGE_SIZE = mesh_pb2.Constants.DATA_PAYLOAD_LEN - 10     # Page size of the old splitter, for the pager.packets_saved metric
 
 class MessagePager(Context):
     def __init__(self, session: "UserSession", message: "Message"):
         super().__init__(session, None, None)
-        self.message = copy.deepcopy(message)
+        self.message = message.copy()
         self.message_text = None
-        self.footer_text = "[N]ext [C]ancel Page[#] "
+        self.burst = session.burst           # Send all pages at once
+        self.footer_text = BURST_FOOTER_TEXT if self.burst else FOOTER_TEXT
 
-        # Not sure why, but I have to make packets less than the DATA_PAYLOAD_LEN in order for them to send properly. So I subtract 10.
-        self.max_message_size = mesh_pb2.Constants.DATA_PAYLOAD_LEN - 10
+        self.packer = session.packer         # Sized for the session's interface
         self.messages = []
         self.total_pages = 0
         self.current_page = 0
@@ -27,32 +38,85 @@ class MessagePager(Context):
     Called when session context switches to this context object
     '''
     def start(self) -> None:
-        # Check if message is small enough to send without paging it
-        if self.message.get_message_size() <= self.max_message_size:
-            self.session.send_message(self.message)
-            self.session.revert_context()
+        # Check if message is small enough to send without paging it. The context which sent it is still in the middle of handling
+        # the user's input, so just step out of its way rather than restarting it.
+        if self.packer.fits_message(self.message):
+            self.session.send_text_part(self.message.get_text())
+            self.session.revert_context(restart=False)
             return
 
         # Otherwise, process the message
         self.process_message()
 
+    '''
+    The pager can't be resumed. The user goes back to the context which sent the long message.
+    '''
+    def get_state(self) -> dict:
+        return None
+
+    '''
+    Drop the pages once the user leaves the pager
+    '''
+    def release(self) -> None:
+        self.messages = []
+        self.message_text = None
+
     '''
     Convert a long text message to a list of "pages". A "page" is just a string with part of the overall message.
     '''
     def process_message(self) -> None:
         # Split long message into multiple message "pages"
-        message_text = self.message.get_text()
-        footer_size = len(self.footer_text) + SPACE_FOR_PAGE_COUNTER
-        page_size = self.max_message_size - footer_size - len(self.message.border_bottom)
-
-        self.messages = [message_text [i:i+(page_size)] for i in range(0, len(message_text), page_size)]
-        self.total_pages = len(self.messages)
-        self.current_page = 0
+        message_text = self.message.get_text().rstrip("\n")
         self.message.header = None
         self.message.border_top = None
+        self.messages = self.pack_pages(message_text)
+        self.total_pages = len(self.messages)
+        self.current_page = 0
+
+        legacy_page_size = LEGACY_MAX_MESSAGE_SIZE - len(FOOTER_TEXT) - SPACE_FOR_PAGE_COUNTER - len(self.message.border_bottom or "")
+        legacy_pages = -(-len(message_text) // legacy_page_size)
+        metrics.increment("pager.pages", self.total_pages)
+        metrics.increment("pager.packets_saved", legacy_pages - self.total_pages)
+
+        if self.burst:
+            self.send_all_pages()
+            return
+
         self.message.body = self.get_current_page()
         self.session.send_message(self.message)
 
+    '''
+    Burst mode: send every page, in order. The user's requests for each next page are saved, which is counted in the
+    pager.round_trips_saved metric.
+    '''
+    def send_all_pages(self) -> None:
+        for page_num in range(0, self.total_pages):
+            self.send_page(page_num)
+        metrics.increment("pager.bursts")
+        metrics.increment("pager.round_trips_saved", self.total_pages - 1)
+
+    '''
+    Send one page, numbered with its place in the message
+    '''
+    def send_page(self, page_num: int) -> None:
+        self.current_page = page_num
+        self.message.body = self.get_current_page()
+        self.session.send_message(self.message)
+
+    '''
+    Pack the text into pages which fit in a packet along with the bottom border and the footer. The page counter gets wider as the
+    number of pages grows, so the text is packed again if the count needs more digits than was allowed for.
+    '''
+    def pack_pages(self, text: str) -> list:
+        digits = 1
+        while True:
+            self.message.body = None
+            self.message.footer = self.footer_text + f" {'9' * digits}/{'9' * digits}"
+            pages = self.packer.pack(text, self.packer.body_budget(self.message))
+            if len(str(len(pages))) <= digits:
+                return pages
+            digits = len(str(len(pages)))
+
     '''
     Returns the current page from the list of pages as a string
     '''
@@ -90,6 +154,10 @@ class MessagePager(Context):
         if not command:
             return
 
+        if self.burst:
+            self.burst_receive_handler(command)
+            return
+
         # If the user is not viewing the last page...
         if self.current_page < self.total_pages:
             # If the user wants the [N]ext page
@@ -120,4 +188,23 @@ class MessagePager(Context):
             # User entered something that isn't a valid command
             else:
                 self.send_error("Invalid option!")
-        return
\ No newline at end of file
+        return
+
+    '''
+    Handles user input in burst mode. All pages have already been sent, so the user can only ask for missing pages again, or cancel.
+    '''
+    def burst_receive_handler(self, command: str) -> None:
+        # If the user wants to [C]ancel
+        if command.lower() == "c":
+            self.session.revert_context()
+            return
+
+        # The user can ask for several pages at once, separated by spaces or commas
+        page_nums = command.replace(",", " ").split()
+        if not page_nums or not all(page_num.isdigit() and 0 < int(page_num) <= self.total_pages for page_num in page_nums):
+            self.send_error("Invalid page number.")
+            return
+
+        for page_num in page_nums:
+            self.send_page(int(page_num) - 1)
+        metrics.increment("pager.pages_resent", len(page_nums))
@@ -36,6 +36,16 @@ class UserLogin(Context):
             self.session.send_message(self.message)
             return
 
+    '''
+    Remember how far along the user is
+    '''
+    def get_state(self) -> dict:
+        return {"state": self.state, "username": self.username}
+
+    def restore_state(self, state: dict) -> None:
+        self.state = state["state"]
+        self.username = state["username"]
+
     '''
     Called whenever a packet comes into this context
     '''
@@ -60,8 +70,9 @@ class UserLogin(Context):
                 self.session.set_authenticated(self.username)
 
                 # Change the user's context to the second menu context so they can access the main menu now that they logged in.
-                bbs_menu_context = Menu(self.session, config["menus"][1])
-                self.session.change_context(bbs_menu_context)
+                menu_config = config["menus"][1]
+                if not self.session.return_to_context(Menu.key_for(menu_config["name"])):
+                    self.session.change_context(Menu(self.session, menu_config))
                 return
 
             # User failed to authenticate
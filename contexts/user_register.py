@@ -32,6 +32,16 @@ class UserRegister(Context):
             self.message.body = "Please submit desired username."
             self.session.send_message(self.message)
 
+    '''
+    Remember how far along the user is
+    '''
+    def get_state(self) -> dict:
+        return {"state": self.state, "username": self.username}
+
+    def restore_state(self, state: dict) -> None:
+        self.state = state["state"]
+        self.username = state["username"]
+
     '''
     Handle incoming packets
     '''
@@ -2,12 +2,19 @@ from utils.log import logger
 from utils.session_db import session_db
 from utils.config import config
 from utils.user_session import UserSession
+from utils.dispatcher import dispatcher
+from utils.packet_dedupe import duplicate_filter
+from utils.packet_packer import get_packer, PAYLOAD_LEN
 
 '''
 This acts as a base class for other communication interfaces. Current build-in comm interfaces are functional for Meshtastic
 packets via connecting to a Meshtastic device over TCP, and a simple TCP socket server interface which is helpful for debugging
 and testing new features. Other interfaces can be build in this 'interfaces' subdirectory, though code would need to be updated to
 instantiate the new interface.
+
+Each interface advertises how much text it can send in one message (max_payload, in bytes, or None for no limit) and what else it
+can do (capabilities). Sessions size their pages to their interface's max_payload, so clients of an interface with no limit get
+whole documents in one message instead of paging through them.
 '''
 
 ACTIVATE_KEYWORD = config["main"]["activate_keyword"]
@@ -16,10 +23,28 @@ AUTHORIZED_PORTNUMS = [
     "COMM_INTERFACE_MESHTASTIC_TCP"     # Custom PORTNUM created in the CommInterfaceTCP object.
     ]
 
+CAPABILITY_ACKS = "acks"                # Messages are acknowledged by the receiver and retransmitted if lost
+CAPABILITY_BROADCAST = "broadcast"      # Can send a message to everyone on a channel
+
 class CommInterface:
+    max_payload = PAYLOAD_LEN           # Most bytes of text that can be sent in one message, or None if there is no limit
+    capabilities = frozenset()          # CAPABILITY_* values this interface supports
+
     def __init__(self) -> None:
         pass
 
+    '''
+    Returns True if this interface supports a CAPABILITY_* value
+    '''
+    def has_capability(self, capability: str) -> bool:
+        return capability in self.capabilities
+
+    '''
+    Returns the PacketPacker which fits text into this interface's messages
+    '''
+    def get_packer(self) -> "PacketPacker":
+        return get_packer(self.max_payload)
+
     '''
     send_text() will send a text message to a user via this interface. Must be implemented by the child class.
     '''
@@ -27,39 +52,53 @@ class CommInterface:
         pass
 
     '''
-    on_receive() is called when a packet arrives on this interface.
-    This function must identify what session the packet is destined for, and then invoke that session's receive_message() handler.
-    Alternatively, if the packet does not belong to a session, it must be able to create a new session as needed.
+    on_receive() is called when a packet arrives on this interface. It may be called from any thread (Meshtastic's pubsub thread,
+    a TCP client thread, etc), so it doesn't process the packet itself. Packets are queued on the dispatcher in the sending user's
+    mailbox, and handle_packet() is run from a dispatcher worker thread. Packets from one user are always handled in order.
     '''
     def on_receive(self, packet: dict, interface) -> None:
         # Only process messages from Meshtastic or from custom interfaces.
         if "decoded" in packet and packet["decoded"]["portnum"] in AUTHORIZED_PORTNUMS:
-            logger.debug("Incoming packet")
             if "from" in packet:
-                user_id = packet["from"]
-
-                # Does user have a session currently?
-                if session_db.check_session(user_id):
-                    logger.debug("User has session")
-
-                    # If the interface is None, it's because the connection is not from the Mesh but from TCP or something else
-                    if interface != None:
-                        # Ensure the incoming packet is addressed to us. If not, just return
-                        bbs_node_id = interface.getMyNodeInfo()["num"]
-                        if packet["to"] != bbs_node_id:
-                            return
-
-                    if "text" in packet["decoded"]:
-                        session = session_db.get_session(user_id)
-                        if session:
-                            session.receive_message(packet)
-                        else:
-                            logger.error("User had a session but suddenly doesn't...")
-
-                # User doesn't have a session, so create a new one
-                else:
-                    if "text" in packet["decoded"] and packet["decoded"]["text"].lower() == ACTIVATE_KEYWORD:
-                        session = UserSession(user_id, self, packet)
-                        session_db.add_session(user_id, session)
-                        logger.info(f"User {user_id} connected to BBS!")
+                # Drop copies of packets we have already handled (rebroadcasts, retries, multiple radios hearing the same packet)
+                if duplicate_filter.is_duplicate(packet):
+                    logger.debug(f"Dropping duplicate packet {packet['id']} from {packet['from']}")
+                    return
+                dispatcher.submit(packet["from"], self.handle_packet, packet, interface)
 
+    '''
+    handle_packet() must identify what session the packet is destined for, and then invoke that session's receive_message() handler.
+    Alternatively, if the packet does not belong to a session, it must be able to create a new session as needed.
+    '''
+    def handle_packet(self, packet: dict, interface) -> None:
+        logger.debug("Incoming packet")
+        user_id = packet["from"]
+
+        # Find the user's session. A hibernated session is resumed on this interface. If the user doesn't have one, a new session is
+        # created if they sent the activate keyword. This is atomic, so two packets from a new user can't create two sessions.
+        session, created = session_db.get_or_create(user_id, self, lambda: self.create_session(user_id, packet))
+        if created:
+            logger.info(f"User {user_id} connected to BBS!")
+            return
+        if not session:
+            return
+
+        logger.debug("User has session")
+
+        # If the interface is None, it's because the connection is not from the Mesh but from TCP or something else
+        if interface != None:
+            # Ensure the incoming packet is addressed to us. If not, just return
+            bbs_node_id = interface.getMyNodeInfo()["num"]
+            if packet["to"] != bbs_node_id:
+                return
+
+        if "text" in packet["decoded"]:
+            session.receive_message(packet)
+
+    '''
+    create_session() creates a new session for a user who doesn't have one, if they sent the activate keyword. Otherwise returns None.
+    '''
+    def create_session(self, user_id: int, packet: dict) -> UserSession:
+        if "text" in packet["decoded"] and packet["decoded"]["text"].lower() == ACTIVATE_KEYWORD:
+            return UserSession(user_id, self, packet)
+        return None
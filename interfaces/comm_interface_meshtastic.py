@@ -0,0 +1,116 @@
+from interfaces.comm_interface import CommInterface, CAPABILITY_ACKS, CAPABILITY_BROADCAST
+from utils.send_scheduler import SendScheduler
+from utils.delivery_tracker import DeliveryTracker
+from utils.link_supervisor import LinkSupervisor
+from utils.log import logger
+from interfaces.interface_registry import interface_registry
+import functools
+
+'''
+Base class for interfaces which talk to a Meshtastic radio. Outbound text is not handed to the radio directly. It goes through a
+SendScheduler which paces packets according to the radio's airtime and queues them fairly per destination. Child classes implement
+send_text_now() and send_broadcast_now() to actually hand a packet to the radio.
+
+Replies to users are tracked by a DeliveryTracker, which listens for the radio's ack/nak and retransmits replies that didn't arrive.
+send_text_now() must pass self.tracker.onAckNak as the onResponse handler and return the packet returned by sendText().
+
+Child classes must register with the interface registry once connected. The registry routes packets from this radio to on_receive(),
+on_connection() and on_disconnect().
+
+The radio connection is owned by a LinkSupervisor. Child classes implement connect() to open self.interface, and the supervisor calls
+reconnect() whenever the link goes down. Outbound packets are buffered by the scheduler until the link is back up.
+'''
+
+BROADCAST_DESTINATION = "^all"
+
+class CommInterfaceMeshtastic(CommInterface):
+    capabilities = frozenset((CAPABILITY_ACKS, CAPABILITY_BROADCAST))
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.scheduler = SendScheduler(name)
+        self.tracker = DeliveryTracker(name, self.retransmit)
+        self.supervisor = LinkSupervisor(name, self.reconnect, self.scheduler)
+        self.interface = None
+
+    '''
+    Open the connection to the radio and store it in self.interface. Must be implemented by the child class.
+    '''
+    def connect(self) -> None:
+        pass
+
+    '''
+    Close the old radio connection and open a new one. Called by the link supervisor.
+    '''
+    def reconnect(self) -> None:
+        try:
+            self.interface.close()
+        except Exception as e:
+            logger.debug(f"Error closing old connection to {self.name}: {str(e)}")
+        self.connect()
+
+    '''
+    Called when we (re)connect to the radio
+    '''
+    def on_connection(self, interface) -> None:
+        logger.info(f"Connected to radio {self.name}.")
+
+    '''
+    Called when the Meshtastic library loses connection to our radio
+    '''
+    def on_disconnect(self, interface) -> None:
+        if interface is self.interface:
+            self.supervisor.report_down("connection lost")
+
+    '''
+    Queue a text message to a user. If several radios can reach the user, the interface registry picks the healthiest one.
+    The message is sent by that radio's scheduler thread when airtime allows.
+    '''
+    def send_text(self, text: str, user_id: str) -> None:
+        radio = interface_registry.select_interface(user_id, self)
+        radio.scheduler.enqueue(user_id, text, radio.send_tracked)
+
+    '''
+    Hand a text message to the radio and start tracking its delivery. Called by the send scheduler.
+    '''
+    def send_tracked(self, text: str, user_id: str, attempt: int=0, first_sent: float=None) -> None:
+        packet = self.send_text_now(text, user_id)
+        if packet:
+            self.tracker.track(packet.id, user_id, text, attempt, first_sent)
+
+    '''
+    Queue a retransmit of a reply which wasn't acknowledged. Called by the delivery tracker.
+    '''
+    def retransmit(self, text: str, user_id: str, attempt: int, first_sent: float) -> None:
+        radio = interface_registry.select_interface(user_id, self)
+        send_func = functools.partial(radio.send_tracked, attempt=attempt, first_sent=first_sent)
+        radio.scheduler.enqueue(user_id, text, send_func)
+
+    '''
+    Queue a broadcast message on the configured channel index.
+    '''
+    def send_broadcast(self, text: str) -> None:
+        self.scheduler.enqueue(BROADCAST_DESTINATION, text, self.send_broadcast_now)
+
+    '''
+    Hand a text message to the radio right away and return the sent packet. Must be implemented by the child class.
+    '''
+    def send_text_now(self, text: str, user_id: str) -> "MeshPacket":
+        pass
+
+    '''
+    Hand a broadcast message to the radio right away. Must be implemented by the child class.
+    '''
+    def send_broadcast_now(self, text: str, destination: str) -> None:
+        pass
+
+    '''
+    Stop the supervisor and scheduler and close the radio connection.
+    '''
+    def close(self) -> None:
+        interface_registry.unregister(self)
+        self.supervisor.close()
+        self.scheduler.close()
+        self.tracker.close()
+        if self.interface:
+            self.interface.close()
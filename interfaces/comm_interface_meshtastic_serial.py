@@ -1,45 +1,46 @@
-from utils.log import logger
-from interfaces.comm_interface import CommInterface
-from pubsub import pub
+from interfaces.comm_interface_meshtastic import CommInterfaceMeshtastic
+from interfaces.interface_registry import interface_registry
 import meshtastic.serial_interface
-import time
 
 '''
 This interface allows the BBS to communicate over a Meshtastic radio device by using a serial port (USB connection) to connect to the device.
 '''
 
-class CommInterfaceMeshtasticSerial(CommInterface):
+class CommInterfaceMeshtasticSerial(CommInterfaceMeshtastic):
     def __init__(self, device: str, channel_index: int) -> None:
+        super().__init__(f"mesh_serial_{device}")
         self.channel_index = channel_index
         self.device = device
-        self.interface = meshtastic.serial_interface.SerialInterface(devPath=self.device)
 
-        # Meshtastic uses pubsub to receive messages from the radios asynchronously
-        pub.subscribe(self.on_receive, "meshtastic.receive")
-        pub.subscribe(self.on_connection, "meshtastic.connection.established")
+        # Packets from this radio are routed to us by the interface registry. Register before connecting, so the registry is ready
+        # for the radio's connection.established event.
+        interface_registry.register(self)
+        self.connect()
 
     '''
-    Called when we (re)connect to the radio
+    Open the serial connection to the radio
     '''
-    def on_connection(self, interface: CommInterface, topic=pub.AUTO_TOPIC) -> None: 
-        # defaults to broadcast, specify a destination ID if you wish
-        logger.info("Connected to radio.")
-        #interface.sendText("BBS Online!")
+    def connect(self) -> None:
+        self.interface = meshtastic.serial_interface.SerialInterface(devPath=self.device)
 
     '''
-    Send text message over TCP port to the Meshtastic radip
+    Send text message over the serial port to the Meshtastic radio. Called by the send scheduler.
     '''
-    def send_text(self, text: str, user_id: str) -> None:
-        self.interface.sendText(
+    def send_text_now(self, text: str, user_id: str) -> "MeshPacket":
+        return self.interface.sendText(
             text,
             user_id,
             wantAck=True,
-            channelIndex=self.channel_index
-            #onResponse=self.menu.option_handler(packet, self.interface)
+            channelIndex=self.channel_index,
+            onResponse=self.tracker.onAckNak
         )
 
     '''
-    Close the meshtastic TCP connection
+    Send broadcast message on configured channel index. Called by the send scheduler.
     '''
-    def close(self) -> None:
-        self.interface.close()
+    def send_broadcast_now(self, text: str, destination: str) -> None:
+        self.interface.sendText(
+            text,
+            channelIndex=self.channel_index,
+            wantAck=True
+        )
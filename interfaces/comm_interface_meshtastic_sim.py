@@ -0,0 +1,289 @@
+import heapq
+import random
+import threading
+import time
+from pubsub import pub
+from meshtastic import mesh_pb2
+from utils.config import config
+from utils.log import logger
+from utils.send_scheduler import LORA_PRESET_BITRATES, PACKET_OVERHEAD
+from interfaces.comm_interface_meshtastic import CommInterfaceMeshtastic
+from interfaces.interface_registry import interface_registry
+
+'''
+A simulated Meshtastic radio for testing without hardware.
+
+SimulatedRadio stands in for the Meshtastic library's interface object (TCPInterface, SerialInterface). It publishes packets on the same
+pubsub topics as the real library, enforces DATA_PAYLOAD_LEN, answers sendText() with acks and naks through onResponse, and serves
+getMyNodeInfo(). A mesh of virtual nodes sits behind it. Each node is a number of hops away from the BBS radio, and every packet is
+delayed by hop_latency per hop, may be lost (loss) or delivered twice (duplicate), and has to wait for the channel to be free. The
+channel carries as many bytes per second as the configured modem_preset.
+
+CommInterfaceMeshtasticSim drives a SimulatedRadio through the same CommInterfaceMeshtastic code path as a real radio: scheduler,
+delivery tracking, link supervision and the interface registry. Virtual nodes talk to the BBS with node_send() and receive replies
+through their on_message callback.
+
+Settings are read from the [interface_mesh_sim] stanza in config.toml.
+'''
+
+SIM_CONFIG = config.get("interface_mesh_sim", {})
+BBS_NODE_NUM = 0x0BB50000
+FIRST_VIRTUAL_NODE_NUM = 0x10000000
+BROADCAST_NUM = 0xFFFFFFFF
+
+'''
+A virtual node on the simulated mesh
+'''
+class SimulatedNode():
+    def __init__(self, node_num: int, hops: int) -> None:
+        self.node_num = node_num
+        self.hops = hops
+        self.on_message = None      # Called as on_message(node, text) whenever a message from the BBS reaches this node
+        self.received = 0
+
+    def get_id(self) -> str:
+        return f"!{self.node_num:08x}"
+
+'''
+The packet object returned by sendText(). Only has the fields the BBS uses.
+'''
+class SimulatedPacket():
+    def __init__(self, packet_id: int) -> None:
+        self.id = packet_id
+
+class SimulatedRadio():
+    def __init__(self) -> None:
+        self.hop_latency = SIM_CONFIG.get("hop_latency", 0.5)     # Seconds per hop
+        self.max_hops = SIM_CONFIG.get("max_hops", 3)
+        self.loss = SIM_CONFIG.get("loss", 0.0)                   # Chance of losing a packet, per packet
+        self.duplicate = SIM_CONFIG.get("duplicate", 0.0)         # Chance of delivering a packet twice
+        modem_preset = SIM_CONFIG.get("modem_preset", "LONG_FAST")
+        self.airtime_rate = LORA_PRESET_BITRATES.get(modem_preset, LORA_PRESET_BITRATES["LONG_FAST"]) / 8   # Bytes per second
+
+        self.nodes = {}                 # {node_num: SimulatedNode}
+        self.events = []                # Heap of (time, sequence, func, args)
+        self.sequence = 0
+        self.channel_free_at = 0        # When the simulated channel is done transmitting the last packet
+        self.condition = threading.Condition()
+        self.running = True
+        self.socket = None              # No real socket for the link supervisor to watch
+
+        for i in range(0, SIM_CONFIG.get("nodes", 10)):
+            self.add_node(FIRST_VIRTUAL_NODE_NUM + i)
+
+        self.thread = threading.Thread(target=self.run, name="SimulatedRadio", daemon=True)
+        self.thread.start()
+
+    '''
+    Announce that the radio is connected. Called once the owning interface has stored this radio and registered, so the interface
+    registry can route the event to it.
+    '''
+    def start(self) -> None:
+        self.schedule(0, self.publish, "meshtastic.connection.established", {"interface": self})
+
+    '''
+    Add a virtual node to the mesh. If hops isn't given, nodes are spread evenly between 1 and max_hops away.
+    '''
+    def add_node(self, node_num: int, hops: int=None) -> SimulatedNode:
+        if hops == None:
+            hops = 1 + len(self.nodes) % self.max_hops
+        node = SimulatedNode(node_num, hops)
+        with self.condition:
+            self.nodes[node_num] = node
+        return node
+
+    '''
+    Return a virtual node, creating it if needed.
+    '''
+    def get_node(self, node_num: int) -> SimulatedNode:
+        with self.condition:
+            node = self.nodes.get(node_num)
+        if not node:
+            node = self.add_node(node_num)
+        return node
+
+    '''
+    Same as the Meshtastic library: returns info about the BBS's own node.
+    '''
+    def getMyNodeInfo(self) -> dict:
+        return {"num": BBS_NODE_NUM, "user": {"id": f"!{BBS_NODE_NUM:08x}", "longName": "MBBS Simulator"}}
+
+    '''
+    Same as the Meshtastic library: send a text message from the BBS to a node, or broadcast it.
+    '''
+    def sendText(self, text: str, destinationId=BROADCAST_NUM, wantAck: bool=False, wantResponse: bool=False, onResponse=None,
+                 channelIndex: int=0, **kwargs) -> SimulatedPacket:
+        data = text.encode("utf-8")
+        if len(data) > mesh_pb2.Constants.DATA_PAYLOAD_LEN:
+            raise ValueError("Data payload too big")
+
+        packet = SimulatedPacket(random.randint(1, 0xFFFFFFFF))
+        arrival = self.transmit(len(data))
+
+        # Broadcasts aren't delivered to anyone in particular
+        if destinationId in (BROADCAST_NUM, "^all"):
+            return packet
+
+        node = self.get_node(destinationId)
+        delay = arrival - time.monotonic() + node.hops * self.hop_latency
+        if random.random() < self.loss:
+            # The radio retries a few times before giving up with a nak
+            if wantAck and onResponse:
+                self.schedule(delay * 3, onResponse, self.make_routing_packet(node, packet.id, "MAX_RETRANSMIT"))
+            return packet
+
+        self.schedule(delay, self.deliver_to_node, node, text)
+        if random.random() < self.duplicate:
+            self.schedule(delay + self.hop_latency, self.deliver_to_node, node, text)
+        if wantAck:
+            ack = self.make_routing_packet(node, packet.id, "NONE")
+            if onResponse:
+                self.schedule(delay * 2, onResponse, ack)
+            self.schedule(delay * 2, self.publish, "meshtastic.receive", {"packet": ack, "interface": self})
+        return packet
+
+    '''
+    Send a text message from a virtual node to the BBS.
+    '''
+    def node_send(self, node_num: int, text: str) -> None:
+        node = self.get_node(node_num)
+        if random.random() < self.loss:
+            return
+
+        packet = self.make_text_packet(node, text)
+        delay = self.transmit(len(text.encode("utf-8"))) - time.monotonic() + node.hops * self.hop_latency
+        self.schedule(delay, self.publish, "meshtastic.receive", {"packet": packet, "interface": self})
+        if random.random() < self.duplicate:
+            self.schedule(delay + self.hop_latency, self.publish, "meshtastic.receive", {"packet": packet, "interface": self})
+
+    '''
+    Same as the Meshtastic library: close the connection. Publishes connection.lost.
+    '''
+    def close(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    '''
+    Reserve the channel for one packet and return when the packet has finished transmitting.
+    '''
+    def transmit(self, size: int) -> float:
+        with self.condition:
+            start = max(time.monotonic(), self.channel_free_at)
+            self.channel_free_at = start + (size + PACKET_OVERHEAD) / self.airtime_rate
+            return self.channel_free_at
+
+    def deliver_to_node(self, node: SimulatedNode, text: str) -> None:
+        node.received += 1
+        if node.on_message:
+            node.on_message(node, text)
+
+    def publish(self, topic: str, kwargs: dict) -> None:
+        pub.sendMessage(topic, **kwargs)
+
+    '''
+    Build a packet as the Meshtastic library would publish it for a text message from a node to the BBS.
+    '''
+    def make_text_packet(self, node: SimulatedNode, text: str) -> dict:
+        return {
+            "from": node.node_num,
+            "to": BBS_NODE_NUM,
+            "id": random.randint(1, 0xFFFFFFFF),
+            "channel": 0,
+            "decoded": {
+                "portnum": "TEXT_MESSAGE_APP",
+                "payload": text.encode("utf-8"),
+                "text": text
+            },
+            "rxTime": int(time.time()),
+            "hopLimit": self.max_hops - node.hops,
+            "hopStart": self.max_hops,
+            "fromId": node.get_id(),
+            "toId": f"!{BBS_NODE_NUM:08x}"
+        }
+
+    '''
+    Build a routing (ack/nak) packet for a packet the BBS sent to a node.
+    '''
+    def make_routing_packet(self, node: SimulatedNode, request_id: int, error_reason: str) -> dict:
+        return {
+            "from": node.node_num,
+            "to": BBS_NODE_NUM,
+            "id": random.randint(1, 0xFFFFFFFF),
+            "decoded": {
+                "portnum": "ROUTING_APP",
+                "requestId": request_id,
+                "routing": {"errorReason": error_reason}
+            },
+            "fromId": node.get_id(),
+            "toId": f"!{BBS_NODE_NUM:08x}"
+        }
+
+    '''
+    Queue func(*args) to run after delay seconds on the radio thread.
+    '''
+    def schedule(self, delay: float, func, *args) -> None:
+        with self.condition:
+            self.sequence += 1
+            heapq.heappush(self.events, (time.monotonic() + delay, self.sequence, func, args))
+            self.condition.notify()
+
+    '''
+    Radio thread. Runs events as they come due.
+    '''
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while self.running and (not self.events or self.events[0][0] > time.monotonic()):
+                    if self.events:
+                        self.condition.wait(self.events[0][0] - time.monotonic())
+                    else:
+                        self.condition.wait()
+                if not self.running:
+                    break
+                when, sequence, func, args = heapq.heappop(self.events)
+
+            try:
+                func(*args)
+            except Exception as e:
+                logger.exception(f"Error in simulated radio: {str(e)}")
+
+        pub.sendMessage("meshtastic.connection.lost", interface=self)
+
+class CommInterfaceMeshtasticSim(CommInterfaceMeshtastic):
+    def __init__(self, bc_channel_index: int) -> None:
+        super().__init__("mesh_sim")
+        self.bc_channel_index = bc_channel_index
+
+        # Packets from this radio are routed to us by the interface registry. Register before connecting, so the registry is ready
+        # for the radio's connection.established event.
+        interface_registry.register(self)
+        self.connect()
+
+    '''
+    Start the simulated radio
+    '''
+    def connect(self) -> None:
+        self.interface = SimulatedRadio()
+        self.interface.start()
+
+    '''
+    Send a text message through the simulated radio. Called by the send scheduler.
+    '''
+    def send_text_now(self, text: str, user_id: str) -> SimulatedPacket:
+        return self.interface.sendText(
+            text,
+            user_id,
+            wantAck=True,
+            onResponse=self.tracker.onAckNak
+        )
+
+    '''
+    Send a broadcast message through the simulated radio. Called by the send scheduler.
+    '''
+    def send_broadcast_now(self, text: str, destination: str) -> None:
+        self.interface.sendText(
+            text,
+            channelIndex=self.bc_channel_index,
+            wantAck=True
+        )
@@ -3,29 +3,46 @@ from utils.config import config
 from utils.log import logger as logger
 from interfaces.comm_interface import CommInterface
 import threading
+import asyncio
+import codecs
 import socket
 import time
 
 '''
 This interface allows a user to connect to the BBS via a TCP socket. This is useful for testing new features or debugging without
 needing many radios. It is also faster than waiting for radio packets.
+
+Each line a client sends (ending with a newline) is one message. Input is decoded as it arrives, so a character split between two
+reads is put back together, and a line which doesn't fit in one read is delivered once the rest of it arrives. A line longer than
+MAX_LINE_LENGTH characters is delivered in pieces.
 '''
 
 FORMAT = 'UTF-8'
+MAX_LINE_LENGTH = 4096      # Longest line kept waiting for its newline
+
+# Server mode and per-connection write buffer sizes for the asyncio server. Read from [interface_tcp_server] in config.toml.
+TCP_SERVER_MODE = config.get("interface_tcp_server", {}).get("tcp_server_mode", "threaded")
+WRITE_BUFFER_HIGH = config.get("interface_tcp_server", {}).get("write_buffer_high", 16384)    # Stop reading input from a client above this
+WRITE_BUFFER_MAX = config.get("interface_tcp_server", {}).get("write_buffer_max", 262144)     # Drop a client that lets this much output pile up
+MAX_PAYLOAD = config.get("interface_tcp_server", {}).get("max_payload")       # TCP clients get whole messages unless this is set
 
 class CommInterfaceTCP(CommInterface):
+    max_payload = MAX_PAYLOAD
+
     def __init__(self, conn, addr: tuple) -> None:
         self.user_id = f"{addr[0]}_{addr[1]}"
         self.conn = conn
         self.addr = addr
         self.hostname = addr[0]
         self.port = addr[1]
+        self.decoder = codecs.getincrementaldecoder(FORMAT)(errors="replace")
+        self.line = ""              # Start of a line which hasn't ended yet
 
     '''
-    Send text message over TCP port
+    Send text message over TCP port. Messages aren't paged for TCP clients, so they can be long and need more than one send().
     '''
     def send_text(self, text: str, user_id: str) -> None:
-        self.conn.send(text.encode())
+        self.conn.sendall(text.encode())
 
     '''
     Listen for incoming data on the TCP server
@@ -38,23 +55,40 @@ class CommInterfaceTCP(CommInterface):
             if not data:
                 break
 
-            packet = self.make_mesh_packet(data)
-            self.on_receive(packet, None)
+            for line in self.receive_data(data):
+                self.on_receive(self.make_mesh_packet(line), None)
 
+        for line in self.receive_data(b"", final=True):
+            self.on_receive(self.make_mesh_packet(line), None)
         self.conn.close()
 
+    '''
+    Decode data received from the client. Returns the lines completed by it, without their line endings. The end of an unfinished
+    line is kept until more data arrives, or returned if final is True (the client disconnected).
+    '''
+    def receive_data(self, data: bytes, final: bool=False) -> list:
+        lines = (self.line + self.decoder.decode(data, final)).split("\n")
+        self.line = lines.pop()
+        if final and self.line:
+            lines.append(self.line)
+            self.line = ""
+        elif len(self.line) > MAX_LINE_LENGTH:
+            lines.append(self.line[:MAX_LINE_LENGTH])
+            self.line = self.line[MAX_LINE_LENGTH:]
+        return [line[:-1] if line.endswith("\r") else line for line in lines]
+
     '''
     Converts the incoming data into something compatible with a Meshtastic packet object.
     '''
-    def make_mesh_packet(self, data: bytes) -> dict:
+    def make_mesh_packet(self, text: str) -> dict:
         packet = {}
         packet["from"] = f"{self.hostname}_{self.port}"
         packet["to"] = f"{self.hostname}_{self.port}"
         packet["channel"] = self.port
         packet["decoded"] = {}
         packet["decoded"]["portnum"] = "COMM_INTERFACE_MESHTASTIC_TCP"
-        packet["decoded"]["payload"] = data[:-1]
-        packet["decoded"]["text"] = data.decode(FORMAT)[:-1]
+        packet["decoded"]["payload"] = text.encode(FORMAT)
+        packet["decoded"]["text"] = text
         packet["id"] = 0
         packet["rxTime"] = int(time.time())
         packet["rxSnr"] = 0
@@ -73,6 +107,76 @@ class CommInterfaceTCP(CommInterface):
     def close(self) -> None:
         self.conn.close()
 
+'''
+Same as CommInterfaceTCP, but the connection is driven by an asyncio event loop instead of its own thread. One event loop serves every
+client. Each connection gets its own write buffer (the asyncio transport) with backpressure: the BBS stops reading input from a client
+until that client has drained its pending output, and a client which never reads is disconnected once its buffer hits WRITE_BUFFER_MAX.
+'''
+class CommInterfaceTCPAsync(CommInterfaceTCP):
+    active_connections = 0
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, loop: asyncio.AbstractEventLoop) -> None:
+        super().__init__(None, writer.get_extra_info("peername"))
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+
+    '''
+    Send text message over TCP port. Sessions call this from worker threads, so the write is handed over to the event loop.
+    '''
+    def send_text(self, text: str, user_id: str) -> None:
+        self.loop.call_soon_threadsafe(self.buffer_write, text.encode())
+
+    '''
+    Append data to this connection's write buffer. Must run on the event loop.
+    '''
+    def buffer_write(self, data: bytes) -> None:
+        if self.writer.is_closing():
+            return
+
+        if self.writer.transport.get_write_buffer_size() + len(data) > WRITE_BUFFER_MAX:
+            logger.warning(f"[SLOW CLIENT] {self.hostname}_{self.port} is not reading its output. Disconnecting.")
+            self.writer.transport.abort()
+            return
+
+        self.writer.write(data)
+
+    '''
+    Listen for incoming data from this client
+    '''
+    async def handle_tcp_client(self) -> None:
+        logger.info(f"[NEW CONNECTION] {self.hostname}_{self.port} connected.")
+        CommInterfaceTCPAsync.active_connections += 1
+        logger.info(f"[ACTIVE CONNECTIONS] {CommInterfaceTCPAsync.active_connections}")
+
+        try:
+            while True:
+                data = await self.reader.read(1024)
+
+                if not data:
+                    for line in self.receive_data(b"", final=True):
+                        self.on_receive(self.make_mesh_packet(line), None)
+                    break
+
+                # on_receive() only queues the packet on the dispatcher, so it is safe to call from the event loop.
+                for line in self.receive_data(data):
+                    self.on_receive(self.make_mesh_packet(line), None)
+
+                # Backpressure. Don't read more input until this client's output has drained below WRITE_BUFFER_HIGH.
+                await self.writer.drain()
+        except ConnectionError as e:
+            logger.info(f"[CONNECTION ERROR] {self.hostname}_{self.port}: {str(e)}")
+        finally:
+            CommInterfaceTCPAsync.active_connections -= 1
+            self.writer.close()
+
+    '''
+    Close the TCP connection
+    '''
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.writer.close)
+
 '''
 Starts a TCP server listener. Will create a new thread for each incoming connection.
 '''
@@ -91,6 +195,25 @@ def tcp_server_start(addr: set) -> None:
         thread.start()
         logger.info(f"[ACTIVE CONNECTIONS] {threading.activeCount() - 1}")
 
+'''
+Starts an asyncio TCP server listener. All connections are served from a single event loop running in this thread.
+'''
+def tcp_server_start_async(addr: set) -> None:
+    asyncio.run(tcp_server_serve(addr))
+
+async def tcp_server_serve(addr: set) -> None:
+    loop = asyncio.get_running_loop()
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        tcp_interface = CommInterfaceTCPAsync(reader, writer, loop)
+        await tcp_interface.handle_tcp_client()
+
+    server = await asyncio.start_server(on_connect, addr[0], addr[1], reuse_address=True)
+    logger.info(f"[LISTENING] TCP server (asyncio) is listening on {config['interface_tcp_server']['tcp_server_ip']}:{config['interface_tcp_server']['tcp_server_port']}")
+
+    async with server:
+        await server.serve_forever()
+
 # Get TCP server settings from config.toml.
 try:
     addr = (config["interface_tcp_server"]["tcp_server_ip"], config["interface_tcp_server"]["tcp_server_port"])
@@ -99,6 +222,10 @@ except:
     logger.error("Unable to read TCP server settings from config.toml. Continuing without it.")
 
 # We only run the TCP server if the TCP host and port are configured in config.toml.
+# tcp_server_mode selects between one event loop for all clients ("asyncio") or one thread per client ("threaded").
 if addr != ("", ""):
-    tcp_thread = threading.Thread(target=tcp_server_start, args=[addr])
+    if TCP_SERVER_MODE == "asyncio":
+        tcp_thread = threading.Thread(target=tcp_server_start_async, args=[addr])
+    else:
+        tcp_thread = threading.Thread(target=tcp_server_start, args=[addr])
     tcp_thread.start()
\ No newline at end of file
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+from pubsub import pub
+from utils.log import logger
+from utils.link_supervisor import LINK_UP
+
+'''
+Keeps track of every Meshtastic radio interface the BBS is running.
+
+The Meshtastic library publishes packets from every radio on the same global pubsub topics. Instead of every CommInterfaceMeshtastic
+subscribing to those topics (and seeing packets from every radio), the registry subscribes once and routes each packet only to the
+interface which owns the radio it arrived on. Any number of radios can be registered.
+
+The registry also remembers which radios have recently heard each node. When the BBS replies to a node, the reply goes out through the
+radio which heard the node last, normally the one its request came in on, so the user sees every reply come from the same node id and
+their app keeps the conversation in one thread. Another radio which has heard the node is only used if that radio's link is down, or
+if its send queue is much deeper (by SWITCH_MARGIN packets, counting poor delivery to the node as extra queued packets).
+'''
+
+HEARD_TIMEOUT = 3600        # Seconds after which a radio is no longer considered able to reach a node it heard
+MAX_HEARD_NODES = 4096      # Number of nodes to remember
+RATIO_WEIGHT = 4            # Queued packets a radio with 0% delivery to a node is penalized by, compared to one with 100% delivery
+SWITCH_MARGIN = 8           # How much better (in queued packets) another radio must be before a reply leaves the radio which heard the node
+
+class InterfaceRegistry():
+    def __init__(self) -> None:
+        self.interfaces = []            # Registered CommInterfaceMeshtastic objects
+        self.heard = OrderedDict()      # {node id: {CommInterfaceMeshtastic: time last heard}}, least recently heard first
+        self.lock = threading.Lock()
+        self.subscribed = False
+
+    '''
+    Register a radio interface and start routing packets to it.
+    '''
+    def register(self, comm_interface: "CommInterfaceMeshtastic") -> None:
+        with self.lock:
+            self.interfaces.append(comm_interface)
+            subscribe = not self.subscribed
+            self.subscribed = True
+
+        # Meshtastic uses pubsub to receive messages from the radios asynchronously
+        if subscribe:
+            pub.subscribe(self.on_receive, "meshtastic.receive")
+            pub.subscribe(self.on_connection, "meshtastic.connection.established")
+            pub.subscribe(self.on_disconnect, "meshtastic.connection.lost")
+
+    '''
+    Stop routing packets to a radio interface.
+    '''
+    def unregister(self, comm_interface: "CommInterfaceMeshtastic") -> None:
+        with self.lock:
+            if comm_interface in self.interfaces:
+                self.interfaces.remove(comm_interface)
+            for radios in self.heard.values():
+                radios.pop(comm_interface, None)
+
+    '''
+    Return the registered interface which owns a Meshtastic library interface object, or None.
+    '''
+    def find_owner(self, interface) -> "CommInterfaceMeshtastic":
+        with self.lock:
+            for comm_interface in self.interfaces:
+                if comm_interface.interface is interface:
+                    return comm_interface
+        return None
+
+    '''
+    Called by pubsub for every packet from every radio.
+    '''
+    def on_receive(self, packet: dict, interface) -> None:
+        owner = self.find_owner(interface)
+        if not owner:
+            logger.debug("Dropping packet from a radio which isn't registered")
+            return
+
+        if "from" in packet:
+            node = packet["from"]
+            with self.lock:
+                radios = self.heard.pop(node, {})
+                radios[owner] = time.monotonic()
+                self.heard[node] = radios
+                if len(self.heard) > MAX_HEARD_NODES:
+                    self.heard.popitem(last=False)
+                interfaces = list(self.interfaces)
+
+            # A text message from a user means they have moved on, so replies they haven't acknowledged yet (on any radio)
+            # no longer need to be retransmitted.
+            if packet.get("decoded", {}).get("portnum") == "TEXT_MESSAGE_APP":
+                for comm_interface in interfaces:
+                    comm_interface.tracker.user_activity(node)
+
+        owner.on_receive(packet, interface)
+
+    '''
+    Called by pubsub when any radio connects
+    '''
+    def on_connection(self, interface, topic=pub.AUTO_TOPIC) -> None:
+        owner = self.find_owner(interface)
+        if owner:
+            owner.on_connection(interface)
+
+    '''
+    Called by pubsub when any radio loses its connection
+    '''
+    def on_disconnect(self, interface, topic=pub.AUTO_TOPIC) -> None:
+        owner = self.find_owner(interface)
+        if owner:
+            owner.on_disconnect(interface)
+
+    '''
+    Choose the radio to send a message to a node through. Only radios which have recently heard the node and whose link is up are
+    considered. The radio which heard the node last is kept unless another one scores better by more than SWITCH_MARGIN. If no radio
+    can be used, the preferred radio (normally the one the user's session started on) is used.
+    '''
+    def select_interface(self, node, preferred: "CommInterfaceMeshtastic") -> "CommInterfaceMeshtastic":
+        now = time.monotonic()
+        with self.lock:
+            radios = self.heard.get(node, {})
+            heard_last_first = sorted(radios.items(), key=lambda item: item[1], reverse=True)
+            candidates = [radio for radio, heard in heard_last_first if now - heard < HEARD_TIMEOUT]
+
+        best = preferred
+        best_score = None
+        for radio in candidates:        # The radio which heard the node last comes first
+            if radio.supervisor.state != LINK_UP:
+                continue
+
+            score = self.get_score(radio, node)
+            if best_score == None:
+                best = radio
+                best_score = score
+            elif score + SWITCH_MARGIN < best_score:
+                best = radio
+                best_score = score + SWITCH_MARGIN      # Only switch again for a radio which is better than this one too
+
+        return best
+
+    '''
+    Returns how busy a radio is for sending to a node: its queued packets, plus a penalty for poor delivery to the node. Lower is better.
+    '''
+    def get_score(self, radio: "CommInterfaceMeshtastic", node) -> float:
+        ratio = 1
+        stats = radio.tracker.get_node_stats(node)
+        if stats:
+            ratio = stats.get_delivery_ratio()
+        return radio.scheduler.get_queue_depth() + RATIO_WEIGHT * (1 - ratio)
+
+# Global registry of all radio interfaces
+interface_registry = InterfaceRegistry()
@@ -4,17 +4,22 @@ import time
 from pubsub import pub
 from utils.log import logger as logger
 from utils.config import config
+from utils.metrics import metrics
+from utils.menu_graph import menu_graph
 from interfaces.comm_interface_tcp import CommInterfaceTCP
 from interfaces.comm_interface_meshtastic_tcp import CommInterfaceMeshtasticTCP
 from interfaces.comm_interface_meshtastic_serial import CommInterfaceMeshtasticSerial
+from interfaces.comm_interface_meshtastic_sim import CommInterfaceMeshtasticSim
 
 '''
 This is the main application. Edit the config file at config.toml to configure the program, then launch this.
 '''
 
 if __name__ == '__main__':    
-    interface = None
-    serial_interface = None
+    radio_interfaces = []
+
+    # Compile the [[menus]] from config.toml before any users connect
+    menu_graph.compile()
 
     # Meshtastic radio TCP interface
     try:
@@ -23,7 +28,7 @@ if __name__ == '__main__':
     except: 
         logger.error("Unable to read radio's TCP config options from config.toml. Continuing without it.")
     else:
-        interface = CommInterfaceMeshtasticTCP(radio_ip, radio_channel)
+        radio_interfaces.append(CommInterfaceMeshtasticTCP(radio_ip, radio_channel))
 
     # Meshtastic radio serial interface
     try:
@@ -32,20 +37,42 @@ if __name__ == '__main__':
     except:
         logger.error("Unable to read serial device path from config.toml. Continuing without it.")
     else:
-        serial_interface = CommInterfaceMeshtasticSerial(radio_device, radio_channel)   
+        radio_interfaces.append(CommInterfaceMeshtasticSerial(radio_device, radio_channel))
+
+    # Simulated Meshtastic radio for testing without hardware
+    if config.get("interface_mesh_sim", {}).get("enabled", False):
+        radio_interfaces.append(CommInterfaceMeshtasticSim(config["main"]["radio_channel_index"]))
+
+    # Any number of additional radios can be defined as [[radios]] entries
+    for radio in config.get("radios", []):
+        radio_channel = radio.get("channel_index", config["main"]["radio_channel_index"])
+        if radio["type"] == "tcp":
+            radio_interfaces.append(CommInterfaceMeshtasticTCP(radio["radio_ip"], radio_channel))
+        elif radio["type"] == "serial":
+            radio_interfaces.append(CommInterfaceMeshtasticSerial(radio["serial_device"], radio_channel))
+        else:
+            logger.error(f"Unknown radio type {radio['type']} in config.toml. Skipping it.")
+
+    # Periodically log metrics if [metrics] log_interval is set in config.toml
+    try:
+        metrics_log_interval = config["metrics"]["log_interval"]
+    except:
+        metrics_log_interval = 0
+    last_metrics_log = time.monotonic()
 
     try:
         while True:
             time.sleep(1)
 
+            if metrics_log_interval and time.monotonic() - last_metrics_log >= metrics_log_interval:
+                logger.info(f"[METRICS] {metrics.get_text()}")
+                last_metrics_log = time.monotonic()
+
     except KeyboardInterrupt:
         logger.info("Shutting down the server...")
 
-        if interface:
-            interface.close()
-
-        if serial_interface:
-            serial_interface.close()
+        for radio_interface in radio_interfaces:
+            radio_interface.close()
 
         try:
             if js8call_client.connected:
@@ -0,0 +1,84 @@
+import unittest
+from utils.packet_packer import ELLIPSIS, PacketPacker, byte_len, find_break
+
+'''
+Tests for where utils/packet_packer.py breaks pages. Run from the repository root with:
+    python -m unittest discover tests
+'''
+
+class TestFindBreak(unittest.TestCase):
+    '''
+    A newline in the last half of the page wins over a space right at the cut
+    '''
+    def test_newline_before_space_at_end(self):
+        data = b"aaaaaaa bbbb\ncc dd"
+        end = 15                                # data[15] is the space between "cc" and "dd"
+        self.assertEqual(data[end:end + 1], b" ")
+        self.assertEqual(find_break(data, 0, end), 12)
+
+    def test_newline_at_end(self):
+        data = b"aaaa bbbb\ncccc"
+        self.assertEqual(find_break(data, 0, 9), 9)
+
+    def test_space_at_end_without_newline(self):
+        data = b"aaaa bbbb cccc"
+        self.assertEqual(find_break(data, 0, 9), 9)
+
+    '''
+    A newline in the first half of the page would waste too much of it, so the last space is used instead
+    '''
+    def test_newline_in_first_half(self):
+        data = b"aa\nbbbb cccc dddd"
+        self.assertEqual(find_break(data, 0, 14), 12)
+
+    def test_no_break(self):
+        self.assertEqual(find_break(b"aaaaaaaaaa", 0, 5), -1)
+
+class TestPack(unittest.TestCase):
+    '''
+    Lines stay whole when a page boundary lands on a space after the last full line
+    '''
+    def test_lines_not_split(self):
+        lines = [f"Entry {i} from guest{i}" for i in range(0, 20)]
+        text = "\n".join(lines)
+        budget = 60
+        pages = PacketPacker(200).pack(text, budget)
+        for page in pages:
+            self.assertLessEqual(byte_len(page), budget)
+            for line in page.split("\n"):
+                self.assertIn(line, lines)
+        self.assertEqual("\n".join(pages), text)
+
+    def test_multibyte_not_cut(self):
+        text = "é" * 50
+        pages = PacketPacker(200).pack(text, 15)
+        self.assertEqual("".join(pages), text)
+        for page in pages:
+            self.assertLessEqual(byte_len(page), 15)
+
+class TestTruncate(unittest.TestCase):
+    def test_ellipsis(self):
+        text = PacketPacker(200).truncate("aaaa bbbb cccc dddd", 12)
+        self.assertEqual(text, "aaaa ...")
+
+    '''
+    A budget smaller than the ellipsis gets as much of the text as fits, without the ellipsis
+    '''
+    def test_budget_smaller_than_ellipsis(self):
+        packer = PacketPacker(200)
+        for budget in range(0, byte_len(ELLIPSIS)):
+            text = packer.truncate("aaaa bbbb cccc", budget)
+            self.assertLessEqual(byte_len(text), budget)
+            self.assertEqual(text, "aaaa bbbb cccc"[0:budget])
+
+    def test_fill_page_tiny_budget(self):
+        page = PacketPacker(200).fill_page(["a long line which can't fit", "another"], 2)
+        self.assertEqual(page, ["a "])
+        self.assertLessEqual(byte_len(page[0]), 2)
+
+    def test_budget_smaller_than_ellipsis_multibyte(self):
+        text = PacketPacker(200).truncate("éééé", 3)
+        self.assertEqual(text, "é")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import argparse
+import time
+
+'''
+Maintenance commands for the BBS database. Run from the repository root so config.toml is found:
+
+    python -m tools.bbs_admin migrate
+    python -m tools.bbs_admin recount
+    python -m tools.bbs_admin reindex
+
+migrate - Move posts from the old per-topic topic_<uuid> tables into the posts table. Posts are moved in batches of --batch-size,
+          each in its own short transaction, with a --pause between batches, so the BBS can keep running while a large database is
+          migrated. Interrupting the migration is safe, and running it again carries on where it stopped. The BBS migrates any topic
+          that is still left the first time someone reads it.
+
+recount - Recalculate every topic's post count, last author and last post time from its posts, and report how many were wrong.
+          Topics are recounted --batch-size at a time, each batch in its own transaction, with a --pause between batches.
+
+reindex - Rebuild the full-text search index from every topic and post, in one transaction. The BBS can keep running, but posts
+          made while the index is rebuilt wait for it to finish.
+'''
+
+'''
+Migrate every topic still in an old table. Returns the number of posts moved.
+'''
+def migrate(bbs_db: "BBSDB", batch_size: int, pause: float) -> int:
+    legacy_topics = bbs_db.get_legacy_topics()
+    print(f"{len(legacy_topics)} topics to migrate")
+
+    total = 0
+    for index, topic_id in enumerate(legacy_topics):
+        moved = 0
+        while True:
+            batch = bbs_db.migrate_topic(topic_id, batch_size)
+            if batch == 0:
+                break
+            moved += batch
+            time.sleep(pause)
+        total += moved
+        print(f"[{index + 1}/{len(legacy_topics)}] topic_{topic_id}: {moved} posts")
+
+    print(f"Migrated {total} posts")
+    return total
+
+'''
+Recount the stats of every topic. Returns the number of topics whose stats were wrong.
+'''
+def recount(bbs_db: "BBSDB", batch_size: int, pause: float) -> int:
+    batches = bbs_db.get_topic_id_batches(batch_size)
+    topics = sum(len(topic_ids) for topic_ids in batches)
+    print(f"{topics} topics to recount")
+
+    drifted = 0
+    for topic_ids in batches:
+        drifted += bbs_db.recount_topics(topic_ids)
+        time.sleep(pause)
+
+    print(f"Fixed the stats of {drifted} topics")
+    return drifted
+
+'''
+Rebuild the search index. Returns the number of topics and posts indexed, or None if full-text search isn't available.
+'''
+def reindex(bbs_db: "BBSDB") -> int:
+    indexed = bbs_db.rebuild_search_index()
+    if indexed == None:
+        print("Full-text search (SQLite FTS5) isn't available, so there is no index to rebuild")
+    else:
+        print(f"Indexed {indexed} topics and posts")
+    return indexed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="MBBS database maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Move posts from old topic_<uuid> tables into the posts table")
+    migrate_parser.add_argument("--batch-size", type=int, default=1000, help="Posts moved per transaction")
+    migrate_parser.add_argument("--pause", type=float, default=0.05, help="Seconds to wait between batches, to let the BBS write")
+
+    recount_parser = commands.add_parser("recount", help="Recalculate topic post counts and last post details")
+    recount_parser.add_argument("--batch-size", type=int, default=500, help="Topics recounted per transaction")
+    recount_parser.add_argument("--pause", type=float, default=0.05, help="Seconds to wait between batches, to let the BBS write")
+
+    commands.add_parser("reindex", help="Rebuild the full-text search index")
+
+    args = parser.parse_args()
+
+    from utils.bbs_db import BBSDB
+    bbs_db = BBSDB()
+
+    if args.command == "migrate":
+        migrate(bbs_db, args.batch_size, args.pause)
+    elif args.command == "recount":
+        recount(bbs_db, args.batch_size, args.pause)
+    elif args.command == "reindex":
+        reindex(bbs_db)
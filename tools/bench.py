@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+'''
+Microbenchmarks for MBBS hot paths: message rendering, packing text into packets, paging, topic listing, BBS database queries, authentication and menus.
+
+Every benchmark is timed over several repeats. Each repeat runs the benchmark in a loop long enough to get a stable measurement, and
+the per-call time of each repeat is recorded. Results are printed as a table and can be saved as JSON. The JSON format is stable
+(see get_report()), so a saved run can be used as a baseline for later runs:
+
+    python -m tools.bench --output baseline.json
+    python -m tools.bench --baseline baseline.json
+
+When comparing against a baseline, any benchmark whose median got slower by more than --threshold is reported as a regression and
+the exit code is 1.
+
+Run from the repository root so config.toml is found. The databases used by the benchmarks are created in a temporary directory, so
+the BBS's own data/ directory is never touched.
+'''
+
+SCHEMA_VERSION = 1
+MIN_REPEAT_TIME = 0.2       # Seconds each repeat should run for, at least
+
+benchmarks = {}             # {name: setup function}. The setup function returns the function to time.
+
+'''
+Decorator which registers a benchmark. The decorated function does any setup and returns a function to be timed.
+'''
+def benchmark(name: str):
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+'''
+Interface which counts outbound packets instead of sending them
+'''
+class BenchInterface():
+    def __init__(self) -> None:
+        self.packets = 0
+
+    def send_text(self, text: str, user_id) -> None:
+        self.packets += 1
+
+'''
+Build a logged in session attached to a BenchInterface. The session's constructor isn't used because it starts timers and sends
+the login menu.
+'''
+def make_session() -> "UserSession":
+    from utils.user_session import UserSession
+    from utils.packet_packer import packet_packer
+    session = UserSession.__new__(UserSession)
+    session.user_id = 1
+    session.username = "bench"
+    session.role = "user"
+    session.authenticated = True
+    session.burst = False
+    session.interface = BenchInterface()
+    session.current_context = None
+    session.context_history = []
+    session.user_db = None
+    session.packer = packet_packer
+    return session
+
+'''
+Create a topic with the given number of posts. Returns the topic's uuid.
+'''
+def make_topic(bbs_db: "BBSDB", title: str, posts: int) -> str:
+    bbs_db.create_topic(title, int(time.time()))
+    topic_id = bbs_db.cursor.execute("SELECT uuid FROM topics WHERE title = ?", (title,)).fetchone()[0]
+    bbs_db.cursor.executemany(
+        "INSERT INTO posts (topic_id, seq, author, timestamp, content) VALUES (?, ?, ?, ?, ?)",
+        ((topic_id, i + 1, f"user{i % 50}", 1700000000 + i, f"Post number {i}. " * 8) for i in range(0, posts))
+    )
+    bbs_db.con.commit()
+    bbs_db.recount_topics([topic_id])
+    return topic_id
+
+'''
+Create the given number of empty topics, if they haven't been created already
+'''
+def make_topics(bbs_db: "BBSDB", topics: int) -> None:
+    bbs_db.cursor.executemany(
+        "INSERT OR IGNORE INTO topics (uuid, title, last_modified) VALUES (?, ?, ?)",
+        ((f"{i:032x}", f"Benchmark topic number {i}", 1700000000 + i) for i in range(0, topics))
+    )
+    bbs_db.con.commit()
+
+def make_message() -> "Message":
+    from utils.message import Message
+    return Message(header="Bulletin Board", body="[1] (01-01-25 12:00) A topic title\n" * 4, footer="[C]reate [N]ext [P]rev [Q]uit [#]")
+
+@benchmark("message.get_text")
+def bench_message_get_text(args):
+    message = make_message()
+    return message.get_text
+
+@benchmark("message.get_message_size")
+def bench_message_get_message_size(args):
+    message = make_message()
+    return message.get_message_size
+
+@benchmark("message_pager.process_message")
+def bench_message_pager(args):
+    from contexts.message_pager import MessagePager
+    from utils.message import Message
+    session = make_session()
+    message = Message(header="Long post", body="All work and no play makes Jack a dull boy. " * 500, footer="[B]ack")
+
+    def run():
+        MessagePager(session, message).process_message()
+    return run
+
+@benchmark("packet_packer.pack")
+def bench_packet_packer_pack(args):
+    from utils.packet_packer import packet_packer
+    text = "Ünïcödé posts from the mesh 📡 wrap on word breaks.\n" * 100
+    return lambda: packet_packer.pack(text, 200)
+
+@benchmark("bbs_main.topics")
+def bench_bbs_main_topics(args):
+    from contexts.bbs_main import BBSMain
+    session = make_session()
+    bbs_main = BBSMain(session, "b", "[B]BS")
+    make_topics(bbs_main.bbs_db, args.topics)
+    return bbs_main.generate_topics_page
+
+@benchmark("topic_index.update_topic")
+def bench_topic_index_update_topic(args):
+    from utils.bbs_db import BBSDB
+    from utils.topic_index import topic_index
+    from utils.packet_packer import packet_packer
+    bbs_db = BBSDB()
+    make_topics(bbs_db, args.topics)
+    topic_index.get_pages(packet_packer, 180)
+    clock = [2000000000]
+
+    # A new post to the 21st topic moves it to the top, and the pages down to where it was are rendered again
+    def get_row(topic_id):
+        clock[0] += 1
+        topic = topic_index.get_topic(20)
+        return (topic_id, topic.title, clock[0], topic.post_count + 1, "bench", clock[0])
+
+    def run():
+        topic_index.update_topic(topic_index.get_topic(20).uuid, get_row)
+        topic_index.get_pages(packet_packer, 180)
+    return run
+
+@benchmark("bbs_db.get_all_posts")
+def bench_bbs_db_get_all_posts(args):
+    from utils.bbs_db import BBSDB
+    bbs_db = BBSDB()
+    topic_id = make_topic(bbs_db, "get_all_posts benchmark", args.posts)
+    return lambda: bbs_db.get_all_posts(topic_id)
+
+@benchmark("bbs_db.get_post_window")
+def bench_bbs_db_get_post_window(args):
+    from utils.bbs_db import BBSDB
+    bbs_db = BBSDB()
+    topic_id = make_topic(bbs_db, "get_post_window benchmark", args.posts)
+
+    def run():
+        window = bbs_db.get_post_window(topic_id, args.posts // 2)
+        bbs_db.load_post(topic_id, window[len(window) // 2])
+    return run
+
+@benchmark("bbs_db.get_post_count")
+def bench_bbs_db_get_post_count(args):
+    from utils.bbs_db import BBSDB
+    bbs_db = BBSDB()
+    topic_id = make_topic(bbs_db, "get_post_count benchmark", args.posts)
+    return lambda: bbs_db.get_post_count(topic_id)
+
+@benchmark("user_db.user_authenticate")
+def bench_user_db_user_authenticate(args):
+    from utils.user_db import UserDB
+    user_db = UserDB()
+    user_db.user_register("benchuser", "benchpassword")
+    return lambda: user_db.user_authenticate("benchuser", "benchpassword")
+
+'''
+Menu.start benchmarks are registered for every menu in config.toml
+'''
+def register_menu_benchmarks() -> None:
+    from utils.config import config
+    for menu_config in config["menus"]:
+        def setup(args, menu_config=menu_config):
+            from contexts.menu import Menu
+            menu = Menu(make_session(), menu_config)
+            return menu.start
+        benchmarks[f"menu.start.{menu_config['name']}"] = setup
+
+'''
+Time func. Returns the number of loops per repeat and the per-call time of each repeat.
+'''
+def measure(func, repeats: int) -> tuple:
+    # Find a loop count that runs for at least MIN_REPEAT_TIME
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(0, loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_REPEAT_TIME:
+            break
+        loops *= 10 if elapsed < MIN_REPEAT_TIME / 10 else 2
+
+    times = []
+    for r in range(0, repeats):
+        start = time.perf_counter()
+        for i in range(0, loops):
+            func()
+        times.append((time.perf_counter() - start) / loops)
+    return loops, times
+
+'''
+Build the JSON report. Times are seconds per call.
+'''
+def get_report(results: dict, args) -> dict:
+    return {
+        "schema": SCHEMA_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "topics": args.topics,
+            "posts": args.posts
+        },
+        "benchmarks": {
+            name: {
+                "loops": loops,
+                "repeats": len(times),
+                "min": min(times),
+                "median": statistics.median(times),
+                "max": max(times)
+            } for name, (loops, times) in sorted(results.items())
+        }
+    }
+
+'''
+Compare a report against a baseline report. Prints a table and returns the names of benchmarks which regressed.
+'''
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    print(f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in report["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            print(f"{name:<40} {'-':>12} {format_time(result['median']):>12} {'new':>8}")
+            continue
+
+        old = baseline["benchmarks"][name]["median"]
+        change = (result["median"] - old) / old
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        print(f"{name:<40} {format_time(old):>12} {format_time(result['median']):>12} {change:>+8.1%}{flag}")
+    return regressions
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * scale >= 1:
+            return f"{seconds * scale:.3f}{unit}"
+    return f"{seconds * 1e9:.1f}ns"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run MBBS microbenchmarks.")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of timed repeats per benchmark")
+    parser.add_argument("--topics", type=int, default=10000, help="Number of topics for the topic listing benchmark")
+    parser.add_argument("--posts", type=int, default=50000, help="Number of posts for the post query benchmarks")
+    parser.add_argument("--output", help="Save results to this file as JSON")
+    parser.add_argument("--baseline", help="Compare results against a JSON file saved with --output")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown (0.10 = 10%%) that counts as a regression")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_file = os.path.abspath(args.baseline) if args.baseline else None
+
+    # config.toml is loaded on import, so import everything from the repository root before switching to a scratch directory
+    import contexts.menu, contexts.message_pager, contexts.bbs_main, utils.user_session
+    register_menu_benchmarks()
+    os.chdir(tempfile.mkdtemp(prefix="mbbs-bench-"))
+    os.mkdir("data")
+
+    results = {}
+    for name, setup in benchmarks.items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(setup(args), args.repeats)
+        loops, times = results[name]
+        print(f"{name:<40} {format_time(statistics.median(times)):>12} per call ({loops} loops x {len(times)})")
+
+    report = get_report(results, args)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if baseline_file:
+        with open(baseline_file, "r") as f:
+            baseline = json.load(f)
+        print()
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
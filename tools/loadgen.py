@@ -0,0 +1,434 @@
+import argparse
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import toml
+
+'''
+Load generator for MBBS.
+
+Drives virtual users through scripted flows (login, BBS browsing, multiplayer tic tac toe, etc) and reports per-step response
+latency percentiles, packets and bytes per flow, and error rates. Flows are defined in a scenario file. See
+tools/scenarios/smoke.toml for an example.
+
+Two transports are supported:
+
+--tcp host:port   Connect to a running mbbs.py through its TCP server interface.
+--sim             Start the BBS in this process behind a simulated Meshtastic radio ([interface_mesh_sim] in config.toml). Virtual
+                  users are virtual nodes on the simulated mesh, so latency, loss and airtime limits apply.
+
+Run from the repository root so config.toml is found, for example:
+    python -m tools.loadgen tools/scenarios/smoke.toml --tcp 127.0.0.1:5050 --json results.json
+'''
+
+CONNECT_BACKOFF_START = 0.5     # Seconds a virtual user waits after its first failed connect
+CONNECT_BACKOFF_MAX = 10        # Longest wait between failed connects
+MAX_CONNECT_FAILURES = 20       # Failed connects in a row, across all virtual users, before the run is aborted
+
+'''
+Raised when a virtual user can't connect to the BBS
+'''
+class ConnectError(Exception):
+    pass
+
+'''
+Base class for a virtual user's connection to the BBS.
+'''
+class Transport():
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.received = ""          # Text received since the last send()
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.disconnected = False   # Set once the BBS has closed the connection
+
+    '''
+    Send one message to the BBS. Anything received before now is discarded.
+    '''
+    def send(self, text: str) -> None:
+        with self.condition:
+            self.received = ""
+            self.packets_sent += 1
+            self.bytes_sent += len(text.encode("utf-8"))
+        self.send_raw(text)
+
+    def send_raw(self, text: str) -> None:
+        pass
+
+    '''
+    Called by the transport whenever a message from the BBS arrives.
+    '''
+    def on_message(self, text: str) -> None:
+        with self.condition:
+            self.received += text
+            self.packets_received += 1
+            self.bytes_received += len(text.encode("utf-8"))
+            self.condition.notify_all()
+
+    '''
+    Called by the transport when the BBS closes the connection
+    '''
+    def on_disconnect(self) -> None:
+        with self.condition:
+            self.disconnected = True
+            self.condition.notify_all()
+
+    '''
+    Wait until the text received since the last send() matches pattern. Returns False on timeout or if the connection is closed.
+    '''
+    def wait_for(self, pattern: re.Pattern, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not pattern.search(self.received):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.disconnected:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        pass
+
+'''
+Talks to a running BBS through the TCP server interface. The TCP interface strips the last character of every message, so each
+message is terminated with a newline like a terminal would.
+'''
+class TCPTransport(Transport):
+    def __init__(self, host: str, port: int) -> None:
+        super().__init__()
+        self.sock = socket.create_connection((host, port))
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def send_raw(self, text: str) -> None:
+        self.sock.sendall(f"{text}\n".encode("utf-8"))
+
+    def read(self) -> None:
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except OSError:
+                data = b""
+            if not data:
+                self.on_disconnect()
+                return
+            self.on_message(data.decode("utf-8", errors="replace"))
+
+    def close(self) -> None:
+        self.sock.close()
+
+'''
+A virtual node on the simulated radio
+'''
+class SimTransport(Transport):
+    def __init__(self, radio: "SimulatedRadio", node_num: int) -> None:
+        super().__init__()
+        self.radio = radio
+        self.node = radio.get_node(node_num)
+        self.node.on_message = lambda node, text: self.on_message(text)
+
+    def send_raw(self, text: str) -> None:
+        self.radio.node_send(self.node.node_num, text)
+
+    def close(self) -> None:
+        self.node.on_message = None
+
+'''
+Collects results from all flows
+'''
+class Results():
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.steps = {}     # {(flow, step): {"latencies": [], "errors": 0}}
+        self.flows = {}     # {flow: {"runs": 0, "errors": 0, "packets": 0, "bytes": 0}}
+
+    def record_step(self, flow: str, step: str, latency: float, ok: bool) -> None:
+        with self.lock:
+            stats = self.steps.setdefault((flow, step), {"latencies": [], "errors": 0})
+            if ok:
+                stats["latencies"].append(latency)
+            else:
+                stats["errors"] += 1
+
+    def record_flow(self, flow: str, ok: bool, packets: int, size: int) -> None:
+        with self.lock:
+            stats = self.flows.setdefault(flow, {"runs": 0, "errors": 0, "packets": 0, "bytes": 0})
+            stats["runs"] += 1
+            stats["packets"] += packets
+            stats["bytes"] += size
+            if not ok:
+                stats["errors"] += 1
+
+    '''
+    Summarize results as a dict which can be written as JSON
+    '''
+    def get_report(self, duration: float) -> dict:
+        report = {"duration": round(duration, 3), "flows": {}, "steps": {}}
+        for flow, stats in sorted(self.flows.items()):
+            runs = stats["runs"]
+            report["flows"][flow] = {
+                "runs": runs,
+                "error_rate": round(stats["errors"] / runs, 4),
+                "packets_per_flow": round(stats["packets"] / runs, 2),
+                "bytes_per_flow": round(stats["bytes"] / runs, 2),
+                "flows_per_second": round(runs / duration, 3)
+            }
+        for (flow, step), stats in sorted(self.steps.items()):
+            latencies = sorted(stats["latencies"])
+            attempts = len(latencies) + stats["errors"]
+            report["steps"][f"{flow}.{step}"] = {
+                "count": attempts,
+                "error_rate": round(stats["errors"] / attempts, 4),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99)
+            }
+        return report
+
+'''
+Nearest-rank percentile of a sorted list. Returns None for an empty list.
+'''
+def percentile(values: list, p: int) -> float:
+    if not values:
+        return None
+    index = max(0, int(len(values) * p / 100 + 0.5) - 1)
+    return round(values[min(index, len(values) - 1)], 4)
+
+'''
+Runs scripted flows for virtual users
+'''
+class LoadGenerator():
+    def __init__(self, scenario: dict, make_transport) -> None:
+        self.settings = scenario.get("settings", {})
+        self.flows = scenario["flows"]
+        self.make_transport = make_transport            # make_transport(user_number) returns a new Transport
+        self.results = Results()
+        self.locks = {}                                 # Named locks used by steps with hold_lock/release_lock
+        self.locks_lock = threading.Lock()
+        self.run_id = f"{random.randint(0, 99999):05d}"  # Keeps usernames unique across runs
+        self.user_counter = 0
+        self.counter_lock = threading.Lock()
+        self.connect_failures = 0                       # Failed connects in a row
+        self.aborted = None                             # Why the run was aborted, if it was
+        self.abort_event = threading.Event()            # Set when the run is aborted, to wake virtual users backing off
+
+    def get_lock(self, name: str) -> threading.Lock:
+        with self.locks_lock:
+            return self.locks.setdefault(name, threading.Lock())
+
+    def next_user_number(self) -> int:
+        with self.counter_lock:
+            self.user_counter += 1
+            return self.user_counter
+
+    '''
+    Connect a new virtual user. Raises ConnectError if the BBS can't be reached.
+    '''
+    def connect(self, number: int) -> Transport:
+        try:
+            transport = self.make_transport(number)
+        except OSError as e:
+            with self.counter_lock:
+                self.connect_failures += 1
+                if self.connect_failures >= self.settings.get("max_connect_failures", MAX_CONNECT_FAILURES) and not self.aborted:
+                    self.aborted = f"{self.connect_failures} connects in a row failed. Last error: {str(e)}"
+                    self.abort_event.set()
+            raise ConnectError(str(e))
+
+        with self.counter_lock:
+            self.connect_failures = 0
+        return transport
+
+    '''
+    Make sure the BBS can be reached before starting any virtual users. Raises ConnectError if it can't.
+    '''
+    def check_connection(self) -> None:
+        self.connect(self.next_user_number()).close()
+
+    '''
+    Run one flow once, start to finish. Returns True if every step succeeded.
+    '''
+    def run_flow(self, flow: dict) -> bool:
+        actors = []
+        try:
+            for i in range(0, flow.get("actors", 1)):
+                number = self.next_user_number()
+                actors.append({
+                    "transport": self.connect(number),
+                    "username": f"lg{self.run_id}u{number}",
+                    "password": f"pw{self.run_id}{number}"
+                })
+        except ConnectError:
+            for actor in actors:
+                actor["transport"].close()
+            raise
+
+        step_timeout = self.settings.get("step_timeout", 30)
+        think_time = self.settings.get("think_time", 0.2)
+        held = []
+        ok = True
+        try:
+            for step in flow["steps"]:
+                actor = actors[step.get("actor", 0)]
+                if "hold_lock" in step:
+                    lock = self.get_lock(step["hold_lock"])
+                    lock.acquire()
+                    held.append(lock)
+
+                text = step["send"].format(username=actor["username"], password=actor["password"], run=self.run_id)
+                start = time.monotonic()
+                actor["transport"].send(text)
+
+                if step.get("expect"):
+                    pattern = re.compile(step["expect"], re.IGNORECASE)
+                    step_ok = actor["transport"].wait_for(pattern, step_timeout)
+                    self.results.record_step(flow["name"], step["name"], time.monotonic() - start, step_ok)
+                    if not step_ok:
+                        received = actor["transport"].received[-200:]
+                        print(f"Step {flow['name']}.{step['name']} timed out. Last received: {received!r}", file=sys.stderr)
+                        ok = False
+                        break
+
+                if "release_lock" in step:
+                    lock = self.get_lock(step["release_lock"])
+                    held.remove(lock)
+                    lock.release()
+
+                time.sleep(think_time)
+        finally:
+            for lock in held:
+                lock.release()
+
+            packets = 0
+            size = 0
+            for actor in actors:
+                transport = actor["transport"]
+                packets += transport.packets_sent + transport.packets_received
+                size += transport.bytes_sent + transport.bytes_received
+                transport.close()
+            self.results.record_flow(flow["name"], ok, packets, size)
+
+        return ok
+
+    '''
+    Virtual user thread. Runs randomly chosen flows (by weight) until the deadline or until it has run iterations flows. After a
+    failed connect it waits before trying again, twice as long each time, and it stops if the run has been aborted.
+    '''
+    def run_user(self, deadline: float, iterations: int) -> None:
+        weights = [flow.get("weight", 1) for flow in self.flows]
+        count = 0
+        backoff = CONNECT_BACKOFF_START
+        while time.monotonic() < deadline and (not iterations or count < iterations) and not self.aborted:
+            flow = random.choices(self.flows, weights=weights)[0]
+            try:
+                self.run_flow(flow)
+                backoff = CONNECT_BACKOFF_START
+            except ConnectError as e:
+                print(f"Flow {flow['name']} could not connect: {str(e)}", file=sys.stderr)
+                self.results.record_flow(flow["name"], False, 0, 0)
+                self.abort_event.wait(max(0, min(backoff, deadline - time.monotonic())))
+                backoff = min(backoff * 2, CONNECT_BACKOFF_MAX)
+            except Exception as e:
+                print(f"Flow {flow['name']} failed: {str(e)}", file=sys.stderr)
+                self.results.record_flow(flow["name"], False, 0, 0)
+            count += 1
+
+    '''
+    Start all virtual users, ramping them up evenly, and wait for them to finish. Returns the report. Raises ConnectError if the
+    BBS can't be reached at the start. If too many connects fail in a row during the run, self.aborted says why.
+    '''
+    def run(self) -> dict:
+        users = self.settings.get("users", 10)
+        ramp_up = self.settings.get("ramp_up", 5)
+        duration = self.settings.get("duration", 60)
+        iterations = self.settings.get("iterations", 0)
+
+        self.check_connection()
+
+        start = time.monotonic()
+        deadline = start + duration
+        threads = []
+        for i in range(0, users):
+            if self.aborted:
+                break
+            thread = threading.Thread(target=self.run_user, args=(deadline, iterations), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(ramp_up / users)
+
+        for thread in threads:
+            thread.join()
+
+        return self.results.get_report(time.monotonic() - start)
+
+'''
+Start the BBS in this process behind a simulated radio and return a function which makes transports for it.
+'''
+def start_simulated_bbs(overrides: dict):
+    from utils.config import config
+    sim_config = config.setdefault("interface_mesh_sim", {})
+    sim_config.update(overrides)
+    sim_config["nodes"] = 0
+
+    # Imported here so the overrides above are in place before the interface modules read their config
+    from interfaces.comm_interface_meshtastic_sim import CommInterfaceMeshtasticSim, FIRST_VIRTUAL_NODE_NUM
+    sim_interface = CommInterfaceMeshtasticSim(config["main"]["radio_channel_index"])
+
+    def make_transport(number: int) -> Transport:
+        return SimTransport(sim_interface.interface, FIRST_VIRTUAL_NODE_NUM + number)
+    return make_transport
+
+'''
+Print the report as a table
+'''
+def print_report(report: dict) -> None:
+    print(f"Duration: {report['duration']}s")
+    print(f"{'flow':<30} {'runs':>6} {'errors':>8} {'pkts/flow':>10} {'bytes/flow':>11} {'flows/s':>8}")
+    for flow, stats in report["flows"].items():
+        print(f"{flow:<30} {stats['runs']:>6} {stats['error_rate']:>8.2%} {stats['packets_per_flow']:>10} {stats['bytes_per_flow']:>11} {stats['flows_per_second']:>8}")
+    print()
+    print(f"{'step':<45} {'count':>6} {'errors':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for step, stats in report["steps"].items():
+        values = [f"{stats[p]:>8.3f}" if stats[p] != None else f"{'-':>8}" for p in ("p50", "p95", "p99")]
+        print(f"{step:<45} {stats['count']:>6} {stats['error_rate']:>8.2%} {' '.join(values)}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drive virtual users through scripted MBBS flows and report latency percentiles.")
+    parser.add_argument("scenario", help="Path to a scenario TOML file")
+    parser.add_argument("--tcp", help="host:port of a running BBS's TCP server interface")
+    parser.add_argument("--sim", action="store_true", help="Run the BBS in-process behind a simulated Meshtastic radio")
+    parser.add_argument("--json", help="Write the report to this file as JSON")
+    args = parser.parse_args()
+
+    with open(args.scenario, "r") as f:
+        scenario = toml.loads(f.read())
+
+    if args.tcp:
+        host, port = args.tcp.rsplit(":", 1)
+        make_transport = lambda number: TCPTransport(host, int(port))
+    elif args.sim:
+        make_transport = start_simulated_bbs(scenario.get("sim", {}))
+    else:
+        parser.error("Either --tcp or --sim is required")
+
+    generator = LoadGenerator(scenario, make_transport)
+    try:
+        report = generator.run()
+    except ConnectError as e:
+        print(f"Could not connect to the BBS: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if generator.aborted:
+        print(f"Run aborted: {generator.aborted}", file=sys.stderr)
+        sys.exit(1)
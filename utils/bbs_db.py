@@ -1,33 +1,135 @@
+import re
 import sqlite3
+import threading
+import time
 import uuid
 from utils.config import config
-from utils.bbs_utils import Topic, Post
+from utils.db import get_database
+from utils.log import logger
+from utils.bbs_utils import Topic, Post, PostHeader
+from utils.topic_index import topic_index
 
 '''
 Manages database for BBS functionality
+
+All posts are kept in one posts table. Each post has a seq, its number within its topic (1 for the first post, counting up), and
+posts are indexed by topic and seq, so post k of a topic, or a window of posts around it, is an index lookup however big the topic
+is. Readers get PostHeader objects for browsing and load a post's content only when it is shown (see load_post()). Topics are listed
+a page at a time, newest first, each page starting after the (last_modified, uuid) of the last topic on the one before.
+
+Older versions of MBBS created a topic_<uuid> table for every topic. Those tables are migrated into the posts table by
+`python -m tools.bbs_admin migrate`, in small batches so the BBS can keep running. Any topic which hasn't been migrated yet is
+migrated on its own the first time it is read or posted to (see ensure_migrated()). Migrated topics are recorded in the
+legacy_migrations table.
+
+Each topic row also holds the topic's post count, last author and last post time. They are updated in the same transaction as every
+new post, so counting a topic's posts or showing its stats never reads the posts themselves. If they ever drift (a crash during
+migration, posts edited by hand), `python -m tools.bbs_admin recount` recalculates them.
+
+New, changed and migrated topics are passed on to the shared topic index (utils/topic_index.py) once they are committed. Changes
+to the stats of many topics at once (recounts, including the one which ends a migration) also bump the topics_version in the
+bbs_meta table, which tells the topic index of every process using the database to reload.
+
+Topic titles and post contents are also kept in search_index, an SQLite FTS5 full-text index, which is written in the same
+transaction as the topic or post (and as each batch of migrated posts). search() returns the best matches first. The index is built
+from the existing topics and posts when it is first created, and `python -m tools.bbs_admin reindex` rebuilds it from scratch. If
+SQLite was built without FTS5, search() falls back to a slow LIKE scan of titles and posts.
 '''
 
+MIGRATION_BATCH_SIZE = 1000                         # Posts moved per transaction by migrate_topic()
+RECOUNT_BATCH_SIZE = 500                            # Topics recounted per transaction by recount_topics()
+POST_WINDOW_RADIUS = 5                              # Posts fetched either side of the one asked for by get_post_window()
+LEGACY_TABLE = re.compile(r"topic_[0-9a-f]{32}")     # Name of an old per-topic table
+
+legacy_topics = set()           # Topic ids which still had a topic_<uuid> table when the database was opened
+legacy_topics_lock = threading.Lock()
+fts5_available = False          # True if the search_index table could be created. Set when the database is opened.
+
 class BBSDB():
     def __init__(self):
         self.db_file = f"data/{config["bbs"]["database"]}"
-        self.con = sqlite3.connect(self.db_file)
-        self.cursor = self.con.cursor()
-        self.initialize_database()
+        self.database = get_database(self.db_file)
+        self.database.initialize("bbs", self.initialize_database)
+
+    '''
+    This thread's connection and cursor for the database. Connections are shared and managed by utils/db.py.
+    '''
+    @property
+    def con(self) -> sqlite3.Connection:
+        return self.database.get_connection()
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        return self.database.get_cursor()
 
     '''
-    Create the topics table if it hasn't yet been created.
+    Create the topics and posts tables if they haven't yet been created, and find any topics still in old topic_<uuid> tables.
     '''
     def initialize_database(self) -> None:
         self.cursor.execute('''
         CREATE TABLE IF NOT EXISTS topics(
             uuid CHAR(32) PRIMARY KEY NOT NULL, 
             title TEXT NOT NULL, 
-            last_modified DATETIME NOT NULL
+            last_modified DATETIME NOT NULL,
+            post_count INTEGER NOT NULL DEFAULT 0,
+            last_author TEXT,
+            last_post_time DATETIME
         );
         ''')
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS posts(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id CHAR(32) NOT NULL,
+            seq INTEGER NOT NULL,
+            author TEXT NOT NULL,
+            timestamp DATETIME NOT NULL,
+            content TEXT NOT NULL
+        );
+        ''')
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bbs_meta(
+            name TEXT PRIMARY KEY NOT NULL,
+            value INTEGER NOT NULL
+        );
+        ''')
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS legacy_migrations(
+            topic_id CHAR(32) PRIMARY KEY NOT NULL,
+            posts INTEGER NOT NULL,
+            migrated_at DATETIME NOT NULL
+        );
+        ''')
+
+        self.cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS posts_topic_seq ON posts(topic_id, seq)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS topics_recent ON topics(last_modified DESC, uuid DESC)")
 
+        # Databases created before topic stats existed need the columns added, and then filled in
+        columns = [column[1] for column in self.cursor.execute("PRAGMA table_info(topics)").fetchall()]
+        if "post_count" not in columns:
+            self.cursor.execute("ALTER TABLE topics ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0")
+            self.cursor.execute("ALTER TABLE topics ADD COLUMN last_author TEXT")
+            self.cursor.execute("ALTER TABLE topics ADD COLUMN last_post_time DATETIME")
+            self.con.commit()
+            for topic_ids in self.get_topic_id_batches():
+                self.recount_topics(topic_ids)
         self.con.commit()
 
+        # Full-text search index of topic titles (post_id NULL) and post contents
+        global fts5_available
+        exists = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_index'").fetchone()
+        try:
+            self.cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(text, topic_id UNINDEXED, post_id UNINDEXED)")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search isn't available, so searches will be slow: {str(e)}")
+        else:
+            fts5_available = True
+            if not exists:
+                self.rebuild_search_index()
+        self.con.commit()
+
+        with legacy_topics_lock:
+            legacy_topics.update(self.get_legacy_topics())
+
     '''
     Create Topic
     '''
@@ -37,89 +139,116 @@ class BBSDB():
         if not self.add_topic_to_list(topic_id, topic_name, timestamp):
             return False
 
-        if not self.create_topic_table(topic_id):
-            return False
-
         return True
         
     '''
-    Try to create a new DB table for this topic. If it fails, we can detect the error here
+    Try to add the topic to the list of topics
     '''
     def add_topic_to_list(self, topic_id: str, topic_name: str, timestamp: int) -> bool:
         try:
-            self.cursor.execute('''
-            INSERT INTO topics
-            VALUES
-            (?, ?, ?)
-            ''', (topic_id, topic_name, timestamp))
+            with self.con:
+                self.cursor.execute('''
+                INSERT INTO topics (uuid, title, last_modified)
+                VALUES
+                (?, ?, ?)
+                ''', (topic_id, topic_name, timestamp))
+                if fts5_available:
+                    self.cursor.execute("INSERT INTO search_index (text, topic_id, post_id) VALUES (?, ?, NULL)", (topic_name, topic_id))
         except Exception as e:
             return False
-        self.con.commit()
+        topic_index.update_topic(topic_id, self.get_topic)
 
         return True
 
     '''
-    Try to add the topic to the list of topics
+    Create a new post to a topic. The post and the topic's new timestamp and stats are saved in one transaction. Returns False if the
+    topic doesn't exist.
     '''
-    def create_topic_table(self, topic_id: str) -> bool:
-        table_name = f"topic_{topic_id}"
+    def create_post(self, topic_id: str, content: str, username: str, datetime: int) -> bool:
+        self.ensure_migrated(topic_id)
+
         try:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS '''
-            + table_name + '''(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                content TEXT NOT NULL,
-                author TEXT NOT NULL,
-                timestamp DATETIME NOT NULL
-            );
-            ''')
+            with self.con:
+                # Update topic table with new timestamp and stats. If no topic was updated, there is no topic to post to.
+                self.cursor.execute('''
+                UPDATE topics
+                SET last_modified = ?, post_count = post_count + 1, last_author = ?, last_post_time = ?
+                WHERE uuid = ?;
+                ''', (datetime, username, datetime, topic_id))
+                if self.cursor.rowcount == 0:
+                    return False
+
+                self.cursor.execute('''
+                INSERT INTO posts (topic_id, seq, author, timestamp, content)
+                SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM posts
+                WHERE topic_id = ?
+                ''', (topic_id, username, datetime, content, topic_id))
+                if fts5_available:
+                    self.cursor.execute("INSERT INTO search_index (text, topic_id, post_id) VALUES (?, ?, ?)",
+                                        (content, topic_id, self.cursor.lastrowid))
         except Exception as e:
             return False
-        
+
+        topic_index.update_topic(topic_id, self.get_topic)
         return True
 
     '''
-    Create a new post to a topic.
+    Retrieve a list of topics
     '''
-    def create_post(self, topic_id: str, content: str, username: str, datetime: int) -> bool:
-        table_name = f"topic_{topic_id}"
+    def list_topics(self) -> list:
+        topics = list()
 
-        # Add post to topic table
         try:
             self.cursor.execute('''
-            INSERT INTO '''
-            + table_name + 
-            ''' VALUES
-            (null, ?, ?, ?)
-            ''', (content, username, datetime))
-        except Exception as e:
-            return False
-        self.con.commit()
+            SELECT uuid, title, last_modified, post_count, last_author, last_post_time from topics
+            ORDER BY last_modified DESC, uuid DESC;
+            ''')
+        except:
+            pass
+        else:
+            topics = self.cursor.fetchall()
+        
+        return topics
+
+    '''
+    Retrieve one topic by its id, as a row like those from list_topics(). Returns None if there's no such topic.
+    '''
+    def get_topic(self, topic_id: str) -> tuple:
+        result = None
 
-        # Update topic table with new timestamp
         try:
             self.cursor.execute('''
-            UPDATE topics
-            SET 'last_modified' = ?
-            WHERE uuid LIKE ?;
-            ''', (datetime, topic_id))
-        except Exception as e:
-            return False
-        self.con.commit()
+            SELECT uuid, title, last_modified, post_count, last_author, last_post_time from topics
+            WHERE uuid = ?;
+            ''', (topic_id,))
+        except:
+            pass
+        else:
+            result = self.cursor.fetchone()
         
-        return True
+        return result
 
     '''
-    Retrieve a list of topics
+    Retrieve up to limit topics, newest first, starting after the topic at cursor, a (last_modified, uuid) pair. A cursor of None
+    starts from the newest topic. Rows are the same as list_topics().
     '''
-    def list_topics(self) -> list:
+    def list_topics_page(self, cursor: tuple, limit: int) -> list:
         topics = list()
 
         try:
-            self.cursor.execute('''
-            SELECT * from topics
-            ORDER BY last_modified DESC;
-            ''')
+            if cursor == None:
+                self.cursor.execute('''
+                SELECT uuid, title, last_modified, post_count, last_author, last_post_time from topics
+                ORDER BY last_modified DESC, uuid DESC
+                LIMIT ?;
+                ''', (limit,))
+            else:
+                self.cursor.execute('''
+                SELECT uuid, title, last_modified, post_count, last_author, last_post_time from topics
+                WHERE (last_modified, uuid) < (?, ?)
+                ORDER BY last_modified DESC, uuid DESC
+                LIMIT ?;
+                ''', (*cursor, limit))
         except:
             pass
         else:
@@ -128,17 +257,32 @@ class BBSDB():
         return topics
 
     '''
-    Retrieve a post
+    Get number of topics
+    '''
+    def get_topic_count(self) -> int:
+        result = 0
+
+        try:
+            self.cursor.execute("SELECT COUNT(*) from topics;")
+        except:
+            pass
+        else:
+            result = self.cursor.fetchone()[0]
+        
+        return result
+
+    '''
+    Retrieve a post by its id. Returns a (id, content, author, timestamp) tuple, or None.
     '''
     def get_post(self, topic_id: str, post_id: int) -> tuple:
-        table_name = f"topic_{topic_id}"
-        result = tuple()
+        self.ensure_migrated(topic_id)
+        result = None
 
         try:
             self.cursor.execute('''
-            SELECT * from ?
-            WHERE uuid = ?;
-            ''', (table_name, post_id))
+            SELECT id, content, author, timestamp from posts
+            WHERE id = ? AND topic_id = ?;
+            ''', (post_id, topic_id))
         except:
             pass
         else:
@@ -147,38 +291,98 @@ class BBSDB():
         return result
 
     '''
-    Get number of posts in a topic
+    Get number of posts in a topic. Read from the topic's stats.
     '''
     def get_post_count(self, topic_id: str) -> int:
-        table_name = f"topic_{topic_id}"
+        self.ensure_migrated(topic_id)
         result = 0
 
         try:
             self.cursor.execute('''
-            SELECT * from '''
-            + table_name +
-            ''';''')
+            SELECT post_count from topics
+            WHERE uuid = ?;
+            ''', (topic_id,))
+        except:
+            pass
+        else:
+            row = self.cursor.fetchone()
+            if row:
+                result = row[0]
+        
+        return result
+
+    '''
+    Get the seq of the newest post in a topic, which is also the number of posts in it. Returns 0 if the topic is empty.
+    '''
+    def get_latest_seq(self, topic_id: str) -> int:
+        self.ensure_migrated(topic_id)
+        result = 0
+
+        try:
+            self.cursor.execute('''
+            SELECT MAX(seq) from posts
+            WHERE topic_id = ?;
+            ''', (topic_id,))
+        except:
+            pass
+        else:
+            result = self.cursor.fetchone()[0] or 0
+        
+        return result
+
+    '''
+    Get the headers of the posts in a topic from seq - radius to seq + radius, newest first. Post contents are not loaded.
+    '''
+    def get_post_window(self, topic_id: str, seq: int, radius: int=POST_WINDOW_RADIUS) -> list:
+        self.ensure_migrated(topic_id)
+        result = list()
+
+        try:
+            self.cursor.execute('''
+            SELECT id, seq, author, timestamp from posts
+            WHERE topic_id = ? AND seq BETWEEN ? AND ?
+            ORDER BY seq DESC;
+            ''', (topic_id, seq - radius, seq + radius))
         except:
             pass
         else:
-            posts = self.cursor.fetchall()
-            result = len(posts)
+            result = [PostHeader(*entry) for entry in self.cursor.fetchall()]
         
         return result
 
     '''
-    Get specific post from topic:
+    Load the content of a post from its header. Returns a Post, or None if the post is gone.
+    '''
+    def load_post(self, topic_id: str, header: PostHeader) -> Post:
+        result = None
+
+        try:
+            self.cursor.execute('''
+            SELECT content from posts
+            WHERE id = ? AND topic_id = ?;
+            ''', (header.id, topic_id))
+        except:
+            pass
+        else:
+            row = self.cursor.fetchone()
+            if row:
+                result = Post(header.id, row[0], header.author, header.last_modified)
+        
+        return result
+
+    '''
+    Get all posts from a topic, newest first
     '''
     def get_all_posts(self, topic_id: str) -> list:
-        table_name = f"topic_{topic_id}"
+        self.ensure_migrated(topic_id)
         result = list()
 
         try:
             self.cursor.execute('''
-            SELECT * from '''
-            + table_name + 
-            ''' ORDER BY timestamp DESC;
-            ''')
+            SELECT id, content, author, timestamp from posts
+            WHERE topic_id = ?
+            ORDER BY seq DESC;
+            ''', (topic_id,))
         except:
             pass
         else:
@@ -194,19 +398,202 @@ class BBSDB():
     Get newest post from topic
     '''
     def get_newest_post(self, topic_id: str) -> tuple:
-        table_name = f"topic_{topic_id}"
-        result = tuple()
+        self.ensure_migrated(topic_id)
+        result = None
 
         try:
             self.cursor.execute('''
-            SELECT * from '''
-            + table_name + 
-            ''' ORDER BY 'datetime' DESC
+            SELECT id, content, author, timestamp from posts
+            WHERE topic_id = ?
+            ORDER BY seq DESC
             LIMIT 1;
-            ''')
+            ''', (topic_id,))
         except Exception as e:
             pass
         else:
             result = self.cursor.fetchone()
         
-        return result
\ No newline at end of file
+        return result
+
+    '''
+    Returns the ids of topics which still have an old topic_<uuid> table
+    '''
+    def get_legacy_topics(self) -> list:
+        rows = self.cursor.execute('''
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name LIKE 'topic_%'
+        ''').fetchall()
+        return [row[0][len("topic_"):] for row in rows if LEGACY_TABLE.fullmatch(row[0])]
+
+    '''
+    Migrate a topic before using it, if it is still in an old topic_<uuid> table
+    '''
+    def ensure_migrated(self, topic_id: str) -> None:
+        if topic_id not in legacy_topics:
+            return
+        while self.migrate_topic(topic_id) > 0:
+            pass
+
+    '''
+    Move up to batch_size of a topic's oldest posts from its old topic_<uuid> table into the posts table, in one transaction. Once the
+    old table is empty it is dropped and the topic is recorded in legacy_migrations. Returns the number of posts moved. Safe to run
+    again, or from several threads or processes at once.
+    '''
+    def migrate_topic(self, topic_id: str, batch_size: int=MIGRATION_BATCH_SIZE) -> int:
+        table_name = f"topic_{topic_id}"
+        if not LEGACY_TABLE.fullmatch(table_name):
+            raise ValueError(f"Not a topic table: {table_name}")
+
+        con = self.con
+        try:
+            con.execute("BEGIN IMMEDIATE")      # Take the write lock now, so two migrations of one topic can't interleave
+            with con:
+                ids = [row[0] for row in con.execute(f"SELECT id FROM {table_name} ORDER BY id LIMIT ?", (batch_size,))]
+                if ids:
+                    placeholders = ", ".join("?" * len(ids))
+                    last_seq = con.execute("SELECT COALESCE(MAX(seq), 0) FROM posts WHERE topic_id = ?", (topic_id,)).fetchone()[0]
+                    con.execute(f'''
+                    INSERT INTO posts (topic_id, seq, author, timestamp, content)
+                    SELECT ?, ? + ROW_NUMBER() OVER (ORDER BY id), author, timestamp, content FROM {table_name}
+                    WHERE id IN ({placeholders}) ORDER BY id
+                    ''', (topic_id, last_seq, *ids))
+                    if fts5_available:
+                        con.execute('''
+                        INSERT INTO search_index (text, topic_id, post_id)
+                        SELECT content, topic_id, id FROM posts
+                        WHERE topic_id = ? AND seq > ?
+                        ''', (topic_id, last_seq))
+                    con.execute(f"DELETE FROM {table_name} WHERE id IN ({placeholders})", ids)
+                else:
+                    migrated = con.execute("SELECT COUNT(*) FROM posts WHERE topic_id = ?", (topic_id,)).fetchone()[0]
+                    con.execute(f"DROP TABLE {table_name}")
+                    con.execute("INSERT OR REPLACE INTO legacy_migrations VALUES (?, ?, ?)", (topic_id, migrated, int(time.time())))
+                    self.recount(con, [topic_id])
+        except sqlite3.OperationalError as e:
+            if con.in_transaction:
+                con.rollback()
+            if "no such table" not in str(e):
+                raise
+            ids = []        # Someone else finished migrating this topic
+
+        if not ids:
+            with legacy_topics_lock:
+                legacy_topics.discard(topic_id)
+            topic_index.update_topic(topic_id, self.get_topic)
+        return len(ids)
+
+    '''
+    Returns the ids of all topics, in lists of up to batch_size
+    '''
+    def get_topic_id_batches(self, batch_size: int=RECOUNT_BATCH_SIZE) -> list:
+        topic_ids = [row[0] for row in self.cursor.execute("SELECT uuid FROM topics ORDER BY uuid").fetchall()]
+        return [topic_ids[i:i + batch_size] for i in range(0, len(topic_ids), batch_size)]
+
+    '''
+    Recalculate the post count, last author and last post time of some topics from their posts, in one transaction. Returns the
+    number of topics whose stats were wrong.
+    '''
+    def recount_topics(self, topic_ids: list) -> int:
+        con = self.con
+        with con:
+            drifted = self.recount(con, topic_ids)
+        if drifted:
+            topic_index.invalidate()
+        return drifted
+
+    '''
+    Recalculate topic stats within the caller's transaction, and bump the topics_version if any were wrong. See recount_topics().
+    '''
+    def recount(self, con: sqlite3.Connection, topic_ids: list) -> int:
+        placeholders = ", ".join("?" * len(topic_ids))
+        stats = f'''
+            SELECT uuid,
+                (SELECT COUNT(*) FROM posts WHERE topic_id = uuid) AS actual_count,
+                (SELECT author FROM posts WHERE topic_id = uuid ORDER BY seq DESC LIMIT 1) AS actual_author,
+                (SELECT timestamp FROM posts WHERE topic_id = uuid ORDER BY seq DESC LIMIT 1) AS actual_time
+            FROM topics WHERE uuid IN ({placeholders})
+        '''
+        drifted = con.execute(f'''
+            SELECT COUNT(*) FROM topics JOIN ({stats}) AS stats USING (uuid)
+            WHERE post_count != actual_count OR last_author IS NOT actual_author OR last_post_time IS NOT actual_time
+        ''', topic_ids).fetchone()[0]
+        con.execute(f'''
+            UPDATE topics SET (post_count, last_author, last_post_time) = (
+                SELECT actual_count, actual_author, actual_time FROM ({stats}) AS stats WHERE stats.uuid = topics.uuid
+            )
+            WHERE uuid IN ({placeholders})
+        ''', (*topic_ids, *topic_ids))
+        if drifted:
+            con.execute('''
+            INSERT INTO bbs_meta VALUES ('topics_version', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1
+            ''')
+        return drifted
+
+    '''
+    Returns the topics_version, which goes up whenever the stats of topics are changed in bulk (see recount()). 0 if they never have
+    been.
+    '''
+    def get_topics_version(self) -> int:
+        row = self.cursor.execute("SELECT value FROM bbs_meta WHERE name = 'topics_version'").fetchone()
+        return row[0] if row else 0
+
+    '''
+    Search topic titles and post contents for all of the words in query. Returns up to limit (topic_id, title, post seq, text) tuples,
+    best matches first. post seq is None for a topic title, and text is the title or a snippet of the post around the words found.
+    '''
+    def search(self, query: str, limit: int) -> list:
+        words = query.split()
+        if not words:
+            return list()
+        result = list()
+
+        try:
+            if fts5_available:
+                # Quote each word so punctuation can't be read as FTS5 syntax, and match words starting with it
+                match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+                self.cursor.execute('''
+                SELECT hits.topic_id, topics.title, posts.seq, hits.text FROM (
+                    SELECT topic_id, post_id, snippet(search_index, 0, '', '', '...', 8) AS text, rank FROM search_index
+                    WHERE search_index MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                ) AS hits
+                JOIN topics ON topics.uuid = hits.topic_id
+                LEFT JOIN posts ON posts.id = hits.post_id
+                ORDER BY hits.rank;
+                ''', (match, limit))
+            else:
+                pattern = "%" + query.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                self.cursor.execute('''
+                SELECT uuid, title, NULL, title FROM topics WHERE title LIKE ? ESCAPE '\\'
+                UNION ALL
+                SELECT * FROM (
+                    SELECT posts.topic_id, topics.title, posts.seq, posts.content FROM posts
+                    JOIN topics ON topics.uuid = posts.topic_id
+                    WHERE posts.content LIKE ? ESCAPE '\\'
+                    ORDER BY posts.timestamp DESC
+                )
+                LIMIT ?;
+                ''', (pattern, pattern, limit))
+        except Exception as e:
+            logger.error(f"Search for {query} failed: {str(e)}")
+        else:
+            result = self.cursor.fetchall()
+
+        return result
+
+    '''
+    Rebuild the search index from every topic and post, in one transaction. Returns the number of topics and posts indexed, or None
+    if full-text search isn't available.
+    '''
+    def rebuild_search_index(self) -> int:
+        if not fts5_available:
+            return None
+
+        con = self.con
+        with con:
+            con.execute("DELETE FROM search_index")
+            topics = con.execute("INSERT INTO search_index (text, topic_id, post_id) SELECT title, uuid, NULL FROM topics").rowcount
+            posts = con.execute("INSERT INTO search_index (text, topic_id, post_id) SELECT content, topic_id, id FROM posts").rowcount
+        return topics + posts
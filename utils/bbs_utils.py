@@ -1,16 +1,40 @@
 from datetime import datetime
 
 class Topic():
-    def __init__(self, uuid, title, last_modified):
+    def __init__(self, uuid, title, last_modified, post_count: int=0, last_author: str=None, last_post_time: int=None):
         self.uuid = uuid
         self.title = title
         self.last_modified = last_modified
+        self.post_count = post_count
+        self.last_author = last_author
+        self.last_post_time = last_post_time
         self.posts = list()
 
+    '''
+    Create a Topic from a (uuid, title, last_modified, post_count, last_author, last_post_time) row of the topics table
+    '''
+    @classmethod
+    def from_row(cls, row: tuple) -> "Topic":
+        uuid, title, last_modified_unixtime, post_count, last_author, last_post_time = row
+        last_modified = datetime.fromtimestamp(int(last_modified_unixtime)).strftime("%m-%d-%y %I:%M")
+        return cls(uuid, title, last_modified, post_count, last_author, last_post_time)
+
     def get_string(self, index: int) -> str:
-        str_topic = f"[{index}] ({self.last_modified}) {self.title}"
+        str_topic = f"[{index}] ({self.last_modified}) {self.title} ({self.post_count})"
         return str_topic
 
+'''
+A post without its content, for moving around a topic. The content is loaded with BBSDB.load_post() when the post is shown.
+'''
+class PostHeader():
+    __slots__ = ("id", "seq", "author", "last_modified")
+
+    def __init__(self, post_id: int, seq: int, author: str, last_modified: int):
+        self.id = post_id
+        self.seq = seq                      # Number of the post within its topic, 1 for the first post
+        self.author = author
+        self.last_modified = last_modified
+
 class Post():
     def __init__(self, post_id: int, content: str, author: str, last_modified: int):
         self.id = post_id
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+import weakref
+from utils.config import config
+from utils.log import logger
+from utils.metrics import metrics
+
+'''
+Shared SQLite connection manager used by all database classes (BBSDB, UserDB, TicTacToeMPDB, etc).
+
+Opening a SQLite connection means opening the file, reading the schema and applying settings, and the database classes used to do
+that every time a context or session was created. Instead, each database file has one Database object, and each thread gets its own
+connection to it the first time it uses it. Connections are kept for the life of the thread, so there are at most (threads x database
+files) connections, and connection setup is never on the request path once the BBS is warmed up. When a thread exits, its connections
+are closed, and the db.<file>.connections gauge counts the connections which are still open.
+
+Every connection is opened in WAL mode (readers don't block the writer), with the pragmas in PRAGMAS, and with a statement cache of
+STATEMENT_CACHE_SIZE prepared statements, so repeated queries skip parsing and planning.
+
+Settings can be overridden in the [database] stanza of config.toml.
+'''
+
+DATABASE_CONFIG = config.get("database", {})
+STATEMENT_CACHE_SIZE = DATABASE_CONFIG.get("statement_cache_size", 256)
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": DATABASE_CONFIG.get("synchronous", "NORMAL"),        # Safe with WAL, and much faster than FULL
+    "busy_timeout": DATABASE_CONFIG.get("busy_timeout", 5000),          # Milliseconds to wait for another connection's write lock
+    "cache_size": -DATABASE_CONFIG.get("cache_size_kb", 8192),          # Negative means KiB rather than pages
+    "temp_store": "MEMORY",
+}
+
+'''
+A thread's connection to a database and its cursor, kept in the Database's thread-local storage. When the thread exits, the storage is
+dropped and the connection is closed.
+'''
+class ThreadConnection():
+    def __init__(self, database: "Database", con: sqlite3.Connection) -> None:
+        self.con = con
+        self.cursor = con.cursor()
+        weakref.finalize(self, database.close_connection, con, threading.current_thread().name)
+
+class Database():
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self.local = threading.local()      # Holds this thread's ThreadConnection
+        self.lock = threading.Lock()
+        self.init_lock = threading.Lock()   # Held while a schema is being set up
+        self.initialized = set()            # Names of schemas which have been set up in this file
+        self.connections = 0
+
+    '''
+    Returns this thread's connection to the database, opening it if needed.
+    '''
+    def get_connection(self) -> sqlite3.Connection:
+        return self.get_thread_connection().con
+
+    '''
+    Returns this thread's cursor for the database.
+    '''
+    def get_cursor(self) -> sqlite3.Cursor:
+        return self.get_thread_connection().cursor
+
+    def get_thread_connection(self) -> ThreadConnection:
+        thread_connection = getattr(self.local, "connection", None)
+        if thread_connection == None:
+            # The connection is only used by this thread, but it is closed by whichever thread drops this thread's storage
+            con = sqlite3.connect(self.db_file, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+            for pragma, value in PRAGMAS.items():
+                con.execute(f"PRAGMA {pragma} = {value}")
+            thread_connection = ThreadConnection(self, con)
+            self.local.connection = thread_connection
+            with self.lock:
+                self.connections += 1
+                metrics.set_gauge(f"db.{self.db_file}.connections", self.connections)
+            logger.debug(f"Opened connection to {self.db_file} on {threading.current_thread().name}")
+        return thread_connection
+
+    '''
+    Close a connection whose thread has exited. Called when the thread's ThreadConnection is dropped.
+    '''
+    def close_connection(self, con: sqlite3.Connection, thread_name: str) -> None:
+        con.close()
+        with self.lock:
+            self.connections -= 1
+            metrics.set_gauge(f"db.{self.db_file}.connections", self.connections)
+        logger.debug(f"Closed connection to {self.db_file} from {thread_name}")
+
+    '''
+    Run setup_func() once per database file, no matter how many objects or threads use it. Used to create tables.
+    '''
+    def initialize(self, name: str, setup_func) -> None:
+        if name in self.initialized:
+            return
+        with self.init_lock:
+            if name in self.initialized:
+                return
+            setup_func()
+            self.initialized.add(name)
+
+databases = {}                  # {db_file: Database}
+databases_lock = threading.Lock()
+
+'''
+Returns the shared Database object for a database file
+'''
+def get_database(db_file: str) -> Database:
+    database = databases.get(db_file)
+    if database:
+        return database
+    with databases_lock:
+        return databases.setdefault(db_file, Database(db_file))
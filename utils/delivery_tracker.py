@@ -0,0 +1,236 @@
+import heapq
+import random
+import threading
+import time
+from collections import OrderedDict
+from utils.config import config
+from utils.log import logger
+from utils.metrics import metrics
+
+'''
+Tracks delivery of packets sent with wantAck=True.
+
+Every tracked send is recorded by packet id. The radio reports an ack or a nak for the packet through onAckNak(). If neither arrives
+within ack_timeout seconds, the send is recorded as a timeout. Replies which were nak'ed or timed out are retransmitted with
+exponential backoff, up to max_retries times. If the user has sent something new since the reply was sent, they have already moved
+past it, so the reply is dropped instead of retransmitted.
+
+Per-node delivery ratio and round trip time are kept for the most recently heard nodes and published as metrics.
+Settings are read from the [delivery] stanza in config.toml.
+'''
+
+DELIVERY_CONFIG = config.get("delivery", {})
+MAX_TRACKED_NODES = 1024
+
+RESULT_ACK = "ack"
+RESULT_NAK = "nak"
+RESULT_TIMEOUT = "timeout"
+
+'''
+A single packet that is waiting for an ack
+'''
+class Delivery():
+    def __init__(self, packet_id: int, destination, text: str, attempt: int, first_sent: float):
+        self.packet_id = packet_id
+        self.destination = destination
+        self.text = text
+        self.attempt = attempt              # 0 for the first transmission, 1 for the first retransmit, etc.
+        self.first_sent = first_sent        # When the first transmission of this text went to the radio
+        self.sent = time.monotonic()        # When this attempt went to the radio
+
+'''
+Delivery statistics for one node
+'''
+class NodeStats():
+    def __init__(self):
+        self.acks = 0
+        self.naks = 0
+        self.timeouts = 0
+        self.rtt = None     # Moving average of round trip time in seconds
+
+    def get_delivery_ratio(self) -> float:
+        total = self.acks + self.naks + self.timeouts
+        if total == 0:
+            return 0
+        return self.acks / total
+
+class DeliveryTracker():
+    '''
+    resend_func(text, destination, attempt, first_sent) is called when a packet must be retransmitted.
+    '''
+    def __init__(self, name: str, resend_func) -> None:
+        self.name = name
+        self.resend_func = resend_func
+        self.ack_timeout = DELIVERY_CONFIG.get("ack_timeout", 60)         # Seconds to wait for an ack/nak
+        self.max_retries = DELIVERY_CONFIG.get("max_retries", 2)          # Retransmits of a single reply
+        self.retry_backoff = DELIVERY_CONFIG.get("retry_backoff", 10)     # Seconds before the first retransmit. Doubles every attempt.
+
+        self.pending = {}                   # {packet_id: Delivery}
+        self.deadlines = []                 # Heap of (time, sequence, action, Delivery)
+        self.last_activity = OrderedDict()  # {destination: time the user last sent us something}, least recent first
+        self.node_stats = OrderedDict()     # {destination: NodeStats}, least recently updated first
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.running = True
+
+        self.thread = threading.Thread(target=self.run, name=f"DeliveryTracker-{name}", daemon=True)
+        self.thread.start()
+
+    '''
+    Start tracking a packet which was just handed to the radio.
+    '''
+    def track(self, packet_id: int, destination, text: str, attempt: int=0, first_sent: float=None) -> None:
+        if not packet_id:
+            return
+
+        delivery = Delivery(packet_id, destination, text, attempt, first_sent)
+        if delivery.first_sent == None:
+            delivery.first_sent = delivery.sent
+
+        with self.condition:
+            self.pending[packet_id] = delivery
+            self.schedule(delivery.sent + self.ack_timeout, self.on_timeout, delivery)
+            metrics.set_gauge(f"delivery.{self.name}.pending", len(self.pending))
+
+    '''
+    Response handler passed to sendText(onResponse=...). The Meshtastic library only passes acks to a response handler named
+    exactly 'onAckNak', which is why this method doesn't follow our naming conventions.
+    '''
+    def onAckNak(self, packet: dict) -> None:
+        decoded = packet.get("decoded", {})
+        packet_id = decoded.get("requestId")
+        error_reason = decoded.get("routing", {}).get("errorReason", "NONE")
+
+        with self.condition:
+            delivery = self.pending.pop(packet_id, None)
+            if not delivery:
+                return
+            metrics.set_gauge(f"delivery.{self.name}.pending", len(self.pending))
+
+            if error_reason == "NONE":
+                self.record_result(delivery, RESULT_ACK)
+            else:
+                logger.debug(f"Packet {packet_id} to {delivery.destination} was nak'ed: {error_reason}")
+                self.record_result(delivery, RESULT_NAK)
+                self.schedule_retry(delivery)
+
+    '''
+    Called when a user sends us something. Replies sent to this user before now are stale and won't be retransmitted.
+    '''
+    def user_activity(self, destination) -> None:
+        with self.condition:
+            self.last_activity.pop(destination, None)
+            self.last_activity[destination] = time.monotonic()
+            if len(self.last_activity) > MAX_TRACKED_NODES:
+                self.last_activity.popitem(last=False)
+
+    '''
+    Return delivery statistics for a node, or None if we haven't sent it anything recently.
+    '''
+    def get_node_stats(self, destination) -> NodeStats:
+        with self.condition:
+            return self.node_stats.get(destination)
+
+    '''
+    Stop the tracker thread
+    '''
+    def close(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    '''
+    Add an action to the deadline heap. Must be called with the condition held.
+    '''
+    def schedule(self, when: float, action, delivery: Delivery) -> None:
+        self.sequence += 1
+        heapq.heappush(self.deadlines, (when, self.sequence, action, delivery))
+        self.condition.notify()
+
+    '''
+    Schedule a retransmit with exponential backoff and some jitter. Must be called with the condition held.
+    '''
+    def schedule_retry(self, delivery: Delivery) -> None:
+        if delivery.attempt >= self.max_retries:
+            metrics.increment(f"delivery.{self.name}.failed")
+            logger.info(f"Giving up on packet {delivery.packet_id} to {delivery.destination} after {delivery.attempt + 1} attempts")
+            return
+
+        delay = self.retry_backoff * (2 ** delivery.attempt) * random.uniform(0.8, 1.2)
+        self.schedule(time.monotonic() + delay, self.on_retry, delivery)
+
+    '''
+    Update per-node statistics with the result of one attempt. Must be called with the condition held.
+    '''
+    def record_result(self, delivery: Delivery, result: str) -> None:
+        stats = self.node_stats.pop(delivery.destination, None)
+        if stats == None:
+            stats = NodeStats()
+        self.node_stats[delivery.destination] = stats
+
+        # Forget the least recently updated node once we track too many
+        if len(self.node_stats) > MAX_TRACKED_NODES:
+            old_destination, old_stats = self.node_stats.popitem(last=False)
+            metrics.remove_gauge(f"delivery.node.{old_destination}.ratio")
+            metrics.remove_gauge(f"delivery.node.{old_destination}.rtt")
+
+        if result == RESULT_ACK:
+            stats.acks += 1
+            rtt = time.monotonic() - delivery.sent
+            if stats.rtt == None:
+                stats.rtt = rtt
+            else:
+                stats.rtt = stats.rtt * 0.8 + rtt * 0.2
+            metrics.observe(f"delivery.{self.name}.rtt", rtt)
+            metrics.set_gauge(f"delivery.node.{delivery.destination}.rtt", round(stats.rtt, 3))
+        elif result == RESULT_NAK:
+            stats.naks += 1
+        else:
+            stats.timeouts += 1
+
+        metrics.increment(f"delivery.{self.name}.{result}")
+        metrics.set_gauge(f"delivery.node.{delivery.destination}.ratio", round(stats.get_delivery_ratio(), 3))
+
+    '''
+    No ack or nak arrived in time. Must be called with the condition held.
+    '''
+    def on_timeout(self, delivery: Delivery) -> None:
+        if self.pending.pop(delivery.packet_id, None) == None:
+            return  # Already answered
+        metrics.set_gauge(f"delivery.{self.name}.pending", len(self.pending))
+        self.record_result(delivery, RESULT_TIMEOUT)
+        self.schedule_retry(delivery)
+
+    '''
+    Time to retransmit a packet, unless the user has moved on. Must be called with the condition held.
+    Returns the retransmit to perform once the condition is released.
+    '''
+    def on_retry(self, delivery: Delivery) -> tuple:
+        if self.last_activity.get(delivery.destination, 0) > delivery.first_sent:
+            metrics.increment(f"delivery.{self.name}.stale_dropped")
+            return None
+
+        metrics.increment(f"delivery.{self.name}.retransmits")
+        return (delivery.text, delivery.destination, delivery.attempt + 1, delivery.first_sent)
+
+    '''
+    Main loop of the tracker thread. Runs timeouts and retransmits as their deadlines come up.
+    '''
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while self.running and (not self.deadlines or self.deadlines[0][0] > time.monotonic()):
+                    if self.deadlines:
+                        self.condition.wait(self.deadlines[0][0] - time.monotonic())
+                    else:
+                        self.condition.wait()
+                if not self.running:
+                    return
+                when, sequence, action, delivery = heapq.heappop(self.deadlines)
+                retransmit = action(delivery)
+
+            if retransmit:
+                try:
+                    self.resend_func(*retransmit)
+                except Exception as e:
+                    logger.error(f"Unable to retransmit packet to {delivery.destination}: {str(e)}")
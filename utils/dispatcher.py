@@ -0,0 +1,84 @@
+import queue
+import threading
+import time
+from collections import deque
+from utils.config import config
+from utils.log import logger
+from utils.metrics import metrics
+
+'''
+Runs work for user sessions on a fixed-size pool of worker threads.
+
+Every key (normally a user_id) has its own FIFO mailbox. A mailbox is only ever drained by one worker at a time, so work for a single
+session runs strictly in order, while work for different sessions runs in parallel. A slow handler (bcrypt, shell commands, etc)
+therefore only delays its own session. Workers take one item from a mailbox and then put the mailbox at the back of the line, so a
+busy session can't hog a worker.
+
+If a mailbox already holds mailbox_limit items, new work for that key is dropped. This sheds load from nodes which flood the BBS.
+Settings are read from the [dispatcher] stanza in config.toml.
+'''
+
+DISPATCHER_CONFIG = config.get("dispatcher", {})
+
+class Dispatcher():
+    def __init__(self, workers: int, mailbox_limit: int) -> None:
+        self.mailbox_limit = mailbox_limit
+        self.mailboxes = {}             # {key: deque of (func, args, submit_time)}. A key is present while it has work queued or running.
+        self.ready = queue.Queue()      # Keys whose mailbox has work and isn't being drained by a worker
+        self.lock = threading.Lock()
+
+        for i in range(0, workers):
+            thread = threading.Thread(target=self.run, name=f"Dispatcher-{i}", daemon=True)
+            thread.start()
+
+    '''
+    Queue func(*args) to run in order with all other work for this key. Returns False if the work was dropped because the mailbox is full.
+    Work which must never be dropped (timeouts, etc) can be submitted with droppable=False.
+    '''
+    def submit(self, key, func, *args, droppable: bool=True) -> bool:
+        with self.lock:
+            mailbox = self.mailboxes.get(key)
+            idle = mailbox == None
+            if idle:
+                mailbox = deque()
+                self.mailboxes[key] = mailbox
+            elif droppable and len(mailbox) >= self.mailbox_limit:
+                metrics.increment("dispatcher.shed")
+                logger.debug(f"Mailbox for {key} is full. Dropping work.")
+                return False
+
+            mailbox.append((func, args, time.monotonic()))
+            metrics.set_gauge("dispatcher.mailboxes", len(self.mailboxes))
+
+        # Only idle keys need to be put in line. Busy keys are put back in line by the worker draining them.
+        if idle:
+            self.ready.put(key)
+        return True
+
+    '''
+    Worker thread. Runs one item at a time from whichever mailbox is next in line.
+    '''
+    def run(self) -> None:
+        while True:
+            key = self.ready.get()
+            with self.lock:
+                func, args, submit_time = self.mailboxes[key][0]
+
+            metrics.observe("dispatcher.queue_wait", time.monotonic() - submit_time)
+            try:
+                func(*args)
+            except Exception as e:
+                logger.exception(f"Unhandled error while processing work for {key}: {str(e)}")
+
+            with self.lock:
+                mailbox = self.mailboxes[key]
+                mailbox.popleft()
+                if not mailbox:
+                    del self.mailboxes[key]
+                    metrics.set_gauge("dispatcher.mailboxes", len(self.mailboxes))
+                    continue
+
+            self.ready.put(key)
+
+# Global dispatcher shared by all interfaces
+dispatcher = Dispatcher(DISPATCHER_CONFIG.get("workers", 8), DISPATCHER_CONFIG.get("mailbox_limit", 16))
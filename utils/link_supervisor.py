@@ -0,0 +1,167 @@
+import os
+import random
+import select
+import threading
+import time
+from pubsub import pub
+from utils.config import config
+from utils.log import logger
+from utils.metrics import metrics
+
+'''
+Supervises the link between the BBS and a radio.
+
+Anything that notices the link is gone (the Meshtastic connection.lost topic, or the socket watcher) calls report_down(). The first
+report moves the link from "up" to "reconnecting" and starts a single reconnect thread. Every later report is ignored until the link
+is up again, so one outage causes exactly one reconnect. Reconnect attempts back off exponentially with jitter.
+
+While the link is down the interface's SendScheduler is paused, so outbound packets are buffered in its queues and flushed once the
+link is back up.
+
+The socket watcher blocks in poll() until the kernel reports that the peer hung up or the socket errored. It doesn't wake up at all
+while the link is healthy.
+
+Every state change is published on the "mbbs.link.state" pubsub topic with the interface name, the new state and a reason, and is
+recorded in metrics. Settings are read from the [link] stanza in config.toml.
+'''
+
+LINK_CONFIG = config.get("link", {})
+
+LINK_UP = "up"
+LINK_RECONNECTING = "reconnecting"
+LINK_CLOSED = "closed"
+
+# Events which mean the other end of the socket is gone. POLLRDHUP (peer closed its end) is Linux only.
+HANGUP_EVENTS = select.POLLHUP | select.POLLERR | select.POLLNVAL | getattr(select, "POLLRDHUP", 0)
+
+class LinkSupervisor():
+    '''
+    connect_func() must close any old connection and open a new one. It should raise an exception if the connection fails.
+    '''
+    def __init__(self, name: str, connect_func, scheduler: "SendScheduler") -> None:
+        self.name = name
+        self.connect_func = connect_func
+        self.scheduler = scheduler
+        self.backoff = LINK_CONFIG.get("reconnect_backoff", 1)            # Seconds before the second reconnect attempt
+        self.backoff_max = LINK_CONFIG.get("reconnect_backoff_max", 60)   # Longest wait between two attempts
+
+        self.state = LINK_UP
+        self.down_since = None
+        self.lock = threading.RLock()    # Reentrant so mbbs.link.state listeners may call back into the supervisor
+        self.socket = None          # Socket currently being watched
+        self.wake_fd = None         # Write end of a pipe used to stop the socket watcher
+
+        metrics.set_gauge(f"link.{self.name}.up", 1)
+
+    '''
+    Report that the link is down. Only the first report of an outage starts a reconnect.
+    '''
+    def report_down(self, reason: str) -> None:
+        with self.lock:
+            if self.state != LINK_UP:
+                return
+            self.down_since = time.monotonic()
+            self.set_state(LINK_RECONNECTING, reason)
+
+        self.scheduler.pause()
+        thread = threading.Thread(target=self.reconnect, name=f"LinkSupervisor-{self.name}", daemon=True)
+        thread.start()
+
+    '''
+    Try to reconnect until it works, backing off between attempts.
+    '''
+    def reconnect(self) -> None:
+        attempt = 0
+        while True:
+            with self.lock:
+                if self.state == LINK_CLOSED:
+                    return
+
+            try:
+                self.connect_func()
+            except Exception as e:
+                delay = min(self.backoff_max, self.backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                logger.error(f"Unable to reconnect {self.name}: {str(e)}. Retrying in {delay:.1f} seconds.")
+                metrics.increment(f"link.{self.name}.reconnect_failures")
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            with self.lock:
+                if self.state == LINK_CLOSED:
+                    return
+                metrics.observe(f"link.{self.name}.downtime", time.monotonic() - self.down_since)
+                metrics.increment(f"link.{self.name}.reconnects")
+                self.set_state(LINK_UP, f"reconnected after {attempt + 1} attempt(s)")
+
+            self.scheduler.resume()
+            return
+
+    '''
+    Watch a socket for hangups. Replaces the previously watched socket, if any.
+    '''
+    def watch_socket(self, sock) -> None:
+        self.stop_watching()
+        read_fd, write_fd = os.pipe()
+        with self.lock:
+            self.socket = sock
+            self.wake_fd = write_fd
+
+        thread = threading.Thread(target=self.watch, args=(sock, read_fd), name=f"LinkWatcher-{self.name}", daemon=True)
+        thread.start()
+
+    '''
+    Stop watching the current socket.
+    '''
+    def stop_watching(self) -> None:
+        with self.lock:
+            wake_fd = self.wake_fd
+            self.socket = None
+            self.wake_fd = None
+
+        if wake_fd != None:
+            try:
+                os.write(wake_fd, b"\0")
+            except OSError:
+                pass    # Watcher already exited
+            os.close(wake_fd)
+
+    '''
+    Socket watcher thread. Blocks until the socket hangs up or we are told to stop.
+    '''
+    def watch(self, sock, read_fd: int) -> None:
+        try:
+            poller = select.poll()
+            poller.register(sock.fileno(), HANGUP_EVENTS)
+            poller.register(read_fd, select.POLLIN)
+            events = poller.poll()
+        except Exception as e:
+            events = [(-1, 0)]
+            logger.error(f"Unable to watch socket for {self.name}: {str(e)}")
+        finally:
+            os.close(read_fd)
+
+        if any(fd != read_fd for fd, event in events):
+            with self.lock:
+                current = sock is self.socket
+            # Ignore hangups of sockets we have already replaced
+            if current:
+                self.report_down("socket closed")
+
+    '''
+    Stop supervising this link. No more reconnects will be attempted.
+    '''
+    def close(self) -> None:
+        self.stop_watching()
+        with self.lock:
+            self.set_state(LINK_CLOSED, "closed")
+
+    '''
+    Change state, then publish an event and update metrics. Must be called with the lock held.
+    '''
+    def set_state(self, state: str, reason: str) -> None:
+        logger.info(f"Link {self.name} is {state}: {reason}")
+        self.state = state
+        metrics.set_gauge(f"link.{self.name}.up", 1 if state == LINK_UP else 0)
+        metrics.increment(f"link.{self.name}.{state}")
+        pub.sendMessage("mbbs.link.state", name=self.name, state=state, reason=reason)
@@ -0,0 +1,143 @@
+import importlib
+import threading
+from utils.config import config
+from utils.log import logger
+
+'''
+The [[menus]] entries in config.toml, compiled once into a graph of menus and options.
+
+Every option's Context class is imported and resolved when the graph is compiled, and submenus are linked to their menu by name, so
+moving around the menus never imports modules or scans config["menus"]. An option's context is only created when a user selects
+it (see MenuOption.create()), so showing a menu doesn't create any contexts or open any databases. The text of each menu is
+rendered once per role, since that is the only thing which changes which options a user sees.
+
+The graph is compiled when the BBS starts (see mbbs.py), or on first use. Options whose module or class can't be found, and
+submenus which aren't defined, are logged and left out of the graph.
+'''
+
+'''
+One option in a menu. Either a command (a Context class) or a submenu.
+'''
+class MenuOption():
+    __slots__ = ("command", "description", "role", "context_class", "menu_config")
+
+    def __init__(self, command: str, description: str, role: str, context_class: type, menu_config: dict=None) -> None:
+        self.command = command
+        self.description = description
+        self.role = role                    # Lower case role needed to see this option, or None if everyone can see it
+        self.context_class = context_class
+        self.menu_config = menu_config      # The [[menus]] entry, if this option is a submenu
+
+    '''
+    Returns True if a user with the given (lower case) role can see this option
+    '''
+    def allowed(self, role: str) -> bool:
+        return self.role == None or self.role == role
+
+    '''
+    Returns the key (see Context.get_key()) the option's context will have, or None if it doesn't have one. Only submenus have keys.
+    '''
+    def get_key(self) -> tuple:
+        if self.menu_config:
+            return self.context_class.key_for(self.menu_config["name"])
+        return None
+
+    '''
+    Create the option's context for a session. Called when the user selects the option.
+    '''
+    def create(self, session: "UserSession") -> "Context":
+        if self.menu_config:
+            return self.context_class(session, self.menu_config)
+        return self.context_class(session, self.command, self.description)
+
+'''
+A compiled [[menus]] entry.
+'''
+class CompiledMenu():
+    def __init__(self, menu_config: dict) -> None:
+        self.config = menu_config
+        self.name = menu_config["name"]
+        self.description = menu_config["description"]
+        self.command = menu_config["command"]
+        self.options = ()           # Tuple of MenuOption, in config.toml order. Set by MenuGraph.compile().
+        self.rendered = {}          # {role: (menu text, {command: MenuOption})}
+
+    '''
+    Returns the menu text and a {command: MenuOption} lookup for the options a role can see. Built once per role.
+    '''
+    def render(self, role: str) -> tuple:
+        role = (role or "").lower()
+        rendered = self.rendered.get(role)
+        if rendered == None:
+            options = [option for option in self.options if option.allowed(role)]
+            text = "\n".join(option.description for option in options)
+            lookup = {}
+            for option in options:
+                lookup.setdefault(option.command.lower(), option)   # The first option wins if two use the same command
+            rendered = self.rendered.setdefault(role, (text, lookup))
+        return rendered
+
+    '''
+    Returns the menu text for a role
+    '''
+    def get_text(self, role: str) -> str:
+        return self.render(role)[0]
+
+    '''
+    Returns the option a role selected with command, or None
+    '''
+    def find_option(self, role: str, command: str) -> MenuOption:
+        return self.render(role)[1].get(command.lower())
+
+class MenuGraph():
+    def __init__(self, menus_config: list) -> None:
+        self.menus_config = menus_config
+        self.menus = None           # {name: CompiledMenu}
+        self.lock = threading.Lock()
+
+    '''
+    Compile the menus. Only does anything the first time it is called.
+    '''
+    def compile(self) -> None:
+        if self.menus != None:
+            return
+        with self.lock:
+            if self.menus != None:
+                return
+
+            menus = {menu_config["name"]: CompiledMenu(menu_config) for menu_config in self.menus_config}
+            menu_class = importlib.import_module("contexts.menu").Menu
+            for menu in menus.values():
+                options = []
+                for option in menu.config["options"]:
+                    role = option["role"].lower() if "role" in option else None
+
+                    if option["type"] == "command":
+                        try:
+                            option_module = importlib.import_module(f"contexts.{option['module']}")
+                            option_class = getattr(option_module, option["class"])
+                        except (ImportError, AttributeError) as e:
+                            logger.error(f"Unable to load {option['module']}.{option['class']} for menu {menu.name}: {str(e)}")
+                            continue
+                        options.append(MenuOption(option["command"], option["description"], role, option_class))
+
+                    elif option["type"] == "menu":
+                        submenu = menus.get(option["name"])
+                        if not submenu:
+                            logger.error(f"Menu {menu.name} links to menu {option['name']}, which isn't defined")
+                            continue
+                        options.append(MenuOption(submenu.command, submenu.description, role, menu_class, submenu.config))
+
+                menu.options = tuple(options)
+            self.menus = menus
+            logger.debug(f"Compiled {len(menus)} menus")
+
+    '''
+    Returns the compiled menu with the given name, or None
+    '''
+    def get(self, name: str) -> CompiledMenu:
+        self.compile()
+        return self.menus.get(name)
+
+# Global menu graph built from config.toml
+menu_graph = MenuGraph(config["menus"])
@@ -13,54 +13,125 @@ FOOTER
 The header and footer borders are defined in the config.toml file by default but can be overridden.
 They will only appear if there is header or footer text. This message object should be updated by a C
 Context object and then it can be passed to the UserSession.send_message() function to send to a user.
+
+Messages are rendered and measured many times on their way to the user (size checks, paging, sending), so a Message keeps its
+rendered frame (everything above and below the body) along with the encoded sizes of the frame and the body. Changing the header,
+footer or borders throws away the frame, and changing the body throws away the body's size, so rendering and measuring a message
+which hasn't changed is only a string join and an addition.
 '''
 
+MESSAGES_CONFIG = config.get("messages", {})
+DEFAULT_BORDER_TOP = MESSAGES_CONFIG.get("border_top")
+DEFAULT_BORDER_BOTTOM = MESSAGES_CONFIG.get("border_bottom")
+
 class Message():
+    __slots__ = ("_header", "_body", "_footer", "_border_top", "_border_bottom", "_frame", "_body_size")
+
     def __init__(self, header: str=None, body: str=None, footer: str=None, border_top: str=None, border_bottom: str=None):
-        self.header = header
-        self.body = body
-        self.footer = footer
-        self.border_top = border_top
-        self.border_bottom = border_bottom
-
-        if border_top == None:
-            if "border_top" in config["messages"]:
-                self.border_top = config["messages"]["border_top"]
-            else:
-                self.border_top = None
-        if border_bottom == None:
-            if "border_bottom" in config["messages"]:
-                self.border_bottom = config["messages"]["border_bottom"]
-            else:
-                self.border_bottom = None
+        self._header = header
+        self._body = body
+        self._footer = footer
+        self._border_top = DEFAULT_BORDER_TOP if border_top == None else border_top
+        self._border_bottom = DEFAULT_BORDER_BOTTOM if border_bottom == None else border_bottom
+        self._frame = None          # (text above the body, text below the body, size of both in bytes), or None if not built yet
+        self._body_size = None      # Size of the body and its newline in bytes, or None if not measured yet
+
+    @property
+    def header(self) -> str:
+        return self._header
+
+    @header.setter
+    def header(self, value: str) -> None:
+        self._header = value
+        self._frame = None
+
+    @property
+    def body(self) -> str:
+        return self._body
+
+    @body.setter
+    def body(self, value: str) -> None:
+        self._body = value
+        self._body_size = None
+
+    @property
+    def footer(self) -> str:
+        return self._footer
+
+    @footer.setter
+    def footer(self, value: str) -> None:
+        self._footer = value
+        self._frame = None
+
+    @property
+    def border_top(self) -> str:
+        return self._border_top
+
+    @border_top.setter
+    def border_top(self, value: str) -> None:
+        self._border_top = value
+        self._frame = None
+
+    @property
+    def border_bottom(self) -> str:
+        return self._border_bottom
+
+    @border_bottom.setter
+    def border_bottom(self, value: str) -> None:
+        self._border_bottom = value
+        self._frame = None
+
+    '''
+    Return the text above and below the body, and their combined size in bytes. Built once until the header, footer or borders change.
+    '''
+    def get_frame(self) -> tuple:
+        if self._frame == None:
+            top = ""
+            if self._header:
+                top += self._header + "\n"
+                if self._border_top:
+                    top += self._border_top + "\n"
+            bottom = ""
+            if self._border_bottom:
+                bottom += self._border_bottom + "\n"
+            if self._footer:
+                bottom += self._footer + "\n"
+            self._frame = (top, bottom, len(top.encode("utf-8")) + len(bottom.encode("utf-8")))
+        return self._frame
 
     '''
     Return the Message as a text string
     '''
     def get_text(self) -> str:
-        text = ""
-        if self.header:
-            text += self.header + "\n"
-            if self.border_top:
-                text += self.border_top + "\n"
-        if self.body:
-            text += self.body + "\n"
-        if self.border_bottom:
-            text += self.border_bottom + "\n"
-        if self.footer:
-            text += self.footer + "\n"
-        return text
+        top, bottom, frame_size = self.get_frame()
+        if self._body:
+            return top + self._body + "\n" + bottom
+        return top + bottom
 
     '''
-    Return the size of the message as it would be if converted to text.
+    Return the size in bytes (UTF-8) of the message as it would be if converted to text.
     '''
     def get_message_size(self) -> int:
-        return len(self.get_text())
+        if self._body_size == None:
+            self._body_size = len(self._body.encode("utf-8")) + 1 if self._body else 0
+        return self.get_frame()[2] + self._body_size
+
+    '''
+    Return the size in bytes of everything but the body
+    '''
+    def get_frame_size(self) -> int:
+        return self.get_frame()[2]
 
     '''
     Return a copy of this object
     '''
     def copy(self) -> "Message":
-        new_message = Message(self.header, self.body, self.footer, self.border_top, self.border_bottom)
+        new_message = Message.__new__(Message)      # Skip __init__ so borders which were removed stay removed
+        new_message._header = self._header
+        new_message._body = self._body
+        new_message._footer = self._footer
+        new_message._border_top = self._border_top
+        new_message._border_bottom = self._border_bottom
+        new_message._frame = self._frame
+        new_message._body_size = self._body_size
         return new_message
-        
\ No newline at end of file
@@ -0,0 +1,80 @@
+import threading
+
+'''
+Keeps track of runtime metrics for the BBS (queue depths, wait times, packet counts, etc).
+Metrics are just named numbers kept in memory. Any module can import the global metrics object and update it.
+There are three kinds of metrics:
+
+counter - A number that only goes up. Example: packets sent.
+gauge   - A number that is set to its current value. Example: current queue depth.
+timing  - A series of observations, summarized as count/avg/max. Example: seconds a packet waited in a queue.
+'''
+
+class Metrics():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}      # {name: int}
+        self.gauges = {}        # {name: number}
+        self.timings = {}       # {name: [count, total, max]}
+
+    '''
+    Add a value to a counter. Counters start at 0.
+    '''
+    def increment(self, name: str, value: int=1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    '''
+    Set a gauge to its current value.
+    '''
+    def set_gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    '''
+    Remove a gauge which is no longer relevant.
+    '''
+    def remove_gauge(self, name: str) -> None:
+        with self.lock:
+            self.gauges.pop(name, None)
+
+    '''
+    Record a single observation for a timing metric.
+    '''
+    def observe(self, name: str, value: float) -> None:
+        with self.lock:
+            timing = self.timings.get(name)
+            if timing == None:
+                self.timings[name] = [1, value, value]
+                return
+            timing[0] += 1
+            timing[1] += value
+            if value > timing[2]:
+                timing[2] = value
+
+    '''
+    Return a copy of all metrics as a dict.
+    '''
+    def snapshot(self) -> dict:
+        with self.lock:
+            timings = {}
+            for name, (count, total, maximum) in self.timings.items():
+                timings[name] = {"count": count, "avg": total / count, "max": maximum}
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges), "timings": timings}
+
+    '''
+    Return all metrics as a single line of text, sorted by name. Handy for logging.
+    '''
+    def get_text(self) -> str:
+        snapshot = self.snapshot()
+        values = []
+        for name, value in snapshot["counters"].items():
+            values.append(f"{name}={value}")
+        for name, value in snapshot["gauges"].items():
+            values.append(f"{name}={value}")
+        for name, timing in snapshot["timings"].items():
+            values.append(f"{name}=n:{timing['count']}/avg:{timing['avg']:.3f}/max:{timing['max']:.3f}")
+        return " ".join(sorted(values))
+
+# Global object which holds all metrics for this process
+metrics = Metrics()
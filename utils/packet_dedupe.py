@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import OrderedDict
+from utils.config import config
+from utils.metrics import metrics
+
+'''
+Drops duplicate incoming packets.
+
+The same packet can reach the BBS more than once: mesh rebroadcasts, client retries, or two radios hearing the same transmission.
+Every copy would otherwise be handled as new user input, repeating database writes and replies. Packets are identified by their
+sender and packet id. The filter remembers the last max_entries packets seen within the last window seconds, so its memory use is fixed.
+Settings are read from the [dedupe] stanza in config.toml.
+'''
+
+DEDUPE_CONFIG = config.get("dedupe", {})
+
+class DuplicateFilter():
+    def __init__(self, window: int, max_entries: int) -> None:
+        self.window = window
+        self.max_entries = max_entries
+        self.seen = OrderedDict()       # {(from, id): time first seen}, oldest first
+        self.lock = threading.Lock()
+
+    '''
+    Returns True if this packet was already seen. Packets without an id (TCP clients, etc) are never considered duplicates.
+    '''
+    def is_duplicate(self, packet: dict) -> bool:
+        packet_id = packet.get("id")
+        if not packet_id or "from" not in packet:
+            return False
+
+        key = (packet["from"], packet_id)
+        now = time.monotonic()
+        with self.lock:
+            # Forget packets which are too old or don't fit anymore
+            while self.seen:
+                oldest_key, oldest_time = next(iter(self.seen.items()))
+                if now - oldest_time < self.window and len(self.seen) < self.max_entries:
+                    break
+                self.seen.popitem(last=False)
+
+            if key in self.seen:
+                metrics.increment("dedupe.hits")
+                return True
+
+            self.seen[key] = now
+            metrics.increment("dedupe.misses")
+            return False
+
+# Global filter shared by all interfaces, so copies of a packet heard by different radios are caught too
+duplicate_filter = DuplicateFilter(DEDUPE_CONFIG.get("window", 600), DEDUPE_CONFIG.get("max_entries", 4096))
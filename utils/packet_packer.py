@@ -0,0 +1,165 @@
+from meshtastic import mesh_pb2
+
+'''
+Fits text into packets. Meshtastic limits the payload of a packet to DATA_PAYLOAD_LEN bytes of UTF-8, not characters, so every
+size here is measured in encoded bytes. An emoji is 4 bytes and an accented letter is 2, so a text that looks short enough by
+len() can still be too big to send.
+
+pack() splits a long text into pages which each fill a packet as far as they can. Pages end at a line break if there is one in the
+last half of the page, and otherwise at a space, so words aren't cut in half unless a single word is longer than a page. Pages are
+never cut in the middle of a multi-byte character.
+
+Callers give the exact number of bytes left for the text once their own header, borders and footer are counted (see
+body_budget()), so no safety margins are needed.
+
+Each interface has its own limit (CommInterface.max_payload), and get_packer() returns the packer for a limit. A limit of None means
+the interface can take text of any length, in which case everything fits and nothing is ever split.
+'''
+
+PAYLOAD_LEN = mesh_pb2.Constants.DATA_PAYLOAD_LEN
+ELLIPSIS = " ..."
+
+'''
+Returns the size of text in bytes once encoded as UTF-8
+'''
+def byte_len(text: str) -> int:
+    if not text:
+        return 0
+    return len(text.encode("utf-8"))
+
+class PacketPacker():
+    def __init__(self, limit: int) -> None:
+        self.limit = limit      # Most bytes that fit in one packet, or None for no limit
+
+    '''
+    Returns True if text fits in one packet
+    '''
+    def fits(self, text: str) -> bool:
+        return self.limit == None or byte_len(text) <= self.limit
+
+    '''
+    Returns True if a Message fits in one packet
+    '''
+    def fits_message(self, message: "Message") -> bool:
+        return self.limit == None or message.get_message_size() <= self.limit
+
+    '''
+    Returns how many bytes of body text fit in one packet along with a message's header, borders and footer, or None for no limit.
+    '''
+    def body_budget(self, message: "Message") -> int:
+        if self.limit == None:
+            return None
+        return self.limit - message.get_frame_size() - 1     # The body is followed by a newline
+
+    '''
+    Split text into pages of at most budget bytes each, breaking between lines or words where possible. A budget of None means a
+    single page.
+    '''
+    def pack(self, text: str, budget: int) -> list:
+        if budget == None:
+            return [text]
+        if budget < 4:
+            raise ValueError(f"No room for text in a packet (budget {budget} bytes)")   # A character can be up to 4 bytes
+
+        data = text.encode("utf-8")
+        pages = []
+        start = 0
+        while len(data) - start > budget:
+            end = start + budget
+            cut = find_break(data, start, end)
+            if cut > start:
+                pages.append(data[start:cut].decode("utf-8"))
+                start = cut + 1     # Drop the space or newline the page was broken at
+            else:
+                cut = char_boundary(data, end)
+                pages.append(data[start:cut].decode("utf-8"))
+                start = cut
+        if start < len(data) or not pages:
+            pages.append(data[start:].decode("utf-8"))
+        return pages
+
+    '''
+    Pack whole lines into pages of at most budget bytes each. Lines are never split across pages. A line which is too long for a page
+    on its own is shortened with an ellipsis.
+    '''
+    def pack_lines(self, lines: list, budget: int) -> list:
+        pages = []
+        start = 0
+        while start < len(lines):
+            page = self.fill_page(lines, budget, start)
+            pages.append("\n".join(page))
+            start += len(page)
+        return pages
+
+    '''
+    Returns as many lines, from lines[start] on, as fit together on one page of at most budget bytes. A line which is too long for a
+    page on its own is shortened with an ellipsis, so at least one line is returned if there are any left.
+    '''
+    def fill_page(self, lines: list, budget: int, start: int=0) -> list:
+        if budget == None:
+            return lines[start:]
+
+        page = []
+        size = -1                   # Lines are joined with newlines, so the first line doesn't need one
+        for index in range(start, len(lines)):
+            line = lines[index]
+            if byte_len(line) > budget:
+                line = self.truncate(line, budget)
+            size += byte_len(line) + 1
+            if page and size > budget:
+                break
+            page.append(line)
+        return page
+
+    '''
+    Shorten text to at most budget bytes, ending with suffix if anything was cut off. Cuts at a word break where possible. If the
+    budget is too small for the suffix, the text is just cut off at budget bytes.
+    '''
+    def truncate(self, text: str, budget: int, suffix: str=ELLIPSIS) -> str:
+        if budget == None or byte_len(text) <= budget:
+            return text
+
+        data = text.encode("utf-8")
+        if budget < byte_len(suffix):
+            return data[0:char_boundary(data, max(budget, 0))].decode("utf-8")
+
+        end = max(budget - byte_len(suffix), 0)
+        cut = find_break(data, 0, end)
+        if cut <= 0:
+            cut = char_boundary(data, end)
+        return data[0:cut].decode("utf-8").rstrip() + suffix
+
+'''
+Find where to break data between start and end (exclusive). Returns the index of the newline or space to break at, or -1. A
+newline is preferred if there's one in the last half of the page, including one right at end, which would be dropped by the break.
+Otherwise the page breaks at a space, right at end if there is one there.
+'''
+def find_break(data: bytes, start: int, end: int) -> int:
+    newline = data.rfind(b"\n", start + 1, end + 1)
+    if newline > start + (end - start) // 2:
+        return newline
+    if data[end:end + 1] == b" ":
+        return end
+    return max(newline, data.rfind(b" ", start + 1, end))
+
+'''
+Move index back until it's at the start of a UTF-8 character, so a character is never split between pages
+'''
+def char_boundary(data: bytes, index: int) -> int:
+    while index > 0 and index < len(data) and (data[index] & 0xC0) == 0x80:
+        index -= 1
+    return index
+
+packers = {}        # {limit: PacketPacker}
+
+'''
+Returns the shared packer for a payload limit in bytes, or for no limit if limit is None
+'''
+def get_packer(limit: int) -> PacketPacker:
+    packer = packers.get(limit)
+    if packer == None:
+        packer = packers.setdefault(limit, PacketPacker(limit))
+    return packer
+
+# Global packer for Meshtastic packets
+packet_packer = get_packer(PAYLOAD_LEN)
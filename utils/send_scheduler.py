@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+from meshtastic import mesh_pb2
+from utils.config import config
+from utils.log import logger
+from utils.metrics import metrics
+
+'''
+Outbound send scheduler for radio interfaces.
+
+Context handlers often send several messages in a row. Handing them all to the radio at once floods its transmit queue and blocks
+the thread that is handling incoming packets. Instead, interfaces enqueue outbound text here and a single worker thread per radio
+hands packets to the radio at a rate the mesh can actually carry:
+
+- A token bucket limits bytes per second. The rate is derived from the LoRa modem preset's bitrate and the share of the channel
+  the BBS is allowed to use (channel_utilization).
+- Each destination gets its own queue and destinations are served round-robin, so one user paging through a long post can't
+  starve other users.
+- packet_spacing enforces a minimum gap between packets.
+
+Settings are read from the [send_scheduler] stanza in config.toml.
+'''
+
+# Approximate LoRa bitrates (bits per second) of the Meshtastic modem presets.
+LORA_PRESET_BITRATES = {
+    "SHORT_TURBO": 21875,
+    "SHORT_FAST": 10937,
+    "SHORT_SLOW": 6250,
+    "MEDIUM_FAST": 3516,
+    "MEDIUM_SLOW": 1953,
+    "LONG_FAST": 1066,
+    "LONG_MODERATE": 335,
+    "LONG_SLOW": 183,
+    "VERY_LONG_SLOW": 92,
+}
+
+PACKET_OVERHEAD = 32    # Approximate bytes of LoRa and mesh headers sent along with every payload
+
+SCHEDULER_CONFIG = config.get("send_scheduler", {})
+
+class SendScheduler():
+    def __init__(self, name: str) -> None:
+        self.name = name                                                        # Used in log messages and metric names
+        self.modem_preset = SCHEDULER_CONFIG.get("modem_preset", "LONG_FAST")
+        self.channel_utilization = SCHEDULER_CONFIG.get("channel_utilization", 0.5)
+        self.packet_spacing = SCHEDULER_CONFIG.get("packet_spacing", 1.0)      # Minimum seconds between two packets
+        burst_packets = SCHEDULER_CONFIG.get("burst_packets", 2)               # How many full packets may be sent back to back
+
+        if self.modem_preset not in LORA_PRESET_BITRATES:
+            logger.error(f"Unknown modem_preset {self.modem_preset} in config.toml. Using LONG_FAST.")
+            self.modem_preset = "LONG_FAST"
+
+        self.rate = LORA_PRESET_BITRATES[self.modem_preset] / 8 * self.channel_utilization     # Bytes per second
+        self.capacity = burst_packets * (mesh_pb2.Constants.DATA_PAYLOAD_LEN + PACKET_OVERHEAD)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.last_send = 0
+
+        self.queues = {}                # {destination: deque of (text, send_func, enqueue_time)}
+        self.round_robin = deque()      # Destinations with pending packets, in the order they will be served
+        self.queue_depth = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.paused = False             # While paused, packets are buffered but not sent. Used while the radio link is down.
+
+        self.thread = threading.Thread(target=self.run, name=f"SendScheduler-{name}", daemon=True)
+        self.thread.start()
+
+    '''
+    Queue text to be sent to a destination. send_func(text, destination) is called from the scheduler thread when it is this packet's turn.
+    '''
+    def enqueue(self, destination, text: str, send_func) -> None:
+        with self.condition:
+            if destination not in self.queues:
+                self.queues[destination] = deque()
+                self.round_robin.append(destination)
+            self.queues[destination].append((text, send_func, time.monotonic()))
+            self.queue_depth += 1
+            metrics.set_gauge(f"scheduler.{self.name}.queue_depth", self.queue_depth)
+            self.condition.notify()
+
+    '''
+    Number of packets waiting to be sent
+    '''
+    def get_queue_depth(self) -> int:
+        return self.queue_depth
+
+    '''
+    Stop sending. Packets keep queuing up until resume() is called.
+    '''
+    def pause(self) -> None:
+        with self.condition:
+            self.paused = True
+
+    '''
+    Start sending again, beginning with any packets that were buffered while paused.
+    '''
+    def resume(self) -> None:
+        with self.condition:
+            self.paused = False
+            self.condition.notify()
+
+    '''
+    Stop the scheduler thread. Packets still in the queue are discarded.
+    '''
+    def close(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    '''
+    Take the next packet in round-robin order. Must be called with the condition held.
+    '''
+    def next_packet(self) -> tuple:
+        destination = self.round_robin.popleft()
+        queue = self.queues[destination]
+        packet = queue.popleft()
+        if queue:
+            self.round_robin.append(destination)
+        else:
+            del self.queues[destination]
+        self.queue_depth -= 1
+        metrics.set_gauge(f"scheduler.{self.name}.queue_depth", self.queue_depth)
+        return (destination,) + packet
+
+    '''
+    Put a packet back at the front of the queue. Must be called with the condition held.
+    '''
+    def requeue(self, destination, text: str, send_func, enqueue_time: float) -> None:
+        if destination in self.queues:
+            self.round_robin.remove(destination)
+        else:
+            self.queues[destination] = deque()
+        self.round_robin.appendleft(destination)
+        self.queues[destination].appendleft((text, send_func, enqueue_time))
+        self.queue_depth += 1
+        metrics.set_gauge(f"scheduler.{self.name}.queue_depth", self.queue_depth)
+
+    '''
+    Returns how many seconds we must wait before a packet of the given size may be sent.
+    '''
+    def get_delay(self, cost: int) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+        delay = self.packet_spacing - (now - self.last_send)
+        if self.tokens < cost:
+            delay = max(delay, (cost - self.tokens) / self.rate)
+        return max(delay, 0)
+
+    '''
+    Main loop of the scheduler thread
+    '''
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while self.running and (self.paused or not self.round_robin):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                destination, text, send_func, enqueue_time = self.next_packet()
+
+                # A packet larger than the bucket would never get enough tokens, so cap the cost at the bucket size.
+                cost = min(len(text.encode()) + PACKET_OVERHEAD, self.capacity)
+                delay = self.get_delay(cost)
+                while self.running and not self.paused and delay > 0:
+                    self.condition.wait(delay)
+                    delay = self.get_delay(cost)
+                if not self.running:
+                    return
+                # The link went down while we were waiting, so keep the packet until it is back up.
+                if self.paused:
+                    self.requeue(destination, text, send_func, enqueue_time)
+                    continue
+                self.tokens -= cost
+                self.last_send = time.monotonic()
+
+            metrics.observe(f"scheduler.{self.name}.wait_time", self.last_send - enqueue_time)
+            metrics.increment(f"scheduler.{self.name}.packets_sent")
+            metrics.increment(f"scheduler.{self.name}.bytes_sent", cost)
+            try:
+                send_func(text, destination)
+            except Exception as e:
+                logger.error(f"Unable to send packet to {destination}: {str(e)}")
@@ -1,47 +1,236 @@
-#from utils.user_session import UserSession as UserSession
+import json
+import threading
+import time
+from contextlib import contextmanager
+from utils.config import config
+from utils.db import get_database
+from utils.log import logger
+from utils.metrics import metrics
+from utils.timer_wheel import timer_wheel
 
 '''
 Keeps track of user sessions.
-Currently just a dict where each user_id (device id) has a session object in a large dict.
-This could be changed to be an actual database
+Active sessions are kept in a dict where each user_id (device id) has a session object.
+
+Sessions are looked up from many threads (dispatcher workers, radio and TCP threads, the timer wheel). Reads don't take a lock.
+Anything which changes a user's entry takes that user's lock, one of STRIPES locks picked by hashing the user_id, so users on
+different stripes never wait for each other. get_or_create() looks up, resumes or creates a session atomically, so two packets from
+a new node can never create two sessions. Time spent waiting for a contended stripe is reported in the sessions.lock_wait metric.
+
+If hibernate_after is set in the [sessions] stanza of config.toml, sessions are also written to a sqlite database after every packet
+which changes their state, and once more when they are hibernated. A session which has been idle for hibernate_after seconds is
+dropped from memory (hibernated). When the user next sends a packet, the session is loaded back from the database (rehydrated) with
+the same login, context stack and per-context state, as long as the user was last active less than resume_timeout seconds ago.
+Because sessions are on disk, this also works after the BBS restarts or crashes.
 '''
 
+SESSIONS_CONFIG = config.get("sessions", {})
+PURGE_INTERVAL = 3600       # Seconds between purges of sessions which can no longer be resumed
+STRIPES = 64                # Number of locks user_ids are spread over
+
 class SessionDB():
-    def __init__(self):
-        self.user_sessions = {} # {user_id: UserSession}
+    def __init__(self, db_file: str, hibernate_after: int, resume_timeout: int):
+        self.user_sessions = {}                 # {user_id: UserSession}. Only changed while holding the user's stripe lock.
+        self.hibernate_after = hibernate_after  # Seconds of inactivity before a session is hibernated. 0 disables hibernation.
+        self.resume_timeout = resume_timeout    # Seconds after the last activity that a hibernated session can still be resumed
+        self.stripes = [threading.Lock() for i in range(0, STRIPES)]
+        self.database = None
+
+        if self.hibernate_after:
+            self.database = get_database(db_file)     # Shared connections. See utils/db.py.
+            self.database.initialize("sessions", self.initialize_database)
+            self.purge()
+
+    '''
+    Hold the lock for a user_id's stripe. Waiting for a lock which is already held is counted in the metrics.
+    '''
+    @contextmanager
+    def stripe(self, user_id):
+        lock = self.stripes[hash(user_id) % STRIPES]
+        if not lock.acquire(blocking=False):
+            metrics.increment("sessions.lock_contended")
+            start = time.monotonic()
+            lock.acquire()
+            metrics.observe("sessions.lock_wait", time.monotonic() - start)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    '''
+    Create the sessions table if it hasn't yet been created.
+    '''
+    def initialize_database(self) -> None:
+        with self.database.get_connection() as con:
+            con.execute('''
+            CREATE TABLE IF NOT EXISTS sessions(
+                user_id TEXT PRIMARY KEY NOT NULL,
+                state TEXT NOT NULL,
+                last_active REAL NOT NULL
+            );
+            ''')
 
     '''
-    Check if a given user ID already has a session in the list.
+    Check if a given user ID already has a session, either active or hibernated.
     '''
     def check_session(self, user_id: int) -> bool:
         if user_id in self.user_sessions:
             return True
-        return False
+        return self.load_state(user_id) != None
 
     '''
     Add a new session to the list. Tie it to a user_id.
     '''
     def add_session(self, user_id: int, session: "UserSession") -> bool:
-        if self.check_session(user_id):
-            return False
-        self.user_sessions[user_id] = session
+        with self.stripe(user_id):
+            if user_id in self.user_sessions:
+                return False
+            self.insert(user_id, session)
         return True
 
     '''
-    Remove a session from the list based on a given user_id.
+    Remove a session from the list based on a given user_id. A hibernated session is removed as well.
     '''
     def remove_session(self, user_id: int) -> bool:
-        if self.check_session(user_id):
-            del self.user_sessions[user_id]
-            return True
-        return False
+        with self.stripe(user_id):
+            removed = self.user_sessions.pop(user_id, None) != None
+            metrics.set_gauge("sessions.active", len(self.user_sessions))
+            if self.database:
+                with self.database.get_connection() as con:
+                    cursor = con.execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),))
+                removed = removed or cursor.rowcount > 0
+        return removed
 
     '''
-    Get the session object based on a given user_id.
+    Get the active session object based on a given user_id, or None. Doesn't lock.
     '''
     def get_session(self, user_id: int) -> "UserSession":
-        if self.check_session(user_id):
-            return self.user_sessions[user_id]
-        return None
+        return self.user_sessions.get(user_id)
+
+    '''
+    Atomically get the session for a user_id, resume it on the given interface if it is hibernated, or otherwise call create() to make
+    a new one. create() may return None if no session should be created. Returns (session, True if the session was just created).
+    '''
+    def get_or_create(self, user_id: int, interface: "CommInterface", create) -> tuple:
+        session = self.user_sessions.get(user_id)
+        if session:
+            return session, False
+
+        with self.stripe(user_id):
+            # Another thread may have won the race for this user
+            session = self.user_sessions.get(user_id)
+            if session:
+                return session, False
+
+            session = self.resume(user_id, interface)
+            if session:
+                self.user_sessions[user_id] = session
+                metrics.set_gauge("sessions.active", len(self.user_sessions))
+                return session, False
+
+            session = create()
+            if session:
+                self.insert(user_id, session)
+            return session, session != None
+
+    '''
+    Add a session and save it. Must be called with the user's stripe held.
+    '''
+    def insert(self, user_id: int, session: "UserSession") -> None:
+        self.user_sessions[user_id] = session
+        metrics.set_gauge("sessions.active", len(self.user_sessions))
+        self.write_state(session)
+
+    '''
+    Rehydrate a hibernated session on an interface. Returns None if there is no session to resume. Must be called with the user's
+    stripe held.
+    '''
+    def resume(self, user_id: int, interface: "CommInterface") -> "UserSession":
+        state = self.load_state(user_id)
+        if not state:
+            return None
+
+        from utils.user_session import UserSession
+        try:
+            session = UserSession(user_id, interface, None, state=state)
+        except Exception as e:
+            logger.warning(f"Unable to resume session for {user_id}: {str(e)}")
+            with self.database.get_connection() as con:
+                con.execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),))
+            return None
+
+        logger.info(f"Resumed session for {user_id}")
+        return session
+
+    '''
+    Write a session's state to the database. Does nothing if hibernation is disabled or the session has been removed.
+    '''
+    def save_session(self, session: "UserSession") -> None:
+        if not self.database:
+            return
+
+        with self.stripe(session.user_id):
+            if self.user_sessions.get(session.user_id) is session:
+                self.write_state(session)
+
+    '''
+    Write a session's state to the database. Unless force is set, nothing is written if the state is the same as it was when it was
+    last written. Must be called with the user's stripe held.
+    '''
+    def write_state(self, session: "UserSession", force: bool=False) -> None:
+        if not self.database:
+            return
+
+        state = json.dumps(session.get_state())
+        if state == session.saved_state and not force:
+            metrics.increment("sessions.saves_skipped")
+            return
+
+        with self.database.get_connection() as con:
+            con.execute('''
+            INSERT INTO sessions VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, last_active = excluded.last_active
+            ''', (str(session.user_id), state, time.time()))
+        session.saved_state = state
+
+    '''
+    Drop an idle session from memory. Its state is written to the database one last time, which also records when the user was last
+    active, so it can be resumed later.
+    '''
+    def hibernate(self, session: "UserSession") -> None:
+        with self.stripe(session.user_id):
+            if self.user_sessions.get(session.user_id) is session:
+                self.write_state(session, force=True)
+                del self.user_sessions[session.user_id]
+                metrics.set_gauge("sessions.active", len(self.user_sessions))
+        logger.debug(f"Hibernated session for {session.user_id}")
+
+    '''
+    Return the stored state of a session which can still be resumed, or None.
+    '''
+    def load_state(self, user_id: int) -> dict:
+        if not self.database:
+            return None
+
+        with self.database.get_connection() as con:
+            row = con.execute('''
+            SELECT state FROM sessions
+            WHERE user_id = ? AND last_active > ?
+            ''', (str(user_id), time.time() - self.resume_timeout)).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0])
+
+    '''
+    Delete sessions which can no longer be resumed. Runs every PURGE_INTERVAL seconds.
+    '''
+    def purge(self) -> None:
+        with self.database.get_connection() as con:
+            con.execute("DELETE FROM sessions WHERE last_active <= ?", (time.time() - self.resume_timeout,))
+        timer_wheel.schedule(PURGE_INTERVAL, self.purge)
 
-session_db = SessionDB()
\ No newline at end of file
+session_db = SessionDB(
+    f"data/{SESSIONS_CONFIG.get('database', 'sessions.db')}",
+    SESSIONS_CONFIG.get("hibernate_after", 0),
+    SESSIONS_CONFIG.get("resume_timeout", 86400)
+)
@@ -1,5 +1,6 @@
 import sqlite3
 from utils.config import config
+from utils.db import get_database
 from utils.bbs_utils import Topic, Post
 
 '''
@@ -9,13 +10,14 @@ Manages database for BBS functionality
 class TicTacToeMPDB():
     def __init__(self):
         self.db_file = config["contexts"]["tictactoemp"]["database"]
-        self.initialize_database()
+        self.database = get_database(self.db_file)      # Shared connections. See utils/db.py.
+        self.database.initialize("scores", self.initialize_database)
 
     '''
     Create the score table if it hasn't yet been created.
     '''
     def initialize_database(self) -> None:
-        with sqlite3.connect(self.db_file) as con:
+        with self.database.get_connection() as con:
             cursor = con.cursor()
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS scores(
@@ -33,7 +35,7 @@ class TicTacToeMPDB():
     Get user's scores
     '''
     def get_user_scores(self, username: str) -> set:
-        with sqlite3.connect(self.db_file) as con:
+        with self.database.get_connection() as con:
             cursor = con.cursor()
             try:
                 cursor.execute('''
@@ -55,7 +57,7 @@ class TicTacToeMPDB():
     Add user to scores table
     '''
     def add_user(self, username: str) -> bool:
-        with sqlite3.connect(self.db_file) as con:
+        with self.database.get_connection() as con:
             cursor = con.cursor()
             try:
                 cursor.execute('''
@@ -73,7 +75,7 @@ class TicTacToeMPDB():
     Update user's score
     '''
     def update_user_scores(self, username: str, wins: int=None, losses: int=None, draws: int=None) -> bool:
-        with sqlite3.connect(self.db_file) as con:
+        with self.database.get_connection() as con:
             cursor = con.cursor()
             if wins:
                 try:
@@ -0,0 +1,115 @@
+import threading
+import time
+from utils.log import logger
+from utils.metrics import metrics
+
+'''
+A single shared scheduler for timeouts (session timeouts, game and pager timeouts, etc).
+
+Starting a threading.Timer costs an OS thread per pending timeout, plus thread creation every time a timeout is pushed back. The
+timer wheel instead keeps every pending timeout in a ring of slots, one slot per TICK seconds, and a single thread walks the ring
+firing timeouts as their deadlines pass. Scheduling, resetting and cancelling a timeout are O(1) and never create threads.
+
+Timeouts which are further away than one trip around the ring stay in their slot until the ring comes around to them again.
+Callbacks run on the timer thread, so they must be quick. Anything slow (or anything which touches a session) should be handed to
+the dispatcher.
+'''
+
+TICK = 0.5          # Seconds per slot. Timeouts fire up to this late.
+SLOTS = 1024        # Number of slots in the ring
+
+'''
+A pending timeout. Returned by TimerWheel.schedule() and passed back to reset() and cancel().
+'''
+class WheelTimer():
+    def __init__(self, deadline: float, func, args: tuple) -> None:
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+        self.slot = None        # Slot the timer is in, or None if it isn't pending
+
+    '''
+    Returns True once the timer's deadline has passed
+    '''
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+class TimerWheel():
+    def __init__(self, name: str) -> None:
+        self.name = name                                # Used in metric names
+        self.slots = [dict() for i in range(0, SLOTS)]  # Each slot is a {WheelTimer: None} dict, used as an ordered set
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.current_tick = int(time.monotonic() / TICK)
+
+        self.thread = threading.Thread(target=self.run, name=f"TimerWheel-{name}", daemon=True)
+        self.thread.start()
+
+    '''
+    Call func(*args) on the timer thread after delay seconds. Returns a WheelTimer which can be reset or cancelled.
+    '''
+    def schedule(self, delay: float, func, *args) -> WheelTimer:
+        timer = WheelTimer(0, func, args)
+        self.reset(timer, delay)
+        return timer
+
+    '''
+    Push a timer's deadline back to delay seconds from now. Also re-arms a timer which has already fired or was cancelled.
+    '''
+    def reset(self, timer: WheelTimer, delay: float) -> None:
+        deadline = time.monotonic() + max(delay, 0)
+        with self.lock:
+            if timer.slot != None:
+                del self.slots[timer.slot][timer]
+            else:
+                self.pending += 1
+            timer.deadline = deadline
+            timer.slot = int(deadline / TICK) % SLOTS
+            self.slots[timer.slot][timer] = None
+
+    '''
+    Stop a timer from firing. Does nothing if it already fired.
+    '''
+    def cancel(self, timer: WheelTimer) -> None:
+        with self.lock:
+            if timer.slot == None:
+                return
+            del self.slots[timer.slot][timer]
+            timer.slot = None
+            self.pending -= 1
+
+    '''
+    Take every timer from a slot whose deadline has passed. Must be called with the lock held.
+    '''
+    def take_expired(self, slot: int, now: float) -> list:
+        expired = [timer for timer in self.slots[slot] if timer.deadline <= now]
+        for timer in expired:
+            del self.slots[slot][timer]
+            timer.slot = None
+        self.pending -= len(expired)
+        return expired
+
+    '''
+    Timer thread. Walks the ring one slot per tick and fires expired timers.
+    '''
+    def run(self) -> None:
+        while True:
+            time.sleep(max(0, (self.current_tick + 1) * TICK - time.monotonic()))
+            now = time.monotonic()
+
+            # A slot is done once its tick has fully passed. Catch up on every such slot, in case the thread was held up.
+            expired = []
+            with self.lock:
+                while (self.current_tick + 1) * TICK <= now:
+                    expired += self.take_expired(self.current_tick % SLOTS, now)
+                    self.current_tick += 1
+                metrics.set_gauge(f"timers.{self.name}.pending", self.pending)
+
+            for timer in expired:
+                try:
+                    timer.func(*timer.args)
+                except Exception as e:
+                    logger.exception(f"Error in timer callback: {str(e)}")
+
+# Global timer wheel shared by all sessions and contexts
+timer_wheel = TimerWheel("main")
@@ -0,0 +1,228 @@
+import bisect
+import threading
+from utils.bbs_utils import Topic
+from utils.dispatcher import dispatcher
+from utils.log import logger
+from utils.metrics import metrics
+from utils.timer_wheel import timer_wheel
+
+'''
+The list of BBS topics, held in memory once for the whole BBS and shared by every session.
+
+The index is loaded from the database the first time it is needed. After that, BBSDB passes every topic it creates, posts to or
+migrates to update_topic(), which reads the topic's row and moves the topic to its place in the index (the top, for a new post). The
+row is read while holding the index's lock, so when two topics change at once the index always ends up with the newer rows. The
+listing is rendered and split into pages once per page size, and a change only renders the pages from the topic's old or new place
+up to where the pages line up again, so showing a page of topics, or turning to the next one, doesn't touch the database or format
+anything. A session only needs to remember which page it is on.
+
+Changes which touch many topics at once, such as recounting topic stats or migrating old topics, bump the topics_version kept in the
+database (see BBSDB.get_topics_version()). The index checks it every CHECK_INTERVAL seconds and reloads itself when it has changed,
+so changes made by other processes (`python -m tools.bbs_admin recount` and `migrate`) show up without restarting the BBS.
+'''
+
+TOPICS_PER_PAGE = 50        # Most topics on a page. Radio pages fill up long before this; it limits pages for interfaces with no size limit.
+MIN_LINE_LENGTH = 25        # Bytes in the shortest line Topic.get_string() can make, "[1] (01-01-25 12:00)  (0)"
+CHECK_INTERVAL = 10         # Seconds between checks of the database's topics_version
+
+'''
+One page of the topic listing
+'''
+class TopicPage():
+    __slots__ = ("first_index", "topics", "text")
+
+    def __init__(self, first_index: int, topics: tuple, text: str) -> None:
+        self.first_index = first_index      # Position of the page's first topic in the index, counting from 0
+        self.topics = topics                # Tuple of the Topics on the page
+        self.text = text                    # The page's lines, numbered from first_index + 1
+
+class TopicIndex():
+    def __init__(self) -> None:
+        self.lock = threading.RLock()      # Reentrant, since opening the database in load() may recount topics and invalidate()
+        self.topics = None          # List of Topics, newest first, or None if not loaded yet
+        self.keys = None            # (last_modified, uuid) of each topic in self.topics, which is the order they are sorted in
+        self.sort_keys = None       # {uuid: (last_modified, uuid)} for every topic in the index
+        self.version = 0            # Goes up by one every time a topic changes
+        self.pages = {}             # {page size in bytes: (packer, tuple of TopicPage)} for the current version
+        self.db_version = None      # The database's topics_version when the index was loaded
+        self.check_timer = None     # Timer for the next check of the database's topics_version
+
+    '''
+    Load the topics from the database. Must be called with the lock held.
+    '''
+    def load(self) -> None:
+        from utils.bbs_db import BBSDB      # BBSDB updates this index, so it can't be imported at the top
+        bbs_db = BBSDB()
+        self.db_version = bbs_db.get_topics_version()
+        rows = bbs_db.list_topics()
+        self.topics = [Topic.from_row(row) for row in rows]
+        self.keys = [(int(row[2]), row[0]) for row in rows]
+        self.sort_keys = {key[1]: key for key in self.keys}
+        self.version += 1
+        self.pages = {}
+        logger.debug(f"Loaded {len(self.topics)} topics into the topic index")
+
+        if self.check_timer == None:
+            self.check_timer = timer_wheel.schedule(CHECK_INTERVAL, self.queue_check)
+
+    '''
+    Forget the loaded topics, so they are loaded again from the database the next time they are needed
+    '''
+    def invalidate(self) -> None:
+        with self.lock:
+            self.topics = None
+            self.pages = {}
+
+    '''
+    Called by the timer wheel. The check reads the database, so it runs on the dispatcher.
+    '''
+    def queue_check(self) -> None:
+        dispatcher.submit("topic_index", self.check, droppable=False)
+
+    '''
+    Reload the index on its next use if the database's topics_version has changed since it was loaded
+    '''
+    def check(self) -> None:
+        from utils.bbs_db import BBSDB
+        try:
+            db_version = BBSDB().get_topics_version()
+            with self.lock:
+                if self.topics != None and db_version != self.db_version:
+                    logger.debug("Topics were changed in the database. Reloading the topic index.")
+                    self.topics = None
+                    self.pages = {}
+        finally:
+            self.check_timer = timer_wheel.schedule(CHECK_INTERVAL, self.queue_check)
+
+    '''
+    Returns the current version and the listing split into pages which each fit in budget bytes (None for no limit), using packer.
+    '''
+    def get_pages(self, packer: "PacketPacker", budget: int) -> tuple:
+        with self.lock:
+            if self.topics == None:
+                self.load()
+
+            cached = self.pages.get(budget)
+            if cached == None:
+                pages = self.render(packer, budget, [], 0)
+                self.pages[budget] = (packer, pages)
+            else:
+                pages = cached[1]
+            return self.version, pages
+
+    '''
+    Render pages starting at the topic at position start, and add them to pages. If old_pages is given, its pages which start after
+    position reuse_after are still correct, and once a page would start where one of them does, the old pages from there on are used
+    instead. Returns a tuple of all the pages. Must be called with the lock held.
+    '''
+    def render(self, packer: "PacketPacker", budget: int, pages: list, start: int, old_pages: tuple=None, reuse_after: int=None) -> tuple:
+        if old_pages != None:
+            old_index = bisect.bisect_right(old_pages, reuse_after, key=lambda page: page.first_index)
+
+        # Only format as many lines as could possibly fit on a page
+        page_size = TOPICS_PER_PAGE
+        if budget != None:
+            page_size = max(1, min(page_size, (budget + 1) // (MIN_LINE_LENGTH + 1)))
+
+        while start < len(self.topics):
+            if old_pages != None:
+                while old_index < len(old_pages) and old_pages[old_index].first_index < start:
+                    old_index += 1
+                if old_index < len(old_pages) and old_pages[old_index].first_index == start:
+                    pages.extend(old_pages[old_index:])
+                    break
+            lines = [topic.get_string(start + i + 1) for i, topic in enumerate(self.topics[start:start + page_size])]
+            page = packer.fill_page(lines, budget)
+            pages.append(TopicPage(start, tuple(self.topics[start:start + len(page)]), "\n".join(page)))
+            start += len(page)
+        metrics.increment("topic_index.renders")
+        return tuple(pages)
+
+    '''
+    Returns the number of topics
+    '''
+    def get_count(self) -> int:
+        with self.lock:
+            if self.topics == None:
+                self.load()
+            return len(self.topics)
+
+    '''
+    Returns the topic at a position in the index, counting from 0, or None
+    '''
+    def get_topic(self, index: int) -> Topic:
+        with self.lock:
+            if self.topics == None:
+                self.load()
+            if index < 0 or index >= len(self.topics):
+                return None
+            return self.topics[index]
+
+    '''
+    Returns the position of the first topic which sorts after key, a (last_modified, uuid) pair. Topics are sorted newest first.
+    '''
+    def find_position(self, key: tuple) -> int:
+        low = 0
+        high = len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.keys[middle] > key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    '''
+    A topic was created, posted to or migrated. get_row(topic_id) (BBSDB.get_topic) is called to read the topic's row, and the topic
+    is moved to its place in the index with its new stats, or dropped if there is no row. Does nothing if the index hasn't been
+    loaded, since it will be loaded with the change.
+    '''
+    def update_topic(self, topic_id: str, get_row) -> None:
+        with self.lock:
+            if self.topics == None:
+                return
+
+            # Read the row while holding the lock, so rows are applied in the order they were read and the newest one always wins
+            row = get_row(topic_id)
+
+            old_key = self.sort_keys.pop(topic_id, None)
+            old_position = None
+            if old_key != None:
+                old_position = self.find_position(old_key)
+                del self.topics[old_position]
+                del self.keys[old_position]
+
+            new_position = None
+            if row != None:
+                key = (int(row[2]), row[0])
+                new_position = self.find_position(key)
+                self.topics.insert(new_position, Topic.from_row(row))
+                self.keys.insert(new_position, key)
+                self.sort_keys[topic_id] = key
+
+            if old_position == None and new_position == None:
+                return
+            self.version += 1
+
+            # Pages which end before the first changed position are unchanged. The topic just after a page decides where it ends, so
+            # it must be unchanged too. If no topic was added or removed, pages which start after the last changed position are
+            # unchanged as well, since every topic after it kept its place and number.
+            changed = [position for position in (old_position, new_position) if position != None]
+            first_changed = min(changed)
+            last_changed = max(changed)
+            moved = old_position != None and new_position != None
+            for budget, (packer, old_pages) in self.pages.items():
+                pages = []
+                for page in old_pages:
+                    if page.first_index + len(page.topics) >= first_changed:
+                        break
+                    pages.append(page)
+                start = pages[-1].first_index + len(pages[-1].topics) if pages else 0
+                if moved:
+                    pages = self.render(packer, budget, pages, start, old_pages, last_changed)
+                else:
+                    pages = self.render(packer, budget, pages, start)
+                self.pages[budget] = (packer, pages)
+
+# Global topic index shared by all sessions
+topic_index = TopicIndex()
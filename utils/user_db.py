@@ -1,6 +1,7 @@
 import sqlite3
 import bcrypt
 from utils.config import config
+from utils.db import get_database
 
 '''
 Used to interface with SQLite database for tracking users and roles, authentication, etc.
@@ -9,9 +10,19 @@ Used to interface with SQLite database for tracking users and roles, authenticat
 class UserDB():
     def __init__(self):
         self.db_file = f"data/{config["auth"]["database"]}"
-        self.con = sqlite3.connect(self.db_file)
-        self.cursor = self.con.cursor()
-        self.initialize_database()
+        self.database = get_database(self.db_file)
+        self.database.initialize("users", self.initialize_database)
+
+    '''
+    This thread's connection and cursor for the database. Connections are shared and managed by utils/db.py.
+    '''
+    @property
+    def con(self) -> sqlite3.Connection:
+        return self.database.get_connection()
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        return self.database.get_cursor()
 
     '''
     Create the user table if it hasn't yet been created.
@@ -22,10 +33,16 @@ class UserDB():
             id INTEGER PRIMARY KEY AUTOINCREMENT, 
             username TEXT NOT NULL, 
             password CHAR(60) NOT NULL, 
-            role TEXT NOT NULL
+            role TEXT NOT NULL,
+            burst INTEGER NOT NULL DEFAULT 0
         );
         ''')
 
+        # Databases created before user preferences existed need the preference columns added
+        columns = [column[1] for column in self.cursor.execute("PRAGMA table_info(users)").fetchall()]
+        if "burst" not in columns:
+            self.cursor.execute("ALTER TABLE users ADD COLUMN burst INTEGER NOT NULL DEFAULT 0")
+
         self.con.commit()
 
     '''
@@ -63,9 +80,9 @@ class UserDB():
         hashed_password = self.get_hashed_password(password_bytes)
 
         self.cursor.execute('''
-        INSERT INTO users
+        INSERT INTO users (username, password, role)
         VALUES
-        (null, ?,?,"user")
+        (?,?,"user")
         ''', (username_lower, hashed_password))
 
         self.con.commit()
@@ -117,6 +134,32 @@ class UserDB():
             return None
         return user_role
 
+    '''
+    Returns True if the user has burst mode turned on. See MessagePager.
+    '''
+    def get_burst_mode(self, username: str) -> bool:
+        try:
+            self.cursor.execute('''
+            SELECT burst FROM users
+            WHERE username = ?
+            ''', (username.lower(),))
+
+            burst_record = self.cursor.fetchone()
+        except Exception as e:
+            return False
+        return bool(burst_record and burst_record[0])
+
+    '''
+    Turns burst mode on or off for a user.
+    '''
+    def set_burst_mode(self, username: str, burst: bool) -> None:
+        self.cursor.execute('''
+        UPDATE users SET burst = ?
+        WHERE username = ?
+        ''', (int(burst), username.lower()))
+
+        self.con.commit()
+
     def get_hashed_password(self, password: bytes) -> bytes:
         return bcrypt.hashpw(password, bcrypt.gensalt())
 
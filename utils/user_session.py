@@ -1,12 +1,15 @@
 from contexts.context import Context
 from contexts.menu import Menu
 from utils.session_db import session_db
+from utils.dispatcher import dispatcher
+from utils.timer_wheel import timer_wheel
 from utils.config import config
+from utils.metrics import metrics
 from utils.user_db import UserDB
 from utils.message import Message
 from contexts.message_pager import MessagePager
-from meshtastic import mesh_pb2
-from threading import Timer
+import importlib
+import sys
 
 '''
 This class is the main class for each user once they are logged in.
@@ -15,26 +18,37 @@ This can be a menu, program, etc. Review contexts/context.py for details or revi
 possible implementations (cmd_echo.py, cmd_sysinfo.py, etc)
 '''
 
+MAX_HISTORY = max(config["sessions"].get("max_history", 16), 2)     # Most contexts kept in context_history, including the root
+
 class UserSession():
     '''
     __init__() is called only when the session is created.
-    Sets up default param values and sets the default context
+    Sets up default param values and sets the default context. If state is given, the session is instead resumed from a state
+    returned by get_state() (see SessionDB).
     '''
-    def __init__(self, user_id: int, interface: "CommInterface", packet: dict):
+    def __init__(self, user_id: int, interface: "CommInterface", packet: dict, state: dict=None):
         self.user_id = user_id
         self.username = ""
+        self.role = ""
+        self.burst = False              # Send every page of a long message at once. A user preference, see set_burst().
         self.interface = interface      # Hardware interface object. Could be a mesh interface on the backend or TCP, or anything really.
         self.authenticated = False      # Authentication flag for this session.
         self.current_context = None     # Instance of a Context object that is currently handling user input and sending messages to the user.
         self.context_history = []       # List containing all previous context objects in order. revert_context() will delete items from the end of the list.
         self.user_db = UserDB()         # Object to interact with the user database for authentication purposes.
-        
-        self.timeout_seconds = config["sessions"]["timeout"] # How many seconds until the session times out from inactivity
-        self.session_timer = Timer(self.timeout_seconds, self.timeout)    # Timer object to destroy session if timeout occurs
-        self.session_timer.start()
+        self.packer = interface.get_packer()    # Fits outgoing text into the interface's packets. See utils/packet_packer.py.
+        self.redisplay = False          # Set when a resumed session couldn't restore its newest contexts. See restore_state().
+        self.saved_state = None         # JSON of the state last written by SessionDB, so unchanged states aren't written again.
+
+        if state:
+            self.restore_state(state)
+        else:
+            bbs_menu_context = Menu(self, config["menus"][0])   # Set the default context to the first menu defined in config.toml.
+            self.change_context(bbs_menu_context)               # Change to the default context
 
-        bbs_menu_context = Menu(self, config["menus"][0])   # Set the default context to the first menu defined in config.toml.
-        self.change_context(bbs_menu_context)               # Change to the default context
+        # How many seconds until the session times out (or is hibernated) from inactivity
+        self.timeout_seconds = session_db.hibernate_after or config["sessions"]["timeout"]
+        self.session_timer = timer_wheel.schedule(self.timeout_seconds, self.queue_timeout)    # Destroys the session if timeout occurs
 
     '''
     send_message() can be used to send a message to the user who owns this session.
@@ -42,51 +56,38 @@ class UserSession():
     '''
     def send_message(self, message: Message) -> None:
         # Check if message size is too big to fit in a mesh packet
-        if message.get_message_size() > mesh_pb2.Constants.DATA_PAYLOAD_LEN:
+        if not self.packer.fits_message(message):
             # If so, use MessagePager() context to paginate the output and let the user view it in chunks.
             message.footer = None
             bbs_message_pager = MessagePager(self, message)
             self.change_context(bbs_message_pager)
         else:
             # If not, just send the message as is.
-            text = message.get_text()
-            self.send_text_part(text)
+            self.send_text_part(message.get_text())
 
     '''
-    send_one_page() will send only one page worth of text from a message, even if the message is too long to fit in a page
+    send_one_page() will send only one page worth of text from a message, even if the message is too long to fit in a page.
+    The body is cut short to fit, and ends with "..." if anything was left out.
     '''
     def send_one_page(self, message: Message) -> None:
+        if self.packer.fits_message(message):
+            self.send_text(message.get_text())
+            return
         new_message = message.copy()
-
-        # Check if message size is too big to fit in a mesh packet
-        message_size = message.get_message_size()
-
-        # Not sure why, but I have to make packets less than the DATA_PAYLOAD_LEN in order for them to send properly. So I subtract 10.
-        if message_size > (mesh_pb2.Constants.DATA_PAYLOAD_LEN - 10):
-            #size_delta = message_size - (mesh_pb2.Constants.DATA_PAYLOAD_LEN + 4 + 10)
-            #size_delta = size_delta * -1
-            new_message.body = ""
-            chunk_size = 0
-            ellipses_size = 4
-            chunk_size = (mesh_pb2.Constants.DATA_PAYLOAD_LEN - ellipses_size - 10)
-            chunk_size = chunk_size - new_message.get_message_size() - 1
-            new_message.body = message.body[0:chunk_size]
-            new_message.body += " ..."
-
-        text = new_message.get_text()
-        self.send_text(text)
+        new_message.body = self.packer.truncate(message.body, self.packer.body_budget(message))
+        self.send_text(new_message.get_text())
 
     '''
     send_text() can be used to send a message to the user based on a basic text string.
     Primarily used by self.send_message() but could be used directly by other Context objects.
-    It will use MessagePager() to paginate output if the output is too long to fit in a mesh packet.
+    Raises ValueError if the text is too long to fit in a mesh packet. Use send_message() to paginate long text.
     '''
     def send_text(self, text: str) -> None:
         if not text:
             return
 
-        if len(text) > mesh_pb2.Constants.DATA_PAYLOAD_LEN:
-            raise(ValueError(f"Message too long. Must be shorter than mesh_pb2.Constants.DATA_PAYLOAD_LEN ({mesh_pb2.Constants.DATA_PAYLOAD_LEN})."))
+        if not self.packer.fits(text):
+            raise(ValueError(f"Message too long. Must be at most {self.packer.limit} bytes."))
         else:
             self.send_text_part(text)
 
@@ -103,12 +104,18 @@ class UserSession():
     '''
     def receive_message(self, packet: dict) -> None:
         # Reset session timer
-        self.session_timer.cancel()
-        self.session_timer = Timer(self.timeout_seconds, self.timeout) 
-        self.session_timer.start()
+        timer_wheel.reset(self.session_timer, self.timeout_seconds)
+
+        # A resumed session whose newest contexts couldn't be restored shows the user where they are now instead of acting on input
+        # meant for a screen they no longer see.
+        if self.redisplay:
+            self.redisplay = False
+            self.current_context.start()
+        else:
+            # Handle user input
+            self.current_context.receive_handler(packet)
 
-        # Handle user input
-        self.current_context.receive_handler(packet)
+        session_db.save_session(self)
 
     '''
     is_ack() check sif the incoming packet is an "ack" message from Meshtastic.
@@ -122,22 +129,111 @@ class UserSession():
     '''
     change_context() changes the session context to a new context object.
     It also adds the current context to context history before changing the context so the context can be reverted later if needed.
+    If a context with the same key (see Context.get_key()) is already on the stack, the session goes back to that context instead
+    (see return_to_context()), and new_context is released without being used. Callers which can work out the key before building
+    a context should try return_to_context() first, so the context is only built when it is needed.
     '''
     def change_context(self, new_context: Context) -> None:
+        key = new_context.get_key()
+        if key != None and self.return_to_context(key):
+            self.release_contexts([new_context])
+            return
+
         self.context_history.append(self.current_context)
         self.current_context = new_context
+        self.trim_history()
         self.current_context.start()
+        self.observe_history()
+
+    '''
+    find_context() returns the context with the given key (see Context.get_key()) if it is the current context or in the history
+    above the root context, or None.
+    '''
+    def find_context(self, key: tuple) -> Context:
+        if self.current_context and self.current_context.get_key() == key:
+            return self.current_context
+        for index in range(len(self.context_history) - 1, 0, -1):
+            if self.context_history[index].get_key() == key:
+                return self.context_history[index]
+        return None
+
+    '''
+    return_to_context() goes back to the context with the given key if it is on the stack (see find_context()), releasing the
+    contexts above it, and starts it again. Returns False if there is no such context.
+    '''
+    def return_to_context(self, key: tuple) -> bool:
+        context = self.find_context(key)
+        if context == None:
+            return False
+        if context is not self.current_context:
+            index = self.context_history.index(context)
+            unwound = self.context_history[index + 1:] + [self.current_context]
+            del self.context_history[index:]
+            self.current_context = context
+            self.release_contexts(unwound)
+        self.current_context.start()
+        self.observe_history()
+        return True
 
     '''
     revert_context reverts the session context to a previous context from the self.context_history list.
     The optional 'level' argument can be used to skip back multiple levels in the history.
-    Context objects at the end of the history list are removed from the list after a revert.
+    The context reverted to is started again, unless restart is False.
+    Context objects at the end of the history list are removed from the list after a revert, and released.
     '''
-    def revert_context(self, levels: int =1) -> None:
+    def revert_context(self, levels: int =1, restart: bool=True) -> None:
+        reverted = self.context_history[len(self.context_history) - levels + 1:] + [self.current_context]
         self.current_context = self.context_history[0 - levels]
         for i in range(0, levels):
             del self.context_history[-1]
-        self.current_context.start()
+        self.release_contexts(reverted)
+        if restart:
+            self.current_context.start()
+        self.observe_history()
+
+    '''
+    trim_history() drops the oldest contexts once there are more than MAX_HISTORY. The root context (the first menu) is always kept
+    so the user can always get back to it.
+    '''
+    def trim_history(self) -> None:
+        while len(self.context_history) > MAX_HISTORY:
+            self.context_history.pop(2).release()
+
+    '''
+    release_contexts() releases contexts which have been removed from the stack. A context which is still on the stack is left alone.
+    '''
+    def release_contexts(self, contexts: list) -> None:
+        for context in contexts:
+            if context and context is not self.current_context and context not in self.context_history:
+                context.release()
+
+    '''
+    observe_history() records the size of the session and the depth of its history in the metrics. It walks every context, so it is
+    only called when the history changes rather than for every packet.
+    '''
+    def observe_history(self) -> None:
+        metrics.observe("sessions.memory", self.get_memory_size())
+        metrics.observe("sessions.history", len(self.context_history))
+
+    '''
+    get_memory_size() returns roughly how many bytes this session and its contexts are using. Each context's attributes are counted,
+    along with the items of any lists and the attributes of any objects (such as Messages) it holds.
+    '''
+    def get_memory_size(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__) + sys.getsizeof(self.context_history)
+        for context in self.context_history + [self.current_context]:
+            if not context:
+                continue
+            size += sys.getsizeof(context) + sys.getsizeof(context.__dict__)
+            for value in context.__dict__.values():
+                size += sys.getsizeof(value)
+                if isinstance(value, (list, tuple)):
+                    size += sum(sys.getsizeof(item) for item in value)
+                elif isinstance(value, Message):
+                    size += sum(sys.getsizeof(getattr(value, slot)) for slot in Message.__slots__)
+                elif hasattr(value, "__dict__") and not isinstance(value, (type, UserSession)):
+                    size += sum(sys.getsizeof(item) for item in vars(value).values())
+        return size
 
     '''
     set_authenticated() sets the session to an authenticated session.
@@ -147,17 +243,94 @@ class UserSession():
         self.authenticated = True
         self.username = username
         self.role = self.user_db.get_user_role(username)
+        self.burst = self.user_db.get_burst_mode(username)
+
+    '''
+    set_burst() turns burst mode on or off for the logged in user and saves it as their preference.
+    In burst mode, MessagePager sends every page of a long message straight away instead of waiting for the user to ask for each one.
+    '''
+    def set_burst(self, burst: bool) -> None:
+        self.burst = burst
+        self.user_db.set_burst_mode(self.username, burst)
 
     '''
     destroy() destroys this session by removing it from the global list of sessions. This is good for when a user logs out, etc.
     '''
     def destroy(self) -> None:
+        timer_wheel.cancel(self.session_timer)
         session_db.remove_session(self.user_id)
 
+    '''
+    queue_timeout() is called by the timer wheel. The timeout is queued on the dispatcher so it runs in order with this user's packets.
+    '''
+    def queue_timeout(self) -> None:
+        dispatcher.submit(self.user_id, self.timeout, droppable=False)
+
     '''
     timeout() sends a timeout message to the user and then destroys the session
     '''
     def timeout(self) -> None:
+        # A packet may have reset the timer while this timeout was waiting in the mailbox
+        if not self.session_timer.expired():
+            return
+
+        # If hibernation is enabled, idle sessions are moved out of memory instead of being destroyed
+        if session_db.hibernate_after:
+            session_db.hibernate(self)
+            return
+
         message = Message(header="Error", body = "Session timeout!")
         self.send_message(message)
-        self.destroy()
\ No newline at end of file
+        self.destroy()
+
+    '''
+    get_state() returns everything needed to resume this session later as a dict which can be stored as JSON: the login, and the
+    context stack with each context's own state (see Context.get_state()). The stack is cut off below the first context which can't
+    be resumed.
+    '''
+    def get_state(self) -> dict:
+        contexts = []
+        truncated = False
+        for context in self.context_history[1:] + [self.current_context]:
+            context_state = context.get_state()
+            if context_state == None:
+                truncated = True
+                break
+            contexts.append({
+                "module": type(context).__module__,
+                "class": type(context).__name__,
+                "command": context.command,
+                "description": context.description,
+                "state": context_state
+            })
+
+        return {
+            "username": self.username,
+            "role": self.role,
+            "authenticated": self.authenticated,
+            "burst": self.burst,
+            "contexts": contexts,
+            "truncated": truncated
+        }
+
+    '''
+    restore_state() rebuilds the session from a dict returned by get_state(). Nothing is sent to the user.
+    '''
+    def restore_state(self, state: dict) -> None:
+        self.username = state["username"]
+        self.role = state["role"]
+        self.authenticated = state["authenticated"]
+        self.burst = state.get("burst", False)
+
+        contexts = []
+        for entry in state["contexts"]:
+            context_module = importlib.import_module(entry["module"])
+            context_class = getattr(context_module, entry["class"])
+            contexts.append(context_class.from_state(self, entry["command"], entry["description"], entry["state"]))
+        if not contexts:
+            raise ValueError("No contexts to resume")
+
+        self.context_history = [None] + contexts[:-1]
+        self.current_context = contexts[-1]
+        self.trim_history()
+        self.redisplay = state["truncated"]